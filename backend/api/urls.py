@@ -6,6 +6,6 @@ urlpatterns = [
     # path('comment/', include('comment.urls')),  # Removed comment endpoints
     path('film/', include('film.urls')),
     path('video/', include('video.urls')),
-    # path('search/', include('search.urls')),  # Temporarily disabled
+    path('search/', include('search.urls')),
     path("token/", TokenObtainPairView.as_view(), name="token_obtain_pair"),  # Keep token endpoint for admin
 ]
\ No newline at end of file
@@ -0,0 +1,167 @@
+"""
+In-process LRU cache for HLS file lookups.
+
+Popular titles have thousands of viewers fetching the same index.m3u8 and
+the first few segments, and every request used to resolve the path, stat and
+open the file. This cache keeps, per request path:
+  - the resolved path and (size, mtime, etag) of every file it has seen,
+  - the bytes of small files (playlists, init segments), bounded in total size.
+
+An entry is trusted for REVALIDATE_SECONDS, after that a single os.stat checks
+the mtime and the entry is reloaded if the file changed. Each worker process
+has its own cache, configured with the HLS_FILE_CACHE setting.
+"""
+import os
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+from django.conf import settings
+
+DEFAULT_OPTIONS = {
+    'MAX_ENTRIES': 10000,              # stat entries (segments + small files)
+    'MAX_BYTES': 64 * 1024 * 1024,     # total bytes of cached file content
+    'MAX_FILE_SIZE': 256 * 1024,       # only files up to this size keep their content
+    'REVALIDATE_SECONDS': 2,           # how long an entry is used without a stat
+}
+
+HLSFile = namedtuple('HLSFile', ['path', 'size', 'mtime', 'etag', 'content'])
+
+
+def make_etag(stat):
+    """Strong ETag from size and modification time, like nginx does"""
+    return f'"{stat.st_size:x}-{stat.st_mtime_ns:x}"'
+
+
+class HLSFileCache:
+    """Thread-safe LRU of HLSFile entries keyed by request path"""
+
+    def __init__(self, max_entries, max_bytes, max_file_size, revalidate_seconds):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.max_file_size = max_file_size
+        self.revalidate_seconds = revalidate_seconds
+        self._entries = OrderedDict()  # key -> (HLSFile, mtime_ns, checked_at)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, resolve_path):
+        """
+        Return the HLSFile for `key`, or None if the file does not exist.
+
+        `resolve_path(key)` maps the key to a filesystem path (or None) and is
+        only called on a miss.
+        """
+        now = time.monotonic()
+        with self._lock:
+            cached = self._entries.get(key)
+            if cached and now - cached[2] < self.revalidate_seconds:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return cached[0]
+
+        if cached:
+            # Past the revalidation window: one stat tells if the file changed
+            try:
+                stat = os.stat(cached[0].path)
+            except OSError:
+                self.invalidate(key)
+                return None
+            if stat.st_mtime_ns == cached[1] and stat.st_size == cached[0].size:
+                with self._lock:
+                    if key in self._entries:
+                        self._entries[key] = (cached[0], cached[1], now)
+                        self._entries.move_to_end(key)
+                    self.hits += 1
+                return cached[0]
+            path = cached[0].path
+        else:
+            path = resolve_path(key)
+
+        entry = self._load(path)
+        if entry is None:
+            self.invalidate(key)
+            return None
+        with self._lock:
+            self.misses += 1
+            self._store(key, entry, now)
+        return entry[0]
+
+    def _load(self, path):
+        if not path:
+            return None
+        try:
+            stat = os.stat(path)
+            if not os.path.isfile(path):
+                return None
+            content = None
+            if stat.st_size <= self.max_file_size:
+                with open(path, 'rb') as f:
+                    content = f.read()
+                if len(content) != stat.st_size:
+                    # Written while we were reading, keep the stat only
+                    content = None
+        except OSError:
+            return None
+        hls_file = HLSFile(path, stat.st_size, int(stat.st_mtime), make_etag(stat), content)
+        return hls_file, stat.st_mtime_ns
+
+    def _store(self, key, entry, now):
+        old = self._entries.pop(key, None)
+        if old and old[0].content is not None:
+            self._bytes -= len(old[0].content)
+        hls_file, mtime_ns = entry
+        if hls_file.content is not None:
+            self._bytes += len(hls_file.content)
+        self._entries[key] = (hls_file, mtime_ns, now)
+        self._evict()
+
+    def _evict(self):
+        while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+            _, (hls_file, _, _) = self._entries.popitem(last=False)
+            if hls_file.content is not None:
+                self._bytes -= len(hls_file.content)
+
+    def invalidate(self, key=None):
+        """Drop one entry, or everything when no key is given"""
+        with self._lock:
+            if key is None:
+                self._entries.clear()
+                self._bytes = 0
+                return
+            old = self._entries.pop(key, None)
+            if old and old[0].content is not None:
+                self._bytes -= len(old[0].content)
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': round(self.hits / total, 4) if total else 0.0,
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+            }
+
+
+_file_cache = None
+_file_cache_lock = threading.Lock()
+
+
+def get_file_cache():
+    """The HLSFileCache of this process, built from settings.HLS_FILE_CACHE on first use"""
+    global _file_cache
+    if _file_cache is None:
+        with _file_cache_lock:
+            if _file_cache is None:
+                options = dict(DEFAULT_OPTIONS, **getattr(settings, 'HLS_FILE_CACHE', {}))
+                _file_cache = HLSFileCache(
+                    max_entries=options['MAX_ENTRIES'],
+                    max_bytes=options['MAX_BYTES'],
+                    max_file_size=options['MAX_FILE_SIZE'],
+                    revalidate_seconds=options['REVALIDATE_SECONDS'],
+                )
+    return _file_cache
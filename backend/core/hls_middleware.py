@@ -1,82 +1,262 @@
 """
 Custom middleware for serving HLS video files with proper headers
+
+Files are streamed from disk instead of being read into memory: full files go
+through FileResponse (which lets the WSGI server use os.sendfile through
+`wsgi.file_wrapper`), byte ranges are read in fixed-size chunks. Memory per
+viewer is therefore constant no matter how large the segment is.
+
+Segments written by video.utils.generate_hls never change (a new transcode
+writes into a new folder, see hls_output_dir), so they are served as
+immutable with strong ETags; playlists get a short TTL. Both answer
+If-None-Match / If-Modified-Since with 304 and honour If-Range. The
+Cache-Control policy is configurable per path with HLS_CACHE_POLICIES.
+
+Path resolution, stat results and the bytes of small files (playlists) come
+from the per-process LRU in core.hls_cache, so hot files cost no syscalls.
+
+With HLS_SENDFILE_MODE set to 'x-accel' (nginx) or 'x-sendfile' (Apache,
+lighttpd) Django only answers with a redirect header and the fronting web
+server sends the bytes itself, including Range handling.
 """
 import os
-from django.http import HttpResponse, Http404
+import uuid
+from fnmatch import fnmatch
+from django.http import HttpResponse, FileResponse, StreamingHttpResponse, Http404
 from django.conf import settings
+from django.utils.cache import get_conditional_response
 from django.utils.deprecation import MiddlewareMixin
+from django.utils.http import http_date, parse_http_date_safe
+from core.hls_cache import get_file_cache
+
+HLS_CONTENT_TYPES = {
+    '.m3u8': 'application/vnd.apple.mpegurl',
+    '.ts': 'video/mp2t',
+    # Seek preview track and sprite sheets, loaded cross-origin by the players too
+    '.vtt': 'text/vtt',
+    '.jpg': 'image/jpeg',
+}
+
+STREAM_CHUNK_SIZE = 64 * 1024
+MAX_RANGES = 16  # more ranges than this is not a player, the range header is ignored
+
+
+# Used when HLS_CACHE_POLICIES is not set, first matching pattern wins
+DEFAULT_CACHE_POLICIES = [
+    ('videos/*.ts', 'public, max-age=31536000, immutable'),
+    ('videos/*.m3u8', 'public, max-age=10'),
+    ('videos/*/thumbnails/*', 'public, max-age=86400'),
+]
+FALLBACK_CACHE_CONTROL = 'no-cache'
+
+
+def cache_control_for(request_path):
+    """Cache-Control of the first HLS_CACHE_POLICIES pattern matching the path under /media/"""
+    relative_path = request_path[len('/media/'):]
+    for pattern, cache_control in getattr(settings, 'HLS_CACHE_POLICIES', DEFAULT_CACHE_POLICIES):
+        if fnmatch(relative_path, pattern):
+            return cache_control
+    return FALLBACK_CACHE_CONTROL
+
+
+def if_range_matches(request, etag, last_modified):
+    """False when an If-Range validator no longer matches, the full file must be sent"""
+    if_range = request.META.get('HTTP_IF_RANGE')
+    if not if_range:
+        return True
+    if if_range.startswith('"') or if_range.startswith('W/'):
+        # Only strong validators can be used with If-Range
+        return if_range == etag
+    return parse_http_date_safe(if_range) == last_modified
+
+
+def parse_range_header(range_header, size):
+    """
+    Parse a `Range: bytes=...` header into a list of (start, end) tuples (inclusive).
+
+    Returns None when the header is missing, malformed or asks for too many
+    ranges (the whole file is served), and [] when no range can be satisfied
+    (416). Suffix ranges (`bytes=-500`) and open ranges (`bytes=100-`) are supported.
+    """
+    if not range_header or not range_header.startswith('bytes='):
+        return None
+    specs = [spec.strip() for spec in range_header[6:].split(',') if spec.strip()]
+    if not specs or len(specs) > MAX_RANGES:
+        return None
+
+    ranges = []
+    for spec in specs:
+        if '-' not in spec:
+            return None
+        start_str, end_str = spec.split('-', 1)
+        try:
+            if start_str:
+                start = int(start_str)
+                end = int(end_str) if end_str else size - 1
+            else:
+                # Suffix range: the last N bytes
+                suffix = int(end_str)
+                if suffix == 0:
+                    continue
+                start = max(size - suffix, 0)
+                end = size - 1
+        except ValueError:
+            return None
+        if start >= size:
+            continue
+        if end < start:
+            return None
+        ranges.append((start, min(end, size - 1)))
+    return ranges
+
+
+def read_file_range(path, start, end, chunk_size=STREAM_CHUNK_SIZE):
+    """Yield the bytes start..end (inclusive) of a file in chunks"""
+    with open(path, 'rb') as f:
+        f.seek(start)
+        remaining = end - start + 1
+        while remaining > 0:
+            chunk = f.read(min(chunk_size, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+
+def _multipart_parts(ranges, size, content_type, boundary):
+    """Part headers of a multipart/byteranges body, in order"""
+    return [
+        (
+            f'--{boundary}\r\n'
+            f'Content-Type: {content_type}\r\n'
+            f'Content-Range: bytes {start}-{end}/{size}\r\n\r\n'
+        ).encode()
+        for start, end in ranges
+    ]
+
+
+def stream_multipart_ranges(read_range, ranges, size, content_type, boundary):
+    """Yield a multipart/byteranges body for several ranges of one file"""
+    for (start, end), part_header in zip(ranges, _multipart_parts(ranges, size, content_type, boundary)):
+        yield part_header
+        yield from read_range(start, end)
+        yield b'\r\n'
+    yield f'--{boundary}--\r\n'.encode()
+
+
+def resolve_media_path(request_path):
+    """Map /media/<path> to a file under MEDIA_ROOT, refusing paths that escape it"""
+    media_root = os.path.realpath(settings.MEDIA_ROOT)
+    full_path = os.path.realpath(os.path.join(media_root, request_path[len('/media/'):]))
+    if os.path.commonpath([media_root, full_path]) != media_root:
+        return None
+    return full_path
 
 
 class HLSMiddleware(MiddlewareMixin):
     """
-    Middleware to serve HLS files with proper headers to avoid caching issues
+    Middleware to serve HLS files with range, validator and caching headers
     """
-    
+
     def process_request(self, request):
         """
         Intercept requests for HLS files and serve them with proper headers
         """
         # Only handle HLS files
-        if not request.path.startswith('/media/videos/') or not (
-            request.path.endswith('.m3u8') or request.path.endswith('.ts')
+        if not request.path.startswith('/media/videos/') or (
+            os.path.splitext(request.path)[1] not in HLS_CONTENT_TYPES
         ):
             return None
-            
-        # Remove /media/ prefix to get the file path
-        file_path = request.path[7:]  # Remove '/media/' prefix
-        full_path = os.path.join(settings.MEDIA_ROOT, file_path)
-        
+
+        # Path resolution, stat and small file contents come from the in-process cache
+        hls_file = get_file_cache().get(request.path, resolve_media_path)
+
         # Check if file exists
-        if not os.path.exists(full_path):
+        if hls_file is None:
             raise Http404("File not found")
-            
+
         try:
-            # Read file content
-            with open(full_path, 'rb') as f:
-                content = f.read()
-            
-            # Determine content type
-            if request.path.endswith('.m3u8'):
-                content_type = 'application/vnd.apple.mpegurl'
-            elif request.path.endswith('.ts'):
-                content_type = 'video/mp2t'
-            else:
-                content_type = 'application/octet-stream'
-            
-            # Create response with proper headers
-            response = HttpResponse(content, content_type=content_type)
-            
-            # Add headers to prevent caching issues
-            response['Cache-Control'] = 'no-cache, no-store, must-revalidate'
-            response['Pragma'] = 'no-cache'
-            response['Expires'] = '0'
+            full_path = hls_file.path
+            content_type = HLS_CONTENT_TYPES.get(os.path.splitext(full_path)[1], 'application/octet-stream')
+            etag = hls_file.etag
+            last_modified = hls_file.mtime
+
+            # 304 / 412 without touching the file
+            response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+            if response is None:
+                sendfile_mode = getattr(settings, 'HLS_SENDFILE_MODE', '')
+                if sendfile_mode:
+                    response = self.offload_response(request, full_path, content_type, sendfile_mode)
+                else:
+                    range_header = request.META.get('HTTP_RANGE') if if_range_matches(request, etag, last_modified) else None
+                    response = self.file_response(hls_file, content_type, range_header)
+
+            response['Cache-Control'] = cache_control_for(request.path)
+            response['ETag'] = etag
+            response['Last-Modified'] = http_date(last_modified)
             response['Access-Control-Allow-Origin'] = '*'
             response['Access-Control-Allow-Methods'] = 'GET, HEAD, OPTIONS'
-            response['Access-Control-Allow-Headers'] = 'Range, Content-Range, Content-Length'
+            response['Access-Control-Allow-Headers'] = 'Range, Content-Range, Content-Length, If-None-Match, If-Modified-Since, If-Range'
+            response['Access-Control-Expose-Headers'] = 'Content-Range, Content-Length, Accept-Ranges, ETag, Last-Modified'
             response['Accept-Ranges'] = 'bytes'
-            
-            # Handle Range requests for video segments
-            if 'HTTP_RANGE' in request.META:
-                range_header = request.META['HTTP_RANGE']
-                if range_header.startswith('bytes='):
-                    range_spec = range_header[6:]
-                    if '-' in range_spec:
-                        start_str, end_str = range_spec.split('-', 1)
-                        start = int(start_str) if start_str else 0
-                        end = int(end_str) if end_str else len(content) - 1
-                        
-                        if start < len(content):
-                            end = min(end, len(content) - 1)
-                            partial_content = content[start:end + 1]
-                            
-                            response = HttpResponse(partial_content, content_type=content_type, status=206)
-                            response['Content-Range'] = f'bytes {start}-{end}/{len(content)}'
-                            response['Content-Length'] = str(len(partial_content))
-                            response['Accept-Ranges'] = 'bytes'
-                            response['Cache-Control'] = 'no-cache, no-store, must-revalidate'
-                            response['Access-Control-Allow-Origin'] = '*'
-            
+
             return response
-            
-        except Exception as e:
+
+        except OSError:
             raise Http404("Error serving file")
+
+    def file_response(self, hls_file, content_type, range_header=None):
+        """Serve the whole file or the requested byte ranges, from memory when cached or else from disk"""
+        size = hls_file.size
+        ranges = parse_range_header(range_header, size)
+
+        def read_range(start, end):
+            if hls_file.content is not None:
+                return iter([hls_file.content[start:end + 1]])
+            return read_file_range(hls_file.path, start, end)
+
+        if ranges == []:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{size}'
+            return response
+
+        if ranges is None:
+            if hls_file.content is not None:
+                response = HttpResponse(hls_file.content, content_type=content_type)
+            else:
+                # FileResponse hands the file object to wsgi.file_wrapper (sendfile)
+                response = FileResponse(open(hls_file.path, 'rb'), content_type=content_type)
+            response['Content-Length'] = str(size)
+            return response
+
+        if len(ranges) == 1:
+            start, end = ranges[0]
+            response = StreamingHttpResponse(
+                read_range(start, end), content_type=content_type, status=206
+            )
+            response['Content-Range'] = f'bytes {start}-{end}/{size}'
+            response['Content-Length'] = str(end - start + 1)
+            return response
+
+        boundary = uuid.uuid4().hex
+        parts = _multipart_parts(ranges, size, content_type, boundary)
+        length = sum(len(part) + (end - start + 1) + 2 for part, (start, end) in zip(parts, ranges))
+        length += len(f'--{boundary}--\r\n')
+        response = StreamingHttpResponse(
+            stream_multipart_ranges(read_range, ranges, size, content_type, boundary),
+            content_type=f'multipart/byteranges; boundary={boundary}',
+            status=206
+        )
+        response['Content-Length'] = str(length)
+        return response
+
+    def offload_response(self, request, full_path, content_type, sendfile_mode):
+        """Let the fronting web server send the file (it also handles Range)"""
+        response = HttpResponse(content_type=content_type)
+        if sendfile_mode == 'x-accel':
+            relative_path = os.path.relpath(full_path, os.path.realpath(settings.MEDIA_ROOT))
+            prefix = getattr(settings, 'HLS_ACCEL_REDIRECT_PREFIX', '/protected-media/')
+            response['X-Accel-Redirect'] = prefix.rstrip('/') + '/' + relative_path.replace(os.sep, '/')
+        else:
+            response['X-Sendfile'] = full_path
+        return response
@@ -28,6 +28,44 @@ BASE_DIR = Path(__file__).resolve().parent.parent
 MEDIA_URL = '/media/'  # URL để truy cập file upload
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')  # Thư mục lưu file upload
 
+# HLS delivery: '' streams files from Django, 'x-accel' (nginx) or 'x-sendfile' hands them to the web server
+HLS_SENDFILE_MODE = os.environ.get('HLS_SENDFILE_MODE', '')
+# nginx `internal` location aliasing MEDIA_ROOT, used with HLS_SENDFILE_MODE = 'x-accel'
+HLS_ACCEL_REDIRECT_PREFIX = os.environ.get('HLS_ACCEL_REDIRECT_PREFIX', '/protected-media/')
+# Cache-Control per path under /media/ (fnmatch patterns, first match wins). VOD segments never change once written,
+# every transcode writes into a new folder (video.utils.hls_output_dir)
+HLS_CACHE_POLICIES = [
+    ('videos/*.ts', 'public, max-age=31536000, immutable'),
+    ('videos/*.m3u8', 'public, max-age=10'),
+    ('videos/*/thumbnails/*', 'public, max-age=86400'),
+]
+# Adaptive bitrate ladder built by the transcode worker (bitrates in kbit/s), False keeps a single stream copy
+HLS_ABR_ENABLED = os.environ.get('HLS_ABR_ENABLED', 'True').lower() == 'true'
+HLS_RENDITIONS = [
+    {'name': '1080p', 'height': 1080, 'video_bitrate': 5000, 'audio_bitrate': 192},
+    {'name': '720p', 'height': 720, 'video_bitrate': 2800, 'audio_bitrate': 128},
+    {'name': '480p', 'height': 480, 'video_bitrate': 1400, 'audio_bitrate': 128},
+    {'name': '360p', 'height': 360, 'video_bitrate': 800, 'audio_bitrate': 96},
+]
+# Renditions encoded in parallel per job, the CPU cores are split between them. A transcode
+# worker runs up to --concurrency x HLS_RENDITION_WORKERS ffmpeg processes at the same time
+HLS_RENDITION_WORKERS = int(os.environ.get('HLS_RENDITION_WORKERS', 1))
+# Seek preview sprite sheets + WebVTT track written during the HLS conversion (tiles every INTERVAL seconds)
+HLS_THUMBNAILS = {
+    'ENABLED': os.environ.get('HLS_THUMBNAILS_ENABLED', 'True').lower() == 'true',
+    'INTERVAL': 10,
+    'WIDTH': 160,
+    'COLUMNS': 10,
+    'ROWS': 10,
+}
+# Per-process LRU of HLS file stats and small file contents (see core/hls_cache.py)
+HLS_FILE_CACHE = {
+    'MAX_ENTRIES': 10000,
+    'MAX_BYTES': 64 * 1024 * 1024,
+    'MAX_FILE_SIZE': 256 * 1024,
+    'REVALIDATE_SECONDS': 2,
+}
+
 
 # Quick-start development settings - unsuitable for production
 # See https://docs.djangoproject.com/en/5.1/howto/deployment/checklist/
@@ -117,7 +155,7 @@ INSTALLED_APPS = [
     # 'comment',  # Removed comment app
     'film',
     'django_extensions',
-    # 'search',  # Temporarily disabled
+    'search',  # Elasticsearch backend, queries need ELASTIC_ENABLED
     # 'elasticsearch_dsl',  # Temporarily disabled
 ]
 
@@ -166,6 +204,18 @@ DATABASES = {
     }
 }
 
+# Elasticsearch content index (search app). When disabled, or while the cluster
+# is failing, the search endpoint answers from the database and nothing is
+# queued for the index. The client is created on first use (search.client)
+ELASTIC_ENABLED = os.environ.get('ELASTIC_ENABLED', 'False').lower() == 'true'
+ELASTIC_HOST = os.environ.get('ELASTIC_HOST', 'http://elasticsearch:9200')
+ELASTIC_USERNAME = os.environ.get('ELASTIC_USERNAME', 'elastic')
+ELASTIC_PASSWORD = os.environ.get('ELASTIC_PASSWORD', '123456')
+ELASTIC_REQUEST_TIMEOUT = float(os.environ.get('ELASTIC_REQUEST_TIMEOUT', 2))  # seconds, user facing queries
+ELASTIC_MAX_CONNECTIONS = int(os.environ.get('ELASTIC_MAX_CONNECTIONS', 10))  # pooled per process
+ELASTIC_BREAKER_FAILURES = 3  # consecutive failures before falling back to the database
+ELASTIC_BREAKER_RESET = 30  # seconds before the cluster is probed again
+
 # ELASTICSEARCH_DSL = {
 #     'default': {
 #         'hosts': [{'host': 'elasticsearch', 'port': 9200}],
@@ -242,6 +292,10 @@ REDIS_DB = 1
 REDIS_PASSWORD = None
 REDIS_DECODE_RESPONSES = True
 
+# Buffer view counters in Redis, flushed by `python manage.py flush_view_counts --interval 10`
+# (the view-count-flusher service of docker-compose.yml)
+VIEW_COUNT_BUFFER_ENABLED = os.environ.get('VIEW_COUNT_BUFFER_ENABLED', 'True').lower() == 'true'
+
 CACHES = {
     'default': {
         'BACKEND': 'django_redis.cache.RedisCache',
@@ -0,0 +1,53 @@
+"""
+Work collected during a transaction and run once when it commits.
+
+Signals fire once per saved row, an import or an admin save touches the same
+content many times, and the follow-up work (search sync, detail document
+rebuilds) only needs to run once per content after the commit.
+on_commit_batch() collects the items of one kind in a per-thread set and
+registers a plain transaction.on_commit callback with every call. The first
+callback that runs after the commit takes the whole set, the others find it
+empty.
+
+A rollback drops the callbacks registered inside it but not their items, they
+run with the next commit of the thread. The follow-up work only reads the
+current rows, so the extra items cost a little work and nothing else.
+"""
+import threading
+
+from django.db import transaction
+
+_local = threading.local()
+
+
+def _pending(alias):
+    """The {name: items} batches of a database connection of this thread"""
+    batches = getattr(_local, 'batches', None)
+    if batches is None:
+        batches = _local.batches = {}
+    return batches.setdefault(alias, {})
+
+
+def on_commit_batch(name, callback, items):
+    """
+    Add `items` to the `name` batch of the current transaction, `callback(items)`
+    is called once with the whole set after the commit. Outside a transaction
+    the callback runs at once, like transaction.on_commit.
+    """
+    items = set(items)
+    if not items:
+        return
+    connection = transaction.get_connection()
+    if not connection.in_atomic_block:
+        callback(items)
+        return
+
+    batches = _pending(connection.alias)
+    batches.setdefault(name, set()).update(items)
+
+    def _run():
+        batch = batches.pop(name, None)
+        if batch:
+            callback(batch)
+
+    transaction.on_commit(_run)
@@ -131,4 +131,9 @@ class ContentPersonAdmin(admin.ModelAdmin):
     list_display = ('content', 'person', 'role', 'character_name')
     list_filter = ('role',)
     search_fields = ('person__name', 'content__title', 'character_name')
-    raw_id_fields = ('content', 'person')
\ No newline at end of file
+    raw_id_fields = ('content', 'person')
+@admin.register(ImportRecord)
+class ImportRecordAdmin(admin.ModelAdmin):
+    list_display = ('source', 'content', 'metadata_hash', 'updated_at')
+    search_fields = ('source', 'content__title')
+    raw_id_fields = ('content',)
@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class FilmConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'film'
+
+    def ready(self):
+        import film.signals  # noqa: F401
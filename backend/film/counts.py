@@ -0,0 +1,110 @@
+"""
+Cached and approximate total counts for the catalog list endpoints.
+
+The list endpoints return `count` next to every page, and COUNT(*) over the
+Content join costs about as much as the page query itself. Counts are cached
+per normalized filter set (ordering and pagination do not change the total),
+and all cached counts are dropped at once by bumping a version number whenever
+catalog rows change (see film.signals).
+"""
+import hashlib
+import json
+
+from django.core.cache import cache
+from django.db import connection
+
+COUNT_CACHE_TIMEOUT = 10 * 60  # 10 minutes
+COUNT_VERSION_KEY = 'catalog_count_version'
+
+# Query params that change the size of the result set
+COUNT_FILTER_PARAMS = ['search', 'genre', 'content_type', 'status']
+
+
+def get_count_version():
+    version = cache.get(COUNT_VERSION_KEY)
+    if version is None:
+        version = 1
+        cache.add(COUNT_VERSION_KEY, version, None)
+    return version
+
+
+def invalidate_counts():
+    """Drop every cached catalog count by moving to a new version"""
+    try:
+        cache.incr(COUNT_VERSION_KEY)
+    except ValueError:
+        # Key missing (evicted or never set), start a fresh version
+        cache.set(COUNT_VERSION_KEY, 2, None)
+
+
+def normalize_count_filters(query_params):
+    """Keep only the filters that affect the total, normalized for the cache key"""
+    filters = {}
+    for name in COUNT_FILTER_PARAMS:
+        value = query_params.get(name)
+        if value is None:
+            continue
+        value = str(value).strip()
+        if name == 'search':
+            value = ' '.join(value.lower().split())
+        if value:
+            filters[name] = value
+    return filters
+
+
+def count_cache_key(scope, filters):
+    digest = hashlib.md5(json.dumps(filters, sort_keys=True).encode()).hexdigest()
+    return f'catalog_count:{get_count_version()}:{scope}:{digest}'
+
+
+def estimated_table_rows(model):
+    """
+    Row estimate from the table statistics, no table scan.
+
+    Returns None when the backend has no cheap estimate, so callers fall back to
+    an exact count.
+    """
+    table = model._meta.db_table
+    with connection.cursor() as cursor:
+        if connection.vendor == 'mysql':
+            cursor.execute(
+                "SELECT TABLE_ROWS FROM information_schema.TABLES "
+                "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s",
+                [table]
+            )
+        elif connection.vendor == 'postgresql':
+            cursor.execute("SELECT reltuples::bigint FROM pg_class WHERE relname = %s", [table])
+        else:
+            return None
+        row = cursor.fetchone()
+    if not row or row[0] is None or row[0] < 0:
+        return None
+    return int(row[0])
+
+
+def wants_exact_count(query_params):
+    """Exact counts are the default, `?exact_count=false` accepts an estimate"""
+    return str(query_params.get('exact_count', 'true')).lower() not in ('0', 'false', 'no')
+
+
+def get_catalog_count(queryset, scope, query_params):
+    """
+    Total number of rows for a list request.
+
+    Returns (count, is_estimate). Unfiltered requests that do not need an exact
+    number use the table statistics; everything else is an exact COUNT(*) cached
+    under the normalized filter set until the catalog changes.
+    """
+    filters = normalize_count_filters(query_params)
+
+    if not filters and not wants_exact_count(query_params):
+        estimate = estimated_table_rows(queryset.model)
+        if estimate is not None:
+            return estimate, True
+
+    cache_key = count_cache_key(scope, filters)
+    count = cache.get(cache_key)
+    if count is None:
+        count = queryset.count()
+        cache.set(cache_key, count, COUNT_CACHE_TIMEOUT)
+    return count, False
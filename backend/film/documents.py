@@ -0,0 +1,105 @@
+"""
+Precomputed detail documents for the content detail endpoints.
+
+Rendering ContentDetailSerializer / MovieDetailSerializer costs 8+ queries
+(studio, genres, tags, nations, languages, cast & crew, movie/series rows).
+The rendered payload is stored per content slug in the Django cache (Redis)
+and rebuilt by signals whenever the content or one of its join rows changes,
+so a detail hit is a single cache lookup.
+
+Image URLs are absolute and depend on the request host, so documents are
+rendered against a placeholder base URL which is swapped for the real one
+when the document is served.
+"""
+import json
+
+from django.core.cache import cache
+
+from core.transactions import on_commit_batch
+from film.models import Content, Movie
+from film.serializers import ContentDetailSerializer, MovieDetailSerializer
+
+CONTENT_DOCUMENT_TIMEOUT = 60 * 60  # 1 hour, keeps views/rating from drifting too far
+BASE_URL_TOKEN = '__VIBERFILM_BASE_URL__'
+
+
+class _DocumentRequest:
+    """Stand-in request for serializers, builds URLs on the placeholder base"""
+
+    def build_absolute_uri(self, location=None):
+        return BASE_URL_TOKEN + (location or '/')
+
+
+def content_document_key(slug):
+    return f'content_doc:{slug}'
+
+
+def render_content_document(content):
+    """Render the detail payloads of a content into a JSON string"""
+    context = {'request': _DocumentRequest()}
+    content = Content.objects.select_related('studio', 'studio__country').get(pk=content.pk)
+    document = {
+        'content': ContentDetailSerializer(content, context=context).data,
+        'movie': None,
+    }
+    if content.is_movie():
+        movie = Movie.objects.filter(content=content).first()
+        if movie:
+            document['movie'] = MovieDetailSerializer(movie, context=context).data
+    return json.dumps(document, default=str)
+
+
+def rebuild_content_document(content_id):
+    """Re-render and store the document of one content, drop it if the content is gone"""
+    content = Content.objects.filter(pk=content_id).only('id', 'slug').first()
+    if content is None:
+        return None
+    document = render_content_document(content)
+    cache.set(content_document_key(content.slug), document, CONTENT_DOCUMENT_TIMEOUT)
+    return document
+
+
+def delete_content_document(slug):
+    if slug:
+        cache.delete(content_document_key(slug))
+
+
+def _rebuild_content_documents(content_ids):
+    for content_id in sorted(content_ids):
+        rebuild_content_document(content_id)
+
+
+def schedule_document_rebuilds(content_ids):
+    """
+    Rebuild documents once the current transaction commits.
+
+    Imports touch the same content many times (genres, nations, cast...) inside
+    one transaction, so rebuilds are deduplicated per content id.
+    """
+    on_commit_batch(
+        'content_documents', _rebuild_content_documents,
+        (content_id for content_id in content_ids if content_id)
+    )
+
+
+def schedule_document_rebuild(content_id):
+    schedule_document_rebuilds([content_id])
+
+
+def get_content_document(slug, request):
+    """
+    Return the detail document for a slug as a dict, or None if no content has it.
+
+    The document is rendered on a cache miss (first hit after expiry or a cold
+    cache) and absolute URLs are pointed at the host of the current request.
+    """
+    document = cache.get(content_document_key(slug))
+    if document is None:
+        content = Content.objects.filter(slug=slug).only('id', 'slug').first()
+        if content is None:
+            return None
+        document = render_content_document(content)
+        cache.set(content_document_key(slug), document, CONTENT_DOCUMENT_TIMEOUT)
+
+    base_url = request.build_absolute_uri('/').rstrip('/')
+    return json.loads(document.replace(BASE_URL_TOKEN, base_url))
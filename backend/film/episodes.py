@@ -0,0 +1,103 @@
+"""
+Single-pass episode loading for series.
+
+Long-running series have dozens of seasons and 1000+ episodes, so episodes
+are fetched with one query ordered by (season order, episode order) and
+turned into dicts directly from `.values()` rows instead of building one
+EpisodeSerializer per episode. The output matches EpisodeSerializer plus
+`season_number` / `season_name`.
+"""
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+
+from film.models import Episode
+
+EPISODE_VALUE_FIELDS = [
+    'id', 'season_id', 'video_id', 'order', 'title', 'intro_duration',
+    'start_intro_time', 'description', 'banner_img_url', 'views', 'duration',
+    'season__order', 'season__season_name',
+]
+
+STREAM_CHUNK_SIZE = 500
+
+
+def parse_episode_window(query_params):
+    """
+    Read the optional `?season=` / `?from=&to=` window.
+
+    `season` is a season number (Season.order); `from` / `to` are inclusive
+    episode numbers (Episode.order). Raises ValueError on non-integer values.
+    """
+    window = {}
+    for param, key in (('season', 'season'), ('from', 'episode_from'), ('to', 'episode_to')):
+        value = query_params.get(param)
+        if value not in (None, ''):
+            window[key] = int(value)
+    return window
+
+
+def series_episodes_queryset(series_id, season=None, episode_from=None, episode_to=None):
+    """All episodes of a series in playback order, as `.values()` rows"""
+    queryset = Episode.objects.filter(season__series_id=series_id)
+    if season is not None:
+        queryset = queryset.filter(season__order=season)
+    if episode_from is not None:
+        queryset = queryset.filter(order__gte=episode_from)
+    if episode_to is not None:
+        queryset = queryset.filter(order__lte=episode_to)
+    return queryset.order_by('season__order', 'order').values(*EPISODE_VALUE_FIELDS)
+
+
+def _absolute_url(url, request):
+    # Same rules as EpisodeSerializer.get_banner_img_url
+    if not url:
+        return None
+    if url.startswith('http'):
+        return url
+    if request:
+        return request.build_absolute_uri('/' + url.lstrip('/'))
+    return f"http://127.0.0.1:8000/{url.lstrip('/')}"
+
+
+def episode_row_to_dict(row, request=None):
+    return {
+        'id': row['id'],
+        'banner_img_url': _absolute_url(row['banner_img_url'], request),
+        'order': row['order'],
+        'title': row['title'],
+        'intro_duration': row['intro_duration'],
+        'start_intro_time': row['start_intro_time'],
+        'description': row['description'],
+        'views': row['views'],
+        'duration': row['duration'],
+        'season': row['season_id'],
+        'video': row['video_id'],
+        'season_number': row['season__order'],
+        'season_name': row['season__season_name'],
+    }
+
+
+def load_series_episodes(series_id, request=None, **window):
+    """Serialize every episode of a series (optionally windowed) with one query"""
+    return [
+        episode_row_to_dict(row, request)
+        for row in series_episodes_queryset(series_id, **window)
+    ]
+
+
+def stream_series_episodes(series_id, request=None, **window):
+    """
+    Yield the episode list as a JSON array, chunk by chunk.
+
+    Rows are read with a server-side iterator so the first episodes reach the
+    player before the whole list has been fetched and serialized.
+    """
+    rows = series_episodes_queryset(series_id, **window).iterator(chunk_size=STREAM_CHUNK_SIZE)
+    yield '['
+    first = True
+    for row in rows:
+        item = json.dumps(episode_row_to_dict(row, request), cls=DjangoJSONEncoder)
+        yield item if first else ',' + item
+        first = False
+    yield ']'
@@ -0,0 +1,653 @@
+"""
+Set-based import engine shared by the import_* management commands.
+
+The commands used to create one title at a time: get_or_create per genre,
+nation, person and language link, Content.save per item (with its slug
+`while ... exists()` loop) and one INSERT per season and episode, which is
+hundreds of thousands of queries for ~10k titles. Here the commands only
+parse their metadata into plain dicts and hand them to CatalogImporter,
+which writes them in batches:
+
+  1. reference data (Genre, Tag, Nation, Studio, Language, Person) is
+     resolved through in-memory name -> id maps loaded once per run, only
+     missing names are bulk-created,
+  2. slugs are allocated for the whole batch with film.slugs and Content
+     rows are bulk-created, their ids are read back by slug (MySQL does not
+     return ids from bulk INSERT),
+  3. Movie / Series, Seasons, Episodes and the join tables follow with one
+     bulk_create each,
+  4. posters and backgrounds are copied and stored with one bulk_update.
+
+Every written item is recorded in the ImportRecord manifest: its source
+directory, a hash of the parsed metadata and the hash of each image. With
+`incremental` a re-run skips the items whose hashes did not change and
+updates the others in place (changed fields, new seasons and episodes,
+links added or removed, replaced images) instead of creating the title again.
+
+With `workers` > 1 the per-title work that does not touch the database
+(directory scans, metadata parsing, image copies) runs on a thread pool,
+while the batches are still written by the calling thread, in order.
+
+Each batch runs in its own transaction. When a batch fails its items are
+written again one by one, so a single bad title is reported and skipped
+like before instead of taking the whole batch down.
+
+An item, as built by the commands:
+
+    {
+        'source': 'movie_12',                   # shown in messages
+        'key': '/data/movies/movie_12',         # manifest key, the item directory
+        'content': {...},                       # Content fields, without slug/studio
+        'studio': 'MAPPA' or None,
+        'genres': ['Action', ...],
+        'tags': ['...'],
+        'nations': [('Nhật Bản', 'JP'), ...],   # (name, code or None)
+        'languages': [('vi', 'Vietnamese', 'Tiếng Việt', 'subtitle'), ...],
+        'people': [('Name', 'bio', 'director', 'character', 1), ...],
+        'movie': {...} or None,                 # Movie fields
+        'series': {...} or None,                # Series fields
+        'seasons': [({...season fields}, [{...episode fields}, ...]), ...],
+        'images': [('poster_img_url', '/src/poster.jpg', 'content/{id}/poster.jpg', '/media/content/{id}/poster.jpg')],
+        'counts': Counter(episodes_faked=2),    # extra stats, added once the item is written
+    }
+
+Image destinations are formatted with the new content id; a field of None
+copies the file without storing its URL.
+"""
+import os
+import json
+import shutil
+import hashlib
+from collections import Counter, deque
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from django.utils.text import slugify
+
+from film.models import (
+    Content, Movie, Series, Season, Episode,
+    Genre, Tag, Nation, Studio, Language, Person,
+    ContentGenre, ContentTag, ContentNation, ContentLanguage, ContentPerson,
+    ImportRecord,
+)
+from film.counts import invalidate_counts
+from film.slugs import allocate_slugs
+from film.search import index_contents
+from film.suggest import invalidate_suggestions
+from film.documents import schedule_document_rebuild
+from film.signals import contents_bulk_saved
+from video.uploads import file_sha256
+
+DEFAULT_BATCH_SIZE = 500
+
+# Parts of an item that make up its metadata hash
+FINGERPRINT_PARTS = (
+    'content', 'studio', 'genres', 'tags', 'nations', 'languages', 'people', 'movie', 'series', 'seasons',
+)
+# Live counters, only set when the title is created
+UPDATE_SKIP_FIELDS = {'views'}
+# Metadata keys holding other titles of a content (Content.aliases, for search)
+ALIAS_KEYS = ('aliases', 'other_names', 'alternative_titles', 'alt_titles')
+# Fields identifying a join row (their unique_together), stale links of updated titles are matched on them
+LINK_KEYS = {
+    ContentGenre: ('content_id', 'genre_id'),
+    ContentTag: ('content_id', 'tag_id'),
+    ContentNation: ('content_id', 'nation_id'),
+    ContentLanguage: ('content_id', 'language_id', 'language_type'),
+    ContentPerson: ('content_id', 'person_id', 'role', 'character_name'),
+}
+
+
+def _key(value):
+    """Lookup key of a reference name, MySQL compares names case-insensitively"""
+    return str(value).strip().casefold()
+
+
+def _unique_value(base, used, max_length):
+    """`base`, or `base-N` / `baseN` with the first N that is not in `used`"""
+    base = base[:max_length]
+    value, counter = base, 1
+    while value in used:
+        suffix = f"-{counter}" if max_length > 5 else str(counter)
+        value = f"{base[:max_length - len(suffix)]}{suffix}"
+        counter += 1
+    used.add(value)
+    return value
+
+
+def fingerprint(item):
+    """(sha256 of the parsed metadata, {image destination: sha256 of the file}) of an item"""
+    metadata = json.dumps({part: item[part] for part in FINGERPRINT_PARTS}, sort_keys=True, default=str)
+    images = {
+        destination: file_sha256(source)
+        for _, source, destination, _ in item['images'] if os.path.exists(source)
+    }
+    return hashlib.sha256(metadata.encode()).hexdigest(), images
+
+
+def _apply(instance, fields):
+    """Save the fields of `instance` that differ from `fields`, returns their names"""
+    changed = []
+    for name, value in fields.items():
+        if name in UPDATE_SKIP_FIELDS:
+            continue
+        value = instance._meta.get_field(name).to_python(value)
+        if getattr(instance, name) != value:
+            setattr(instance, name, value)
+            changed.append(name)
+    if changed:
+        instance.save(update_fields=changed)
+    return changed
+
+
+def metadata_aliases(*sources):
+    """Other titles listed in the `sources` metadata dicts, one per line"""
+    aliases = []
+    for data in sources:
+        for key in ALIAS_KEYS:
+            values = data.get(key) or []
+            aliases.extend([values] if isinstance(values, str) else values)
+    return '\n'.join(dict.fromkeys(str(alias).strip() for alias in aliases if str(alias).strip()))
+
+
+def new_item(source, content, **kwargs):
+    """An import item with every optional part present"""
+    item = {
+        'source': source,
+        'key': None,
+        'content': content,
+        'studio': None,
+        'genres': [],
+        'tags': [],
+        'nations': [],
+        'languages': [],
+        'people': [],
+        'movie': None,
+        'series': None,
+        'seasons': [],
+        'images': [],
+        'counts': Counter(),
+    }
+    item.update(kwargs)
+    return item
+
+
+class ReferenceCache:
+    """
+    Name -> id maps of the reference tables.
+
+    Each table is loaded with one query the first time it is needed; names
+    that are not in the map are bulk-created and read back with one more.
+    """
+
+    def __init__(self, created=None):
+        self._ids = {}
+        self._used = {}
+        self.created = created if created is not None else Counter()  # new rows per model name
+
+    def _map(self, model, field):
+        key = (model, field)
+        if key not in self._ids:
+            self._ids[key] = {_key(value): pk for value, pk in model.objects.values_list(field, 'id')}
+        return self._ids[key]
+
+    def _used_values(self, model, field):
+        """Values of a unique column (slug, code) already taken, for new rows"""
+        key = (model, field)
+        if key not in self._used:
+            self._used[key] = set(model.objects.values_list(field, flat=True))
+        return self._used[key]
+
+    def _new_row(self, model, value, extra):
+        fields = dict(extra)
+        if model in (Genre, Tag, Studio):
+            base = fields.get('slug') or slugify(value) or 'item'
+            fields['slug'] = _unique_value(base, self._used_values(model, 'slug'), 255)
+        elif model is Nation:
+            base = (fields.get('code') or value[:2]).upper() or 'XX'
+            fields['code'] = _unique_value(base, self._used_values(model, 'code'), 5)
+        elif model is Language:
+            fields['name'] = _unique_value(fields.get('name') or value, self._used_values(model, 'name'), 100)
+        return fields
+
+    def resolve(self, model, wanted, field='name'):
+        """
+        Ids for `wanted` ({value: extra fields for a new row}), creating the
+        missing rows in bulk. Returns the map of every known value.
+        """
+        ids = self._map(model, field)
+        missing, seen = {}, set()
+        for value, extra in wanted.items():
+            if _key(value) not in ids and _key(value) not in seen:
+                seen.add(_key(value))
+                missing[value] = extra
+        if missing:
+            model.objects.bulk_create(
+                [model(**{field: value}, **self._new_row(model, value, extra)) for value, extra in missing.items()],
+                ignore_conflicts=True
+            )
+            for value, pk in model.objects.filter(**{f'{field}__in': list(missing)}).values_list(field, 'id'):
+                ids[_key(value)] = pk
+            self.created[model.__name__] += len(missing)
+        return ids
+
+
+class CatalogImporter:
+    """
+    Buffers parsed items and writes them in batches.
+
+    `command` is the management command running the import, its stdout and
+    style are used for progress and error messages. `workers` threads parse
+    the items given to add_all and copy the images. `incremental` skips or
+    updates the items already in the manifest.
+    """
+
+    def __init__(self, command, batch_size=DEFAULT_BATCH_SIZE, dry_run=False, workers=1, incremental=False):
+        self.command = command
+        self.batch_size = max(1, batch_size)
+        self.dry_run = dry_run
+        self.incremental = incremental
+        self._manifest = None
+        self._adoptable = None
+        self.workers = max(1, workers)
+        self._pool = ThreadPoolExecutor(self.workers, thread_name_prefix='import') if self.workers > 1 else None
+        self.refs = ReferenceCache()
+        self.pending = []
+        self.stats = Counter()
+
+    # Public API
+
+    def add(self, item):
+        """Queue one parsed item, writing the batch once it is full"""
+        if self.incremental and not self._classify(item):
+            return
+        if self.dry_run:
+            kind = 'movie' if item['movie'] is not None else 'series'
+            action = 'update' if item.get('existing') else 'create'
+            self.command.stdout.write(f"Would {action} {kind}: {item['content']['title']}")
+            self._count(item)
+            return
+        self.pending.append(item)
+        if len(self.pending) >= self.batch_size:
+            self.flush()
+
+    def add_all(self, tasks):
+        """
+        Run `tasks` ((source, callable returning an item or None), ...) on
+        the worker pool and queue their items in order. The callables must
+        not use the database, a failing one is counted as an error.
+        """
+        if self._pool is None:
+            for source, task in tasks:
+                self._add_result(source, partial(self._prepare, task))
+            return
+        pending = deque()
+        for source, task in tasks:
+            pending.append((source, self._pool.submit(self._prepare, task).result))
+            # Keep a few items per worker in flight, not the whole catalog in memory
+            if len(pending) >= self.workers * 4:
+                self._add_result(*pending.popleft())
+        while pending:
+            self._add_result(*pending.popleft())
+
+    def _prepare(self, task):
+        item = task()
+        if item is not None and not (self.dry_run and not self.incremental):
+            # Hashing the images is file I/O as well, done on the worker
+            item['fingerprint'] = fingerprint(item)
+        return item
+
+    def _add_result(self, source, result):
+        try:
+            item = result()
+        except Exception as e:
+            self.error(source, e)
+            return
+        if item is not None:
+            self.add(item)
+
+    def flush(self):
+        """Write the queued items, one by one if the batch as a whole fails"""
+        batch, self.pending = self.pending, []
+        if not batch:
+            return
+        try:
+            with transaction.atomic():
+                self._write(batch)
+        except Exception as e:
+            # Reference rows created by the rolled back batch are gone, reload the maps
+            self._reset_caches()
+            if len(batch) == 1:
+                self.error(batch[0]['source'], e)
+                return
+            for item in batch:
+                try:
+                    with transaction.atomic():
+                        self._write([item])
+                except Exception as item_error:
+                    self._reset_caches()
+                    self.error(item['source'], item_error)
+                    continue
+                self._count(item)
+            self._progress()
+            return
+        for item in batch:
+            self._count(item)
+        self._progress()
+
+    def finish(self):
+        """Write what is left and refresh the derived catalog data"""
+        self.flush()
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+        if not self.dry_run and (self.stats['movies'] or self.stats['series']):
+            # bulk_create sends no post_save, drop the cached list totals and suggestions once
+            invalidate_counts()
+            invalidate_suggestions()
+        return self.stats
+
+    def _reset_caches(self):
+        self.refs = ReferenceCache(self.refs.created)
+        self._manifest = None
+
+    def error(self, source, exc):
+        """Count an item the command could not parse"""
+        self.stats['errors'] += 1
+        self.command.stdout.write(self.command.style.ERROR(f'Error processing {source}: {str(exc)}'))
+
+    # Manifest
+
+    def _records(self):
+        if self._manifest is None:
+            self._manifest = {record.source: record for record in ImportRecord.objects.all()}
+        return self._manifest
+
+    def _adopt(self, item):
+        """
+        Content imported before the manifest existed, matched by title and
+        type when exactly one such row is not in the manifest yet.
+        """
+        if self._adoptable is None:
+            self._adoptable = {}
+            for pk, title, content_type in Content.objects.filter(
+                import_records__isnull=True
+            ).values_list('id', 'title', 'content_type'):
+                key = (_key(title), content_type)
+                self._adoptable[key] = None if key in self._adoptable else pk
+        return self._adoptable.pop((_key(item['content']['title']), item['content']['content_type']), None)
+
+    def _classify(self, item):
+        """Match the item with the manifest, False when it did not change since the last import"""
+        if 'fingerprint' not in item:
+            item['fingerprint'] = fingerprint(item)
+        metadata_hash, image_hashes = item['fingerprint']
+        record = self._records().get(item['key']) if item['key'] else None
+        if record is None:
+            item['existing'] = self._adopt(item)
+            if item['existing'] is None:
+                return True
+            old_metadata_hash, old_image_hashes = None, {}
+        elif record.metadata_hash == metadata_hash and record.image_hashes == image_hashes:
+            self.stats['unchanged'] += 1
+            return False
+        else:
+            item['existing'] = record.content_id
+            old_metadata_hash, old_image_hashes = record.metadata_hash, record.image_hashes
+
+        item['metadata_changed'] = metadata_hash != old_metadata_hash
+        # Image URLs come from the copied files, the metadata placeholders must not reset them
+        item['image_fields'] = {field for field, _, _, _ in item['images'] if field}
+        # Only new or replaced images are copied again
+        item['images'] = [
+            image for image in item['images']
+            if old_image_hashes.get(image[2]) != image_hashes.get(image[2])
+        ]
+        return True
+
+    def _save_manifest(self, batch):
+        records = self._records()
+        new, changed = [], []
+        for item in batch:
+            if not item['key'] or 'fingerprint' not in item:
+                continue
+            metadata_hash, image_hashes = item['fingerprint']
+            record = records.get(item['key'])
+            if record is None:
+                record = ImportRecord(
+                    source=item['key'], content_id=item['content_id'],
+                    metadata_hash=metadata_hash, image_hashes=image_hashes
+                )
+                records[item['key']] = record
+                new.append(record)
+            else:
+                # A full (non incremental) re-import points the record at the new copy
+                record.content_id = item['content_id']
+                record.metadata_hash, record.image_hashes = metadata_hash, image_hashes
+                record.updated_at = timezone.now()
+                changed.append(record)
+        ImportRecord.objects.bulk_create(new, batch_size=self.batch_size)
+        ImportRecord.objects.bulk_update(
+            changed, ['content', 'metadata_hash', 'image_hashes', 'updated_at'], batch_size=self.batch_size
+        )
+
+    # Writing
+
+    def _count(self, item):
+        if item.get('existing'):
+            self.stats['updated'] += 1
+        else:
+            self.stats['movies' if item['movie'] is not None else 'series'] += 1
+            self.stats['seasons'] += len(item['seasons'])
+            self.stats['episodes'] += sum(len(episodes) for _, episodes in item['seasons'])
+        self.stats.update(item['counts'])
+
+    def _progress(self):
+        total = self.stats['movies'] + self.stats['series']
+        self.command.stdout.write(f'✅ Imported {total} titles ({self.stats["episodes"]} episodes)')
+
+    def _write(self, batch):
+        refs = self.refs
+        studios = refs.resolve(Studio, {item['studio']: {} for item in batch if item['studio']})
+
+        new = [item for item in batch if not item.get('existing')]
+
+        # 1. Content rows, ids read back through their unique slugs. Slugs are
+        # allocated again when a batch is retried, a concurrent insert may have
+        # taken one of them (IntegrityError)
+        slugs = allocate_slugs(Content, [item['content']['title'] for item in new])
+        contents = []
+        for item, slug in zip(new, slugs):
+            fields = dict(item['content'])
+            item['slug'] = fields['slug'] = slug
+            if item['studio']:
+                fields['studio_id'] = studios.get(_key(item['studio']))
+            contents.append(Content(**fields))
+        if contents:
+            Content.objects.bulk_create(contents)
+            content_ids = dict(
+                Content.objects.filter(slug__in=[item['slug'] for item in new]).values_list('slug', 'id')
+            )
+            for item in new:
+                item['content_id'] = content_ids[item['slug']]
+            # bulk_create sends no post_save, index the new titles for search here
+            index_contents(content_ids.values())
+
+        # 2. Movie / Series rows share the content primary key
+        Movie.objects.bulk_create([
+            Movie(content_id=item['content_id'], **item['movie']) for item in new if item['movie'] is not None
+        ])
+        Series.objects.bulk_create([
+            Series(content_id=item['content_id'], **item['series']) for item in new if item['series'] is not None
+        ])
+
+        # 3. Seasons, then their episodes
+        seasons = [
+            Season(series_id=item['content_id'], **fields)
+            for item in new for fields, _ in item['seasons']
+        ]
+        if seasons:
+            Season.objects.bulk_create(seasons, batch_size=self.batch_size)
+            season_ids = {
+                (series_id, order): pk for series_id, order, pk in Season.objects.filter(
+                    series_id__in=[item['content_id'] for item in new if item['seasons']]
+                ).values_list('series_id', 'order', 'id')
+            }
+            Episode.objects.bulk_create([
+                Episode(season_id=season_ids[(item['content_id'], fields['order'])], **episode)
+                for item in new for fields, episodes in item['seasons'] for episode in episodes
+            ], batch_size=self.batch_size)
+
+        # 4. Titles imported before, only what changed
+        for item in batch:
+            if item.get('existing'):
+                item['content_id'] = item['existing']
+                self._update(item, studios)
+
+        # 5. Join tables
+        self._write_links([item for item in batch if not item.get('existing') or item['metadata_changed']])
+
+        # 6. Images, named after the content ids
+        self._copy_images(batch)
+
+        self._save_manifest(batch)
+
+        contents_bulk_saved.send(sender=Content, content_ids=[item['content_id'] for item in batch])
+
+    def _update(self, item, studios):
+        """Apply a changed item to the content it was imported as"""
+        if not item['metadata_changed']:
+            return
+        content_id = item['content_id']
+        fields = {
+            name: value for name, value in item['content'].items() if name not in item['image_fields']
+        }
+        if item['studio']:
+            fields['studio_id'] = studios.get(_key(item['studio']))
+        _apply(Content.objects.get(pk=content_id), fields)
+
+        model, fields = (Movie, item['movie']) if item['movie'] is not None else (Series, item['series'])
+        related = model.objects.filter(content_id=content_id).first()
+        if related is None:
+            model.objects.create(content_id=content_id, **fields)
+        else:
+            _apply(related, fields)
+
+        # Seasons by order, new episodes are added to the seasons that already exist
+        seasons = {season.order: season for season in Season.objects.filter(series_id=content_id)}
+        new_seasons = [
+            Season(series_id=content_id, **fields) for fields, _ in item['seasons'] if fields['order'] not in seasons
+        ]
+        for fields, _ in item['seasons']:
+            if fields['order'] in seasons:
+                _apply(seasons[fields['order']], fields)
+        if new_seasons:
+            Season.objects.bulk_create(new_seasons)
+            seasons = {season.order: season for season in Season.objects.filter(series_id=content_id)}
+
+        episodes = {
+            (episode.season_id, episode.order): episode
+            for episode in Episode.objects.filter(season__series_id=content_id)
+        }
+        new_episodes = []
+        for fields, season_episodes in item['seasons']:
+            season_id = seasons[fields['order']].id
+            for episode in season_episodes:
+                current = episodes.get((season_id, episode['order']))
+                if current is None:
+                    new_episodes.append(Episode(season_id=season_id, **episode))
+                else:
+                    _apply(current, episode)
+        Episode.objects.bulk_create(new_episodes, batch_size=self.batch_size)
+
+        # Assigned, not added: the item may be written again after a failed batch
+        item['counts']['seasons'] = len(new_seasons)
+        item['counts']['episodes'] = len(new_episodes)
+        # Seasons and episodes are saved without signals
+        schedule_document_rebuild(content_id)
+
+    def _write_links(self, batch):
+        refs = self.refs
+        genres = refs.resolve(Genre, {name: {} for item in batch for name in item['genres']})
+        tags = refs.resolve(Tag, {name: {} for item in batch for name in item['tags']})
+        nations = refs.resolve(Nation, {name: {'code': code} for item in batch for name, code in item['nations']})
+        languages = refs.resolve(Language, {
+            code: {'name': name, 'native_name': native_name}
+            for item in batch for code, name, native_name, _ in item['languages']
+        }, field='code')
+        people = refs.resolve(Person, {
+            name: {'bio': bio} for item in batch for name, bio, _, _, _ in item['people']
+        })
+
+        links = {ContentGenre: {}, ContentTag: {}, ContentNation: {}, ContentLanguage: {}, ContentPerson: {}}
+        for item in batch:
+            content_id = item['content_id']
+            for name in item['genres']:
+                genre_id = genres.get(_key(name))
+                links[ContentGenre][(content_id, genre_id)] = ContentGenre(content_id=content_id, genre_id=genre_id)
+            for name in item['tags']:
+                tag_id = tags.get(_key(name))
+                links[ContentTag][(content_id, tag_id)] = ContentTag(content_id=content_id, tag_id=tag_id)
+            for name, _ in item['nations']:
+                nation_id = nations.get(_key(name))
+                links[ContentNation][(content_id, nation_id)] = ContentNation(content_id=content_id, nation_id=nation_id)
+            for code, _, _, language_type in item['languages']:
+                language_id = languages.get(_key(code))
+                links[ContentLanguage][(content_id, language_id, language_type)] = ContentLanguage(
+                    content_id=content_id, language_id=language_id, language_type=language_type
+                )
+            for name, _, role, character_name, order in item['people']:
+                person_id = people.get(_key(name))
+                links[ContentPerson][(content_id, person_id, role, character_name)] = ContentPerson(
+                    content_id=content_id, person_id=person_id, role=role,
+                    character_name=character_name, order=order
+                )
+
+        # Updated titles drop the links their metadata no longer has
+        updated = [item['content_id'] for item in batch if item.get('existing')]
+        for model, rows in links.items():
+            if updated:
+                stale = [
+                    pk for pk, *key in model.objects.filter(content_id__in=updated).values_list('pk', *LINK_KEYS[model])
+                    if tuple(key) not in rows
+                ]
+                if stale:
+                    model.objects.filter(pk__in=stale).delete()
+            # A name that could not be resolved (created concurrently under another slug) is skipped
+            rows = [row for key, row in rows.items() if None not in key]
+            if rows:
+                model.objects.bulk_create(rows, batch_size=self.batch_size, ignore_conflicts=True)
+
+    def _copy_image(self, job):
+        item, field, source, destination, url = job
+        destination = os.path.join(settings.MEDIA_ROOT, destination.format(id=item['content_id']))
+        try:
+            os.makedirs(os.path.dirname(destination), exist_ok=True)
+            shutil.copy2(source, destination)
+        except OSError as e:
+            self.command.stdout.write(
+                self.command.style.WARNING(f"Error copying {source} for {item['source']}: {e}")
+            )
+            if 'fingerprint' in item:
+                # Not recorded, copied again on the next run
+                item['fingerprint'][1].pop(job[3], None)
+            return False
+        return True
+
+    def _copy_images(self, batch):
+        jobs = [(item, *image) for item in batch for image in item['images']]
+        copied = self._pool.map(self._copy_image, jobs) if self._pool else map(self._copy_image, jobs)
+        updates = {}
+        for (item, field, _, _, url), ok in zip(jobs, copied):
+            if not ok:
+                continue
+            self.stats['images'] += 1
+            if field:
+                updates.setdefault(field, []).append(
+                    Content(id=item['content_id'], **{field: url.format(id=item['content_id'])})
+                )
+        for field, rows in updates.items():
+            Content.objects.bulk_update(rows, [field], batch_size=self.batch_size)
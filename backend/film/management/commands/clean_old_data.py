@@ -4,14 +4,87 @@ Django management command to clean old data and media files
 """
 import os
 import shutil
+from concurrent.futures import ThreadPoolExecutor
+from django.core.cache import cache
 from django.core.management.base import BaseCommand
-from django.db import transaction
+from django.core.management.color import no_style
+from django.db import transaction, connection
 from django.conf import settings
 from film.models import *
+from film.counts import invalidate_counts
+from film.suggest import invalidate_suggestions
+from film.documents import content_document_key
+from video.models import Video, TranscodeJob, UploadSession, MediaBlob
+from video.blobs import DEFAULT_IMAGES
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Purged tables, children before the tables they reference so that rows can
+# be deleted without Django's cascade collector
+PURGE_MODELS = [
+    ('view sessions', ViewSession),
+    ('import records', ImportRecord),
+    ('episodes', Episode),
+    ('seasons', Season),
+    ('movies', Movie),
+    ('series', Series),
+    ('content genres', ContentGenre),
+    ('content tags', ContentTag),
+    ('content nations', ContentNation),
+    ('content languages', ContentLanguage),
+    ('content persons', ContentPerson),
+    ('search tokens', SearchToken),
+    ('content items', Content),
+    ('persons', Person),
+    ('studios', Studio),
+    ('genres', Genre),
+    ('tags', Tag),
+    ('nations', Nation),
+    ('transcode jobs', TranscodeJob),
+    ('upload sessions', UploadSession),
+    ('videos', Video),
+    ('media blobs', MediaBlob),
+]
+
+# Media directories to clean
+MEDIA_DIRECTORIES = [
+    'posters',
+    'banners',
+    'backgrounds',
+    'videos',
+    'thumbnails',
+    'images',
+    'assets',   # import_crawled_data / import_anime_data
+    'content',  # import_enhanced_data
+    'banner',   # deduplicated uploads, the placeholders in DEFAULT_IMAGES stay
+]
+
+DEFAULT_CHUNK_SIZE = 1000
+DEFAULT_WORKERS = 4
+
+
+def truncate_blockers(models):
+    """Foreign keys from tables outside `models` that a TRUNCATE would leave dangling"""
+    purged = set(models)
+    return [
+        f'{relation.related_model._meta.label}.{relation.field.name}'
+        for model in models
+        for relation in model._meta.related_objects
+        if relation.related_model not in purged
+    ]
+
+
+def remove_media_entry(path):
+    """Delete a file or directory tree, returns the number of files removed"""
+    if os.path.isdir(path) and not os.path.islink(path):
+        file_count = sum(len(files) for _, _, files in os.walk(path))
+        shutil.rmtree(path)
+        return file_count
+    os.remove(path)
+    return 1
+
+
 class Command(BaseCommand):
     help = 'Clean all old data and media files'
 
@@ -26,11 +99,38 @@ class Command(BaseCommand):
             action='store_true',
             help='Keep user accounts and auth data'
         )
+        parser.add_argument(
+            '--chunked',
+            action='store_true',
+            help='Delete rows in primary key batches, each in its own transaction. '
+                 'An interrupted run is resumed by running the command again'
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=DEFAULT_CHUNK_SIZE,
+            help=f'Rows deleted per batch with --chunked (default: {DEFAULT_CHUNK_SIZE})'
+        )
+        parser.add_argument(
+            '--truncate',
+            action='store_true',
+            help='TRUNCATE the tables when no other table references them (falls back to --chunked)'
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=DEFAULT_WORKERS,
+            help=f'Threads removing media files (default: {DEFAULT_WORKERS})'
+        )
 
     def handle(self, *args, **options):
         self.confirm = options['confirm']
         self.keep_users = options['keep_users']
-        
+        self.chunked = options['chunked']
+        self.chunk_size = max(1, options['chunk_size'])
+        self.truncate = options['truncate']
+        self.workers = max(1, options['workers'])
+
         if not self.confirm:
             self.stdout.write(
                 self.style.WARNING(
@@ -48,15 +148,20 @@ class Command(BaseCommand):
 
         try:
             # Step 1: Clean database
-            self.clean_database()
-            
+            if self.truncate:
+                self.truncate_database()
+            elif self.chunked:
+                self.clean_database_in_chunks()
+            else:
+                self.clean_database()
+
             # Step 2: Clean media files
             self.clean_media_files()
-            
+
             self.stdout.write(
                 self.style.SUCCESS('✅ Cleanup completed successfully!')
             )
-            
+
         except Exception as e:
             self.stdout.write(
                 self.style.ERROR(f'❌ Cleanup failed: {str(e)}')
@@ -66,108 +171,117 @@ class Command(BaseCommand):
     def clean_database(self):
         """Clean all film-related data from database"""
         self.stdout.write('🗃️  Cleaning database...')
-        
+
         with transaction.atomic():
             # Delete in correct order to avoid foreign key constraints
-            
-            # Episodes first
-            episode_count = Episode.objects.count()
-            Episode.objects.all().delete()
-            self.stdout.write(f'  Deleted {episode_count} episodes')
-            
-            # Seasons
-            season_count = Season.objects.count()
-            Season.objects.all().delete()
-            self.stdout.write(f'  Deleted {season_count} seasons')
-            
-            # Series and Movies
-            series_count = Series.objects.count()
-            Series.objects.all().delete()
-            self.stdout.write(f'  Deleted {series_count} series')
-            
-            movie_count = Movie.objects.count()
-            Movie.objects.all().delete()
-            self.stdout.write(f'  Deleted {movie_count} movies')
-            
-            # Content relationships
-            ContentGenre.objects.all().delete()
-            ContentNation.objects.all().delete()
-            ContentPerson.objects.all().delete()
-            
-            # Content
-            content_count = Content.objects.count()
-            Content.objects.all().delete()
-            self.stdout.write(f'  Deleted {content_count} content items')
-            
-            # Reference data (optional - keep for reuse)
-            genre_count = Genre.objects.count()
-            Genre.objects.all().delete()
-            self.stdout.write(f'  Deleted {genre_count} genres')
-            
-            nation_count = Nation.objects.count()
-            Nation.objects.all().delete()
-            self.stdout.write(f'  Deleted {nation_count} nations')
-            
-            person_count = Person.objects.count()
-            Person.objects.all().delete()
-            self.stdout.write(f'  Deleted {person_count} persons')
-            
-            studio_count = Studio.objects.count()
-            Studio.objects.all().delete()
-            self.stdout.write(f'  Deleted {studio_count} studios')
-            
-            tag_count = Tag.objects.count()
-            Tag.objects.all().delete()
-            self.stdout.write(f'  Deleted {tag_count} tags')
-
-            # Clean video data
-            from video.models import Video
-            video_count = Video.objects.count()
-            Video.objects.all().delete()
-            self.stdout.write(f'  Deleted {video_count} videos')
+            for label, model in PURGE_MODELS:
+                count = model.objects.count()
+                model.objects.all().delete()
+                self.stdout.write(f'  Deleted {count} {label}')
+
+    def clean_database_in_chunks(self):
+        """
+        Delete every table in primary key batches.
+
+        Rows are deleted with plain DELETE statements (no cascade collector, no
+        per-row signals) since PURGE_MODELS already lists children first, and
+        every batch commits on its own, so the undo log stays small and rows
+        deleted before an interruption stay deleted.
+        """
+        self.stdout.write(f'🗃️  Cleaning database in batches of {self.chunk_size}...')
+
+        for label, model in PURGE_MODELS:
+            total = model.objects.count()
+            if not total:
+                continue
+
+            deleted, last_pk = 0, None
+            while True:
+                rows = model.objects.order_by('pk')
+                if last_pk is not None:
+                    rows = rows.filter(pk__gt=last_pk)
+                pks = list(rows.values_list('pk', flat=True)[:self.chunk_size])
+                if not pks:
+                    break
+
+                with transaction.atomic():
+                    if model is Content:
+                        self.drop_content_documents(Content.objects.filter(pk__in=pks))
+                    batch = model.objects.filter(pk__in=pks)
+                    deleted += batch._raw_delete(batch.db)
+                last_pk = pks[-1]
+                self.stdout.write(f'  Deleted {deleted}/{total} {label}')
+
+        # Signals were skipped, drop the cached list totals and suggestions once
+        invalidate_counts()
+        invalidate_suggestions()
+
+    def truncate_database(self):
+        """Empty every table at once, only when nothing outside PURGE_MODELS references them"""
+        models = [model for _, model in PURGE_MODELS]
+        blockers = truncate_blockers(models)
+        if blockers:
+            self.stdout.write(
+                self.style.WARNING(
+                    f'⚠️  Cannot TRUNCATE, referenced by {", ".join(blockers)}. Deleting in batches instead'
+                )
+            )
+            self.clean_database_in_chunks()
+            return
+
+        self.stdout.write('🗃️  Truncating tables...')
+        counts = [(label, model.objects.count()) for label, model in PURGE_MODELS]
+        self.drop_content_documents(Content.objects.all())
+
+        # Vendor specific: TRUNCATE with foreign key checks off on MySQL, DELETE on SQLite
+        sql_list = connection.ops.sql_flush(
+            no_style(), [model._meta.db_table for model in models], reset_sequences=True
+        )
+        connection.ops.execute_sql_flush(sql_list)
+
+        for label, count in counts:
+            self.stdout.write(f'  Deleted {count} {label}')
+        invalidate_counts()
+        invalidate_suggestions()
+
+    def drop_content_documents(self, contents):
+        """Cached detail documents are keyed by slug and would outlive their rows"""
+        slugs = contents.values_list('slug', flat=True)
+        keys = [content_document_key(slug) for slug in slugs.iterator(chunk_size=self.chunk_size)]
+        for start in range(0, len(keys), self.chunk_size):
+            cache.delete_many(keys[start:start + self.chunk_size])
 
     def clean_media_files(self):
-        """Clean all media files"""
+        """Clean all media files, every top level entry of a directory is removed on the thread pool"""
         self.stdout.write('📁 Cleaning media files...')
-        
+
         media_root = settings.MEDIA_ROOT
         if not os.path.exists(media_root):
             self.stdout.write('  Media directory does not exist')
             return
-        
-        # Directories to clean
-        dirs_to_clean = [
-            'posters',
-            'banners', 
-            'backgrounds',
-            'videos',
-            'thumbnails',
-            'images'
-        ]
-        
-        total_deleted = 0
-        
-        for dir_name in dirs_to_clean:
+
+        entries = {}
+        for dir_name in MEDIA_DIRECTORIES:
             dir_path = os.path.join(media_root, dir_name)
-            if os.path.exists(dir_path):
-                # Count files first
-                file_count = 0
-                for root, dirs, files in os.walk(dir_path):
-                    file_count += len(files)
-                
-                # Delete directory
-                shutil.rmtree(dir_path)
+            if os.path.isdir(dir_path):
+                entries[dir_name] = [
+                    os.path.join(dir_path, name) for name in os.listdir(dir_path)
+                    if f'{dir_name}/{name}' not in DEFAULT_IMAGES
+                ]
+
+        total_deleted = 0
+
+        with ThreadPoolExecutor(self.workers, thread_name_prefix='clean') as pool:
+            for dir_name, paths in entries.items():
+                file_count = sum(pool.map(remove_media_entry, paths))
                 self.stdout.write(f'  Deleted {file_count} files from {dir_name}/')
                 total_deleted += file_count
-                
-                # Recreate empty directory
-                os.makedirs(dir_path, exist_ok=True)
-        
+
         # Clean any remaining files in media root
         for item in os.listdir(media_root):
             item_path = os.path.join(media_root, item)
             if os.path.isfile(item_path):
                 os.remove(item_path)
                 total_deleted += 1
-        
+
         self.stdout.write(f'  Total files deleted: {total_deleted}')
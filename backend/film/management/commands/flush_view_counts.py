@@ -0,0 +1,55 @@
+"""
+Django management command to flush the Redis-buffered view counters into the database
+"""
+import time
+from django.core.management.base import BaseCommand
+from film.view_counter import flush_pending_views, get_redis, FLUSH_BATCH_SIZE
+
+
+class Command(BaseCommand):
+    help = 'Flush buffered view increments and view sessions from Redis to the database'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--interval',
+            type=int,
+            default=0,
+            help='Keep running and flush every N seconds (default: flush once and exit)'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=FLUSH_BATCH_SIZE,
+            help='Rows per bulk UPDATE / INSERT'
+        )
+
+    def handle(self, *args, **options):
+        interval = options['interval']
+        batch_size = options['batch_size']
+
+        if get_redis() is None:
+            self.stdout.write(
+                self.style.WARNING('View counters are not buffered (cache is not Redis), nothing to flush')
+            )
+            return
+
+        while True:
+            try:
+                result = self.flush(batch_size)
+                if result['contents'] or result['episodes'] or result['sessions']:
+                    self.stdout.write(
+                        f"Flushed {result['contents']} contents, {result['episodes']} episodes, "
+                        f"{result['sessions']} sessions"
+                    )
+            except Exception as e:
+                if not interval:
+                    raise
+                # Keep the worker alive, the snapshot is retried on the next run
+                self.stdout.write(self.style.ERROR(f'❌ Flush failed: {str(e)}'))
+
+            if not interval:
+                break
+            time.sleep(interval)
+
+    def flush(self, batch_size):
+        return flush_pending_views(batch_size=batch_size)
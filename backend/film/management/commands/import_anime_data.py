@@ -1,16 +1,10 @@
 import json
 import os
-import shutil
-from datetime import datetime
+from functools import partial
 from django.core.management.base import BaseCommand, CommandError
 from django.conf import settings
-from django.utils.text import slugify
-from django.db import transaction
-from film.models import (
-    Content, Movie, Series, Season, Episode, 
-    Genre, Tag, Nation, ContentGenre, ContentTag, ContentNation,
-    Status, ContentTypeChoices
-)
+from film.models import Status, ContentTypeChoices
+from film.importer import CatalogImporter, new_item, metadata_aliases, DEFAULT_BATCH_SIZE
 
 class Command(BaseCommand):
     help = 'Import crawled anime data into database'
@@ -33,6 +27,23 @@ class Command(BaseCommand):
             action='store_true',
             help='Run without making changes to database'
         )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=1,
+            help='Threads parsing metadata and copying images (default: 1)'
+        )
+        parser.add_argument(
+            '--incremental',
+            action='store_true',
+            help='Skip titles unchanged since the last import and update the changed ones in place'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=DEFAULT_BATCH_SIZE,
+            help=f'Number of titles written per transaction (default: {DEFAULT_BATCH_SIZE})'
+        )
 
     def handle(self, *args, **options):
         self.dry_run = options['dry_run']
@@ -44,32 +55,24 @@ class Command(BaseCommand):
         )
         
         if self.dry_run:
+            # Metadata is only parsed, nothing is written
             self.stdout.write(
                 self.style.WARNING('DRY RUN MODE - No changes will be made')
             )
         
-        # Statistics
-        self.stats = {
-            'movies_imported': 0,
-            'series_imported': 0,
-            'seasons_imported': 0,
-            'episodes_imported': 0,
-            'genres_created': 0,
-            'nations_created': 0,
-            'images_moved': 0,
-            'errors': 0
-        }
+        self.importer = CatalogImporter(
+            self, batch_size=options['batch_size'], workers=options['workers'],
+            incremental=options['incremental'], dry_run=self.dry_run
+        )
         
         try:
-            with transaction.atomic():
-                if not self.dry_run:
-                    self.create_media_directories()
-                
-                self.import_movies()
-                self.import_series()
-                
-                if self.dry_run:
-                    transaction.set_rollback(True)
+            if not self.dry_run:
+                self.create_media_directories()
+            
+            self.import_dirs(self.movies_dir, 'movie_', self.parse_movie, 'movie')
+            self.import_dirs(self.series_dir, 'series_', self.parse_series, 'series')
+            
+            stats = self.importer.finish()
                     
         except Exception as e:
             self.stdout.write(
@@ -77,6 +80,19 @@ class Command(BaseCommand):
             )
             raise CommandError(f'Import failed: {str(e)}')
         
+        self.stats = {
+            'movies_imported': stats['movies'],
+            'series_imported': stats['series'],
+            'seasons_imported': stats['seasons'],
+            'episodes_imported': stats['episodes'],
+            'genres_created': self.importer.refs.created['Genre'],
+            'nations_created': self.importer.refs.created['Nation'],
+            'images_moved': stats['images'],
+            'updated': stats['updated'],
+            'unchanged': stats['unchanged'],
+            'errors': stats['errors']
+        }
+        
         self.print_statistics()
 
     def create_media_directories(self):
@@ -89,33 +105,29 @@ class Command(BaseCommand):
         
         self.stdout.write(f'Created media directories: {assets_dir}, {videos_dir}')
 
-    def import_movies(self):
-        """Import movie data"""
-        if not os.path.exists(self.movies_dir):
+    def import_dirs(self, root_dir, prefix, parse, kind):
+        """Parse every `<root_dir>/<prefix>*/metadata.txt` and queue it for import"""
+        if not os.path.exists(root_dir):
             self.stdout.write(
-                self.style.WARNING(f'Movies directory not found: {self.movies_dir}')
+                self.style.WARNING(f'{kind.capitalize()} directory not found: {root_dir}')
             )
             return
         
-        movie_dirs = [d for d in os.listdir(self.movies_dir) 
-                     if d.startswith('movie_') and 
-                     os.path.isdir(os.path.join(self.movies_dir, d))]
+        item_dirs = [d for d in os.listdir(root_dir) 
+                     if d.startswith(prefix) and 
+                     os.path.isdir(os.path.join(root_dir, d))]
         
-        self.stdout.write(f'Found {len(movie_dirs)} movies to import')
+        self.stdout.write(f'Found {len(item_dirs)} {kind} to import')
         
-        for movie_dir in sorted(movie_dirs):
-            try:
-                self.import_single_movie(movie_dir)
-            except Exception as e:
-                self.stats['errors'] += 1
-                self.stdout.write(
-                    self.style.ERROR(f'Error importing movie {movie_dir}: {str(e)}')
-                )
+        # Metadata files are read and parsed on the worker threads, items are written in order
+        self.importer.add_all(
+            (f'{kind} {item_dir}', partial(self.load_item, os.path.join(root_dir, item_dir), parse, f'{kind} {item_dir}'))
+            for item_dir in sorted(item_dirs)
+        )
 
-    def import_single_movie(self, movie_dir):
-        """Import a single movie"""
-        movie_path = os.path.join(self.movies_dir, movie_dir)
-        metadata_file = os.path.join(movie_path, 'metadata.txt')
+    def load_item(self, item_path, parse, source):
+        """Read and parse the `metadata.txt` of one item directory"""
+        metadata_file = os.path.join(item_path, 'metadata.txt')
         
         if not os.path.exists(metadata_file):
             raise Exception(f'Metadata file not found: {metadata_file}')
@@ -123,113 +135,38 @@ class Command(BaseCommand):
         with open(metadata_file, 'r', encoding='utf-8') as f:
             metadata = json.load(f)
         
-        # Create Content
-        content_data = self.extract_content_data(metadata, ContentTypeChoices.MOVIE)
-        
-        if self.dry_run:
-            self.stdout.write(f'Would create movie: {content_data["title"]}')
-            self.stats['movies_imported'] += 1
-            return
-        
-        content = Content.objects.create(**content_data)
-        
-        # Move images and update URLs
-        self.move_images(movie_path, content)
-        
-        # Create Movie
-        movie_data = self.extract_movie_data(metadata)
-        Movie.objects.create(content=content, **movie_data)
-        
-        # Add relationships
-        self.add_genres(content, metadata)
-        self.add_nations(content, metadata)
-        
-        self.stats['movies_imported'] += 1
-        self.stdout.write(f'Imported movie: {content.title}')
+        item = parse(metadata, item_path, source)
+        # Manifest key, an incremental re-run matches the item by its directory
+        item['key'] = os.path.realpath(item_path)
+        return item
 
-    def import_series(self):
-        """Import series data"""
-        if not os.path.exists(self.series_dir):
-            self.stdout.write(
-                self.style.WARNING(f'Series directory not found: {self.series_dir}')
-            )
-            return
-        
-        series_dirs = [d for d in os.listdir(self.series_dir) 
-                      if d.startswith('series_') and 
-                      os.path.isdir(os.path.join(self.series_dir, d))]
-        
-        self.stdout.write(f'Found {len(series_dirs)} series to import')
-        
-        for series_dir in sorted(series_dirs):
-            try:
-                self.import_single_series(series_dir)
-            except Exception as e:
-                self.stats['errors'] += 1
-                self.stdout.write(
-                    self.style.ERROR(f'Error importing series {series_dir}: {str(e)}')
-                )
+    def parse_movie(self, metadata, movie_path, source):
+        """Movie content with its genres, nations and images"""
+        item = self.parse_content(metadata, ContentTypeChoices.MOVIE, movie_path, source)
+        item['movie'] = self.extract_movie_data(metadata)
+        return item
 
-    def import_single_series(self, series_dir):
-        """Import a single series"""
-        series_path = os.path.join(self.series_dir, series_dir)
-        metadata_file = os.path.join(series_path, 'metadata.txt')
-        
-        if not os.path.exists(metadata_file):
-            raise Exception(f'Metadata file not found: {metadata_file}')
-        
-        with open(metadata_file, 'r', encoding='utf-8') as f:
-            metadata = json.load(f)
-        
-        # Create Content
-        content_data = self.extract_content_data(metadata, ContentTypeChoices.SERIES)
-        
-        if self.dry_run:
-            self.stdout.write(f'Would create series: {content_data["title"]}')
-            self.stats['series_imported'] += 1
-            return
-        
-        content = Content.objects.create(**content_data)
-        
-        # Move images and update URLs
-        self.move_images(series_path, content)
-        
-        # Create Series
-        series_data = self.extract_series_data(metadata)
-        series = Series.objects.create(content=content, **series_data)
-        
-        # Create Season (default season 1)
-        season_data = self.extract_season_data(metadata)
-        season = Season.objects.create(series=series, **season_data)
-        
-        # Create Episodes
-        self.create_episodes(season, metadata)
-        
-        # Add relationships
-        self.add_genres(content, metadata)
-        self.add_nations(content, metadata)
-        
-        self.stats['series_imported'] += 1
-        self.stats['seasons_imported'] += 1
-        self.stdout.write(f'Imported series: {content.title}')
+    def parse_series(self, metadata, series_path, source):
+        """Series content with one default season and its episodes"""
+        item = self.parse_content(metadata, ContentTypeChoices.SERIES, series_path, source)
+        item['series'] = self.extract_series_data(metadata)
+        item['seasons'] = [(self.extract_season_data(metadata), self.extract_episodes(metadata))]
+        return item
+
+    def parse_content(self, metadata, content_type, source_path, source):
+        """Content item with the relationships shared by movies and series"""
+        item = new_item(source, self.extract_content_data(metadata, content_type))
+        item['genres'] = self.extract_genres(metadata)
+        item['nations'] = self.extract_nations(metadata)
+        item['images'] = self.extract_images(source_path)
+        return item
 
     def extract_content_data(self, metadata, content_type):
-        """Extract common content data"""
+        """Extract common content data, the importer allocates the unique slug"""
         title = metadata.get('title', '').strip()
         if not title:
             raise Exception('Title is required')
         
-        # Create unique slug
-        base_slug = slugify(title)[:250]  # Ensure max length for MySQL
-        slug = base_slug
-        counter = 1
-        
-        # Check for existing slug (skip if dry run)
-        if not self.dry_run:
-            while Content.objects.filter(slug=slug).exists():
-                slug = f"{base_slug}-{counter}"[:250]
-                counter += 1
-        
         # Extract year from metadata with fallback
         year = metadata.get('year', '2023')
         try:
@@ -259,8 +196,8 @@ class Command(BaseCommand):
         
         return {
             'title': title[:255],  # Ensure max length
+            'aliases': metadata_aliases(metadata),
             'content_type': content_type,
-            'slug': slug,
             'release_date': release_date,
             'description': metadata.get('description', '')[:1000],  # Limit description length
             'banner_img_url': '',  # Will be updated after moving images
@@ -300,8 +237,6 @@ class Command(BaseCommand):
 
     def extract_season_data(self, metadata):
         """Extract season data for series"""
-        title = metadata.get('title', '')
-        
         # Extract year for release date
         year = metadata.get('year', '2023')
         try:
@@ -324,73 +259,49 @@ class Command(BaseCommand):
             'age_rank': 'PG-13'
         }
 
-    def create_episodes(self, season, metadata):
-        """Create episodes for a season"""
+    def extract_episodes(self, metadata):
+        """Extract the episodes of the default season"""
         latest_episodes = metadata.get('movie_info', {}).get('latest_episodes', [])
         
-        for i, episode_data in enumerate(latest_episodes, 1):
-            episode = Episode.objects.create(
-                season=season,
-                order=i,
-                title=episode_data.get('title', f'Episode {i}'),
-                description=f"Episode {i}",
-                banner_img_url='',
-                duration=24,  # Default 24 minutes
-                views=0
-            )
-            self.stats['episodes_imported'] += 1
+        return [
+            {
+                'order': i,
+                'title': episode_data.get('title', f'Episode {i}'),
+                'description': f"Episode {i}",
+                'banner_img_url': '',
+                'duration': 24,  # Default 24 minutes
+                'views': 0
+            }
+            for i, episode_data in enumerate(latest_episodes, 1)
+        ]
 
-    def move_images(self, source_path, content):
-        """Move images to media/assets and update content URLs"""
-        assets_dir = os.path.join(settings.MEDIA_ROOT, 'assets')
+    def extract_images(self, source_path):
+        """Images copied to media/assets once the content id is known"""
+        images = []
         
-        # Move poster
         poster_src = os.path.join(source_path, 'poster.jpg')
         if os.path.exists(poster_src):
-            poster_filename = f"content_{content.id}_poster.jpg"
-            poster_dst = os.path.join(assets_dir, poster_filename)
-            if not self.dry_run:
-                shutil.copy2(poster_src, poster_dst)
-                content.poster_img_url = f"media/assets/{poster_filename}"
-                self.stats['images_moved'] += 1
+            images.append(
+                ('poster_img_url', poster_src, 'assets/content_{id}_poster.jpg', 'media/assets/content_{id}_poster.jpg')
+            )
         
-        # Move background
         background_src = os.path.join(source_path, 'background.jpg')
         if os.path.exists(background_src):
-            background_filename = f"content_{content.id}_background.jpg"
-            background_dst = os.path.join(assets_dir, background_filename)
-            if not self.dry_run:
-                shutil.copy2(background_src, background_dst)
-                content.banner_img_url = f"media/assets/{background_filename}"
-                self.stats['images_moved'] += 1
+            images.append(
+                ('banner_img_url', background_src, 'assets/content_{id}_background.jpg', 'media/assets/content_{id}_background.jpg')
+            )
         
-        if not self.dry_run:
-            content.save()
+        return images
 
-    def add_genres(self, content, metadata):
-        """Add genres to content"""
+    def extract_genres(self, metadata):
+        """Genre names of the content"""
         genres = metadata.get('movie_info', {}).get('genres', [])
-        
-        for genre_name in genres:
-            if not genre_name or genre_name.strip() == '':
-                continue
-                
-            genre_name = genre_name.strip()
-            slug = slugify(genre_name)
-            
-            if not self.dry_run:
-                genre, created = Genre.objects.get_or_create(
-                    name=genre_name,
-                    defaults={'slug': slug}
-                )
-                if created:
-                    self.stats['genres_created'] += 1
-                
-                ContentGenre.add(content.id, genre.id)
+        return [genre_name.strip() for genre_name in genres if genre_name and genre_name.strip()]
 
-    def add_nations(self, content, metadata):
-        """Add nations to content"""
+    def extract_nations(self, metadata):
+        """(name, code) of the content countries"""
         countries = metadata.get('movie_info', {}).get('countries', [])
+        nations = []
         
         for country_data in countries:
             if isinstance(country_data, dict):
@@ -402,17 +313,9 @@ class Command(BaseCommand):
                 continue
             
             # Map country names to codes
-            country_code = self.get_country_code(country_name)
-            
-            if not self.dry_run:
-                nation, created = Nation.objects.get_or_create(
-                    name=country_name,
-                    defaults={'code': country_code}
-                )
-                if created:
-                    self.stats['nations_created'] += 1
-                
-                ContentNation.add(content.id, nation.id)
+            nations.append((country_name, self.get_country_code(country_name)))
+        
+        return nations
 
     def get_country_code(self, country_name):
         """Get country code from country name"""
@@ -467,5 +370,7 @@ class Command(BaseCommand):
         self.stdout.write(f'Genres created: {self.stats["genres_created"]}')
         self.stdout.write(f'Nations created: {self.stats["nations_created"]}')
         self.stdout.write(f'Images moved: {self.stats["images_moved"]}')
+        if self.stats['updated'] or self.stats['unchanged']:
+            self.stdout.write(f'Titles updated: {self.stats["updated"]}, unchanged: {self.stats["unchanged"]}')
         self.stdout.write(f'Errors: {self.stats["errors"]}')
         self.stdout.write('='*50)
@@ -5,23 +5,13 @@ Automatically creates missing episodes based on existing episodes
 """
 
 import os
+from functools import partial
 import json
 import logging
-import shutil
 from django.core.management.base import BaseCommand
-from django.db import transaction
-from django.utils.text import slugify
-from django.conf import settings
-from film.models import (
-    Content, ContentTypeChoices, Movie, Series, Season, Episode,
-    Genre, Nation, Person, Studio, Language,
-    ContentGenre, ContentNation, ContentPerson
-)
+from film.models import ContentTypeChoices
+from film.importer import CatalogImporter, new_item, metadata_aliases, DEFAULT_BATCH_SIZE
 from django.utils.dateparse import parse_date
-from django.core.files.base import ContentFile
-import requests
-from urllib.parse import urlparse
-import re
 
 # Setup logging
 logging.basicConfig(level=logging.INFO)
@@ -58,6 +48,23 @@ class Command(BaseCommand):
             default=True,
             help='Automatically complete missing episodes'
         )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=1,
+            help='Threads parsing metadata and copying images (default: 1)'
+        )
+        parser.add_argument(
+            '--incremental',
+            action='store_true',
+            help='Skip titles unchanged since the last import and update the changed ones in place'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=DEFAULT_BATCH_SIZE,
+            help=f'Number of titles written per transaction (default: {DEFAULT_BATCH_SIZE})'
+        )
 
     def handle(self, *args, **options):
         self.data_dir = options['data_dir']
@@ -69,21 +76,18 @@ class Command(BaseCommand):
         self.movies_dir = os.path.join(self.data_dir, 'movies')
         self.series_dir = os.path.join(self.data_dir, 'series')
         
-        self.stats = {
-            'movies_processed': 0,
-            'series_processed': 0,
-            'seasons_created': 0,
-            'episodes_created': 0,
-            'episodes_faked': 0,
-            'errors': 0
-        }
-        
         self.stdout.write(
             self.style.SUCCESS(
                 f'🎬 Starting import from: {self.data_dir}'
             )
         )
         
+        # Metadata is parsed here, the importer writes it in batches
+        self.importer = CatalogImporter(
+            self, batch_size=options['batch_size'], workers=options['workers'],
+            incremental=options['incremental']
+        )
+        
         try:
             if not self.series_only:
                 self.import_movies()
@@ -97,6 +101,8 @@ class Command(BaseCommand):
             )
             logger.error(f"Import error: {str(e)}", exc_info=True)
         
+        self.stats = self.importer.finish()
+        
         # Final statistics
         self.print_final_stats()
 
@@ -107,38 +113,7 @@ class Command(BaseCommand):
             return
             
         self.stdout.write('🎭 Importing movies...')
-        
-        movie_dirs = [d for d in os.listdir(self.movies_dir) 
-                     if os.path.isdir(os.path.join(self.movies_dir, d))]
-        
-        if self.limit:
-            movie_dirs = movie_dirs[:self.limit]
-        
-        for movie_dir in movie_dirs:
-            try:
-                movie_path = os.path.join(self.movies_dir, movie_dir)
-                metadata_file = os.path.join(movie_path, 'metadata.json')
-                
-                if not os.path.exists(metadata_file):
-                    self.stdout.write(
-                        self.style.WARNING(f'No metadata found for {movie_dir}')
-                    )
-                    continue
-                
-                with open(metadata_file, 'r', encoding='utf-8') as f:
-                    metadata = json.load(f)
-                
-                self.create_movie(metadata, movie_path)
-                self.stats['movies_processed'] += 1
-                
-                if self.stats['movies_processed'] % 10 == 0:
-                    self.stdout.write(f'✅ Processed {self.stats["movies_processed"]} movies')
-                    
-            except Exception as e:
-                self.stats['errors'] += 1
-                self.stdout.write(
-                    self.style.ERROR(f'Error processing movie {movie_dir}: {str(e)}')
-                )
+        self.import_dirs(self.movies_dir, self.parse_movie, 'movie')
 
     def import_series(self):
         """Import series data"""
@@ -147,43 +122,43 @@ class Command(BaseCommand):
             return
             
         self.stdout.write('📺 Importing series...')
-        
-        series_dirs = [d for d in os.listdir(self.series_dir) 
-                      if os.path.isdir(os.path.join(self.series_dir, d))]
+        self.import_dirs(self.series_dir, self.parse_series, 'series')
+
+    def import_dirs(self, root_dir, parse, kind):
+        """Parse every `<root_dir>/<item>/metadata.json` and queue it for import"""
+        item_dirs = [d for d in os.listdir(root_dir) 
+                     if os.path.isdir(os.path.join(root_dir, d))]
         
         if self.limit:
-            series_dirs = series_dirs[:self.limit]
+            item_dirs = item_dirs[:self.limit]
         
-        for series_dir in series_dirs:
-            try:
-                series_path = os.path.join(self.series_dir, series_dir)
-                metadata_file = os.path.join(series_path, 'metadata.json')
-                
-                if not os.path.exists(metadata_file):
-                    self.stdout.write(
-                        self.style.WARNING(f'No metadata found for {series_dir}')
-                    )
-                    continue
-                
-                with open(metadata_file, 'r', encoding='utf-8') as f:
-                    metadata = json.load(f)
-                
-                self.create_series(metadata, series_path)
-                self.stats['series_processed'] += 1
-                
-                if self.stats['series_processed'] % 10 == 0:
-                    self.stdout.write(f'✅ Processed {self.stats["series_processed"]} series')
-                    
-            except Exception as e:
-                self.stats['errors'] += 1
-                self.stdout.write(
-                    self.style.ERROR(f'Error processing series {series_dir}: {str(e)}')
-                )
+        # Metadata files are read and parsed on the worker threads, items are written in order
+        self.importer.add_all(
+            (f'{kind} {item_dir}', partial(self.load_item, os.path.join(root_dir, item_dir), parse, f'{kind} {item_dir}'))
+            for item_dir in item_dirs
+        )
 
-    def create_movie(self, metadata, movie_path):
-        """Create movie content"""
-        # Create base content
-        content = self.create_base_content(metadata, ContentTypeChoices.MOVIE)
+    def load_item(self, item_path, parse, source):
+        """Read and parse the `metadata.json` of one item directory"""
+        metadata_file = os.path.join(item_path, 'metadata.json')
+        
+        if not os.path.exists(metadata_file):
+            self.stdout.write(
+                self.style.WARNING(f'No metadata found for {os.path.basename(item_path)}')
+            )
+            return None
+        
+        with open(metadata_file, 'r', encoding='utf-8') as f:
+            metadata = json.load(f)
+        
+        item = parse(metadata, item_path, source)
+        # Manifest key, an incremental re-run matches the item by its directory
+        item['key'] = os.path.realpath(item_path)
+        return item
+
+    def parse_movie(self, metadata, movie_path, source):
+        """Movie content"""
+        item = self.parse_base_content(metadata, ContentTypeChoices.MOVIE, movie_path, source)
         
         # Extract duration from metadata, default to 120 minutes if not found
         duration = 120  # Default 2 hours
@@ -193,58 +168,29 @@ class Command(BaseCommand):
             except (ValueError, TypeError):
                 pass
         
-        # Create movie record
-        movie = Movie.objects.create(
-            content=content,
-            duration=duration
-        )
-        
-        # Process images
-        self.process_content_images(content, movie_path)
-        
-        return movie
+        item['movie'] = {'duration': duration}
+        return item
 
-    def create_series(self, metadata, series_path):
-        """Create series content with seasons and episodes"""
-        # Create base content
-        content = self.create_base_content(metadata, ContentTypeChoices.SERIES)
-        
-        # Create series record
-        series = Series.objects.create(
-            content=content,
-            total_seasons=1,  # Will be updated based on actual seasons
-            total_episodes=0  # Will be calculated
-        )
+    def parse_series(self, metadata, series_path, source):
+        """Series content with seasons and episodes"""
+        item = self.parse_base_content(metadata, ContentTypeChoices.SERIES, series_path, source)
         
-        # Process seasons
-        total_episodes = 0
         season_dirs = [d for d in os.listdir(series_path) 
                       if os.path.isdir(os.path.join(series_path, d)) and d.startswith('season_')]
         
-        if season_dirs:
-            series.total_seasons = len(season_dirs)
-            
-            for season_dir in sorted(season_dirs):
-                season_path = os.path.join(series_path, season_dir)
-                season_number = int(season_dir.split('_')[1])
-                
-                season = self.create_season(series, season_number, season_path, metadata)
-                episodes_count = self.create_episodes_for_season(season, season_path, metadata)
-                total_episodes += episodes_count
-                
-                self.stats['seasons_created'] += 1
-        
-        # Update series totals
-        series.total_episodes = total_episodes
-        series.save()
-        
-        # Process images
-        self.process_content_images(content, series_path)
+        for season_dir in sorted(season_dirs):
+            season_path = os.path.join(series_path, season_dir)
+            season_number = int(season_dir.split('_')[1])
+            item['seasons'].append(self.parse_season(item, season_number, season_path, metadata))
         
-        return series
+        item['series'] = {
+            'total_seasons': len(season_dirs) or 1,
+            'total_episodes': sum(len(episodes) for _, episodes in item['seasons'])
+        }
+        return item
 
-    def create_base_content(self, metadata, content_type):
-        """Create base Content record"""
+    def parse_base_content(self, metadata, content_type, content_path, source):
+        """Content fields and reference data"""
         
         # Clean up title
         title = metadata.get('title', 'Unknown Title').strip()
@@ -267,18 +213,17 @@ class Command(BaseCommand):
         
         # Default to current year if no valid date found
         if not release_date:
-            from datetime import date
             release_date = parse_date("2024-01-01")
         
-        # Create content
-        content = Content.objects.create(
-            title=title,
-            description=metadata.get('description', '')[:1000],  # Limit description length
-            content_type=content_type,
-            release_date=release_date,
-            banner_img_url='',  # Default empty banner image URL
-            status='completed'  # Default status
-        )
+        item = new_item(source, {
+            'title': title,
+            'aliases': metadata_aliases(metadata),
+            'description': metadata.get('description', '')[:1000],  # Limit description length
+            'content_type': content_type,
+            'release_date': release_date,
+            'banner_img_url': '',  # Default empty banner image URL
+            'status': 'completed'  # Default status
+        })
         
         # Handle genres
         genres = metadata.get('genres', [])
@@ -287,17 +232,7 @@ class Command(BaseCommand):
         
         for genre_name in genres[:5]:  # Limit to 5 genres
             if genre_name and len(genre_name.strip()) > 0:
-                genre_name_clean = genre_name.strip()[:50]
-                genre_slug = slugify(genre_name_clean)
-                
-                genre, created = Genre.objects.get_or_create(
-                    name=genre_name_clean,
-                    defaults={'slug': genre_slug}
-                )
-                ContentGenre.objects.get_or_create(
-                    content=content,
-                    genre=genre
-                )
+                item['genres'].append(genre_name.strip()[:50])
         
         # Handle nations/countries
         countries = metadata.get('countries') or metadata.get('nations', [])
@@ -308,21 +243,24 @@ class Command(BaseCommand):
             if country_name and len(country_name.strip()) > 0:
                 country_name_clean = country_name.strip()[:50]
                 # Generate country code from name (first 2 characters, uppercase)
-                country_code = country_name_clean[:2].upper()
-                
-                nation, created = Nation.objects.get_or_create(
-                    name=country_name_clean,
-                    defaults={'code': country_code}
-                )
-                ContentNation.objects.get_or_create(
-                    content=content,
-                    nation=nation
-                )
-        
-        return content
+                item['nations'].append((country_name_clean, country_name_clean[:2].upper()))
+        
+        # Poster and background are copied to media/assets once the content id is known
+        poster_path = os.path.join(content_path, 'poster.jpg')
+        if os.path.exists(poster_path):
+            item['images'].append(
+                ('poster_img_url', poster_path, 'assets/content_{id}_poster.jpg', 'media/assets/content_{id}_poster.jpg')
+            )
+        background_path = os.path.join(content_path, 'background.jpg')
+        if os.path.exists(background_path):
+            item['images'].append(
+                ('banner_img_url', background_path, 'assets/content_{id}_background.jpg', 'media/assets/content_{id}_background.jpg')
+            )
+        
+        return item
 
-    def create_season(self, series, season_number, season_path, metadata):
-        """Create season record"""
+    def parse_season(self, item, season_number, season_path, metadata):
+        """Season fields and its episodes"""
         season_metadata_file = os.path.join(season_path, 'metadata.json')
         season_metadata = {}
         
@@ -333,33 +271,28 @@ class Command(BaseCommand):
             except:
                 pass
         
-        season = Season.objects.create(
-            series=series,
-            order=season_number,  # Season model uses 'order' field
-            season_name=season_metadata.get('title', f"{series.content.title} - Season {season_number}"),
-            description=season_metadata.get('description', metadata.get('description', ''))[:1000],
-            release_date=series.content.release_date,
-            banner_img_url='',  # Add default empty value
-            num_episodes=0  # Will be updated later
-        )
-        
-        return season
+        content = item['content']
+        episodes, faked = self.parse_episodes_for_season(content['title'], season_path)
+        item['counts']['episodes_faked'] += faked
+        return {
+            'order': season_number,  # Season model uses 'order' field
+            'season_name': season_metadata.get('title', f"{content['title']} - Season {season_number}"),
+            'description': season_metadata.get('description', metadata.get('description', ''))[:1000],
+            'release_date': content['release_date'],
+            'banner_img_url': '',  # Add default empty value
+            'num_episodes': len(episodes)
+        }, episodes
 
-    def create_episodes_for_season(self, season, season_path, metadata):
-        """Create episodes for a season with auto-completion"""
+    def parse_episodes_for_season(self, title, season_path):
+        """Episodes of a season with auto-completion, and how many of them are placeholders"""
         episode_dirs = [d for d in os.listdir(season_path) 
                        if os.path.isdir(os.path.join(season_path, d)) and d.startswith('episode_')]
         
-        if not episode_dirs:
-            return 0
-        
-        # Get existing episode numbers
-        existing_episodes = []
-        episode_metadata_template = None
+        # Real episodes by number
+        real_episodes = {}
         
         for episode_dir in episode_dirs:
-            episode_path = os.path.join(season_path, episode_dir)
-            episode_metadata_file = os.path.join(episode_path, 'metadata.json')
+            episode_metadata_file = os.path.join(season_path, episode_dir, 'metadata.json')
             
             if os.path.exists(episode_metadata_file):
                 try:
@@ -367,139 +300,70 @@ class Command(BaseCommand):
                         episode_metadata = json.load(f)
                     
                     episode_number = int(episode_metadata.get('episode_number', episode_dir.split('_')[1]))
-                    existing_episodes.append(episode_number)
-                    
-                    # Use first episode as template for missing episodes
-                    if episode_metadata_template is None:
-                        episode_metadata_template = episode_metadata.copy()
+                    real_episodes.setdefault(episode_number, self.real_episode(title, episode_number, episode_metadata))
                         
                 except Exception as e:
                     logger.warning(f"Error reading episode metadata {episode_metadata_file}: {e}")
                     continue
         
-        if not existing_episodes:
-            return 0
-        
-        existing_episodes.sort()
-        min_episode = min(existing_episodes)
-        max_episode = max(existing_episodes)
-        
-        # Create missing episodes if auto-completion is enabled
-        if self.complete_episodes and episode_metadata_template:
-            all_episodes_to_create = list(range(1, max_episode + 1))
-            
-            for ep_num in all_episodes_to_create:
-                if ep_num not in existing_episodes:
-                    # Create fake episode based on template
-                    self.create_fake_episode(season, ep_num, episode_metadata_template)
-                    self.stats['episodes_faked'] += 1
-                else:
-                    # Create real episode
-                    episode_dir = f"episode_{ep_num}"
-                    episode_path = os.path.join(season_path, episode_dir)
-                    self.create_real_episode(season, episode_path)
-                    
-                self.stats['episodes_created'] += 1
-        else:
-            # Only create existing episodes
-            for episode_dir in episode_dirs:
-                episode_path = os.path.join(season_path, episode_dir)
-                self.create_real_episode(season, episode_path)
-                self.stats['episodes_created'] += 1
-        
-        return len(existing_episodes) + (self.stats['episodes_faked'] if self.complete_episodes else 0)
+        if not real_episodes:
+            return [], 0
+        
+        if not self.complete_episodes:
+            # Only the existing episodes
+            return [real_episodes[number] for number in sorted(real_episodes)], 0
+        
+        # Create missing episodes up to the last one
+        episodes, faked = [], 0
+        for ep_num in range(1, max(real_episodes) + 1):
+            if ep_num in real_episodes:
+                episodes.append(real_episodes[ep_num])
+            else:
+                episodes.append(self.fake_episode(title, ep_num))
+                faked += 1
+        return episodes, faked
 
-    def create_real_episode(self, season, episode_path):
-        """Create episode from real metadata"""
-        episode_metadata_file = os.path.join(episode_path, 'metadata.json')
-        
-        if not os.path.exists(episode_metadata_file):
-            return None
-        
-        try:
-            with open(episode_metadata_file, 'r', encoding='utf-8') as f:
-                episode_metadata = json.load(f)
-        except:
-            return None
-        
-        episode_number = int(episode_metadata.get('episode_number', 1))
-        episode_title = episode_metadata.get('title', f'Episode {episode_number}')
+    def real_episode(self, title, episode_number, episode_metadata):
+        """Episode fields from real metadata"""
+        episode_title = str(episode_metadata.get('title', f'Episode {episode_number}'))
         
         # Clean episode title - if it's just a number, make it more descriptive
         if episode_title.isdigit() or episode_title == str(episode_number):
             episode_title = f"Tập {episode_number}"
         
-        episode = Episode.objects.create(
-            season=season,
-            order=episode_number,
-            title=episode_title,
-            description=f"Tập {episode_number} của {season.series.content.title}",
-            banner_img_url='',  # Default empty banner image URL
-            duration=30,  # Default 30 minutes
-        )
-        
-        return episode
-
-    def create_fake_episode(self, season, episode_number, template_metadata):
-        """Create fake episode based on template"""
-        episode_title = f"Tập {episode_number}"
-        
-        episode = Episode.objects.create(
-            season=season,
-            order=episode_number,
-            title=episode_title,
-            description=f"Tập {episode_number} của {season.series.content.title}",
-            banner_img_url='',  # Default empty banner image URL
-            duration=30,  # Default 30 minutes
-        )
-        
-        logger.info(f"Created fake episode {episode_number} for {season.series.content.title}")
-        return episode
+        return {
+            'order': episode_number,
+            'title': episode_title,
+            'description': f"Tập {episode_number} của {title}",
+            'banner_img_url': '',  # Default empty banner image URL
+            'duration': 30,  # Default 30 minutes
+        }
 
-    def process_content_images(self, content, content_path):
-        """Process and save content images"""
-        # Ensure media directories exist
-        media_root = settings.MEDIA_ROOT
-        assets_dir = os.path.join(media_root, 'assets')
-        os.makedirs(assets_dir, exist_ok=True)
-        
-        # Handle poster image
-        poster_path = os.path.join(content_path, 'poster.jpg')
-        if os.path.exists(poster_path):
-            try:
-                poster_filename = f"content_{content.id}_poster.jpg"
-                poster_dest = os.path.join(assets_dir, poster_filename)
-                shutil.copy2(poster_path, poster_dest)
-                content.poster_img_url = f"media/assets/{poster_filename}"
-            except Exception as e:
-                logger.warning(f"Failed to save poster for {content.title}: {e}")
-        
-        # Handle background image
-        background_path = os.path.join(content_path, 'background.jpg')
-        if os.path.exists(background_path):
-            try:
-                background_filename = f"content_{content.id}_background.jpg"
-                background_dest = os.path.join(assets_dir, background_filename)
-                shutil.copy2(background_path, background_dest)
-                content.banner_img_url = f"media/assets/{background_filename}"
-            except Exception as e:
-                logger.warning(f"Failed to save background for {content.title}: {e}")
-        
-        content.save()
+    def fake_episode(self, title, episode_number):
+        """Placeholder episode for a missing number"""
+        return {
+            'order': episode_number,
+            'title': f"Tập {episode_number}",
+            'description': f"Tập {episode_number} của {title}",
+            'banner_img_url': '',  # Default empty banner image URL
+            'duration': 30,  # Default 30 minutes
+        }
 
     def print_final_stats(self):
         """Print final import statistics"""
         self.stdout.write('\n' + '='*50)
         self.stdout.write(self.style.SUCCESS('🎉 IMPORT COMPLETED'))
         self.stdout.write('='*50)
-        self.stdout.write(f"🎭 Movies processed: {self.stats['movies_processed']}")
-        self.stdout.write(f"📺 Series processed: {self.stats['series_processed']}")
-        self.stdout.write(f"📁 Seasons created: {self.stats['seasons_created']}")
-        self.stdout.write(f"🎞️  Episodes created: {self.stats['episodes_created']}")
+        self.stdout.write(f"🎭 Movies processed: {self.stats['movies']}")
+        self.stdout.write(f"📺 Series processed: {self.stats['series']}")
+        self.stdout.write(f"📁 Seasons created: {self.stats['seasons']}")
+        self.stdout.write(f"🎞️  Episodes created: {self.stats['episodes']}")
         self.stdout.write(f"🎭 Episodes faked: {self.stats['episodes_faked']}")
+        if self.stats['updated'] or self.stats['unchanged']:
+            self.stdout.write(f"🔄 Titles updated: {self.stats['updated']}, unchanged: {self.stats['unchanged']}")
         self.stdout.write(f"❌ Errors: {self.stats['errors']}")
         
-        total_content = self.stats['movies_processed'] + self.stats['series_processed']
+        total_content = self.stats['movies'] + self.stats['series'] + self.stats['errors']
         if total_content > 0:
             success_rate = ((total_content - self.stats['errors']) / total_content) * 100
             self.stdout.write(f"📈 Success rate: {success_rate:.1f}%")
@@ -3,19 +3,13 @@
 Django management command to import crawled anime data with automatic episode completion
 """
 import os
+from functools import partial
 import json
 import logging
-import shutil
 from django.core.management.base import BaseCommand
-from django.db import transaction
-from django.core.files.base import ContentFile
 from django.utils.dateparse import parse_date
-from django.conf import settings
-from film.models import (
-    Content, ContentTypeChoices, Movie, Series, Season, Episode,
-    Genre, Nation, Person, Studio, Tag,
-    ContentGenre, ContentNation, ContentPerson
-)
+from film.models import ContentTypeChoices
+from film.importer import CatalogImporter, new_item, metadata_aliases, DEFAULT_BATCH_SIZE
 
 logger = logging.getLogger(__name__)
 
@@ -55,6 +49,23 @@ class Command(BaseCommand):
             action='store_true',
             help='Skip copying image files'
         )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=1,
+            help='Threads parsing metadata and copying images (default: 1)'
+        )
+        parser.add_argument(
+            '--incremental',
+            action='store_true',
+            help='Skip titles unchanged since the last import and update the changed ones in place'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=DEFAULT_BATCH_SIZE,
+            help=f'Number of titles written per transaction (default: {DEFAULT_BATCH_SIZE})'
+        )
 
     def handle(self, *args, **options):
         self.data_dir = options['data_dir']
@@ -67,35 +78,25 @@ class Command(BaseCommand):
         self.movies_dir = os.path.join(self.data_dir, 'movies')
         self.series_dir = os.path.join(self.data_dir, 'series')
         
-        self.stats = {
-            'movies_processed': 0,
-            'series_processed': 0,
-            'seasons_created': 0,
-            'episodes_created': 0,
-            'episodes_faked': 0,
-            'images_copied': 0,
-            'errors': 0
-        }
-        
         self.stdout.write(
             self.style.SUCCESS(
                 f'🎬 Starting import from: {self.data_dir}'
             )
         )
         
-        try:
-            with transaction.atomic():
-                if not self.series_only:
-                    self.import_movies()
-                
-                if not self.movies_only:
-                    self.import_series()
-                
-        except Exception as e:
-            self.stdout.write(
-                self.style.ERROR(f'❌ Import failed: {str(e)}')
-            )
-            raise
+        # Metadata is parsed here, the importer writes it in batches
+        self.importer = CatalogImporter(
+            self, batch_size=options['batch_size'], workers=options['workers'],
+            incremental=options['incremental']
+        )
+        
+        if not self.series_only:
+            self.import_movies()
+        
+        if not self.movies_only:
+            self.import_series()
+        
+        self.stats = self.importer.finish()
         
         # Final statistics
         self.print_final_stats()
@@ -107,38 +108,7 @@ class Command(BaseCommand):
             return
             
         self.stdout.write('🎭 Importing movies...')
-        
-        movie_dirs = [d for d in os.listdir(self.movies_dir) 
-                     if os.path.isdir(os.path.join(self.movies_dir, d))]
-        
-        if self.limit:
-            movie_dirs = movie_dirs[:self.limit]
-        
-        for movie_dir in movie_dirs:
-            try:
-                movie_path = os.path.join(self.movies_dir, movie_dir)
-                metadata_file = os.path.join(movie_path, 'metadata.json')
-                
-                if not os.path.exists(metadata_file):
-                    self.stdout.write(
-                        self.style.WARNING(f'No metadata found for {movie_dir}')
-                    )
-                    continue
-                
-                with open(metadata_file, 'r', encoding='utf-8') as f:
-                    metadata = json.load(f)
-                
-                self.create_movie(metadata, movie_path)
-                self.stats['movies_processed'] += 1
-                
-                if self.stats['movies_processed'] % 10 == 0:
-                    self.stdout.write(f'✅ Processed {self.stats["movies_processed"]} movies')
-                    
-            except Exception as e:
-                self.stats['errors'] += 1
-                self.stdout.write(
-                    self.style.ERROR(f'Error processing movie {movie_dir}: {str(e)}')
-                )
+        self.import_dirs(self.movies_dir, self.parse_movie, 'movie')
 
     def import_series(self):
         """Import series data"""
@@ -147,101 +117,77 @@ class Command(BaseCommand):
             return
             
         self.stdout.write('📺 Importing series...')
-        
-        series_dirs = [d for d in os.listdir(self.series_dir) 
-                      if os.path.isdir(os.path.join(self.series_dir, d))]
+        self.import_dirs(self.series_dir, self.parse_series, 'series')
+
+    def import_dirs(self, root_dir, parse, kind):
+        """Parse every `<root_dir>/<item>/metadata.json` and queue it for import"""
+        item_dirs = [d for d in os.listdir(root_dir) 
+                     if os.path.isdir(os.path.join(root_dir, d))]
         
         if self.limit:
-            series_dirs = series_dirs[:self.limit]
+            item_dirs = item_dirs[:self.limit]
         
-        for series_dir in series_dirs:
-            try:
-                series_path = os.path.join(self.series_dir, series_dir)
-                metadata_file = os.path.join(series_path, 'metadata.json')
-                
-                if not os.path.exists(metadata_file):
-                    self.stdout.write(
-                        self.style.WARNING(f'No metadata found for {series_dir}')
-                    )
-                    continue
-                
-                with open(metadata_file, 'r', encoding='utf-8') as f:
-                    metadata = json.load(f)
-                
-                self.create_series(metadata, series_path)
-                self.stats['series_processed'] += 1
-                
-                if self.stats['series_processed'] % 10 == 0:
-                    self.stdout.write(f'✅ Processed {self.stats["series_processed"]} series')
-                    
-            except Exception as e:
-                self.stats['errors'] += 1
-                self.stdout.write(
-                    self.style.ERROR(f'Error processing series {series_dir}: {str(e)}')
-                )
+        # Metadata files are read and parsed on the worker threads, items are written in order
+        self.importer.add_all(
+            (f'{kind} {item_dir}', partial(self.load_item, os.path.join(root_dir, item_dir), parse, f'{kind} {item_dir}'))
+            for item_dir in item_dirs
+        )
 
-    def create_movie(self, metadata, movie_path):
-        """Create movie content"""
-        # Create base content
-        content = self.create_base_content(metadata, ContentTypeChoices.MOVIE)
+    def load_item(self, item_path, parse, source):
+        """Read and parse the `metadata.json` of one item directory"""
+        metadata_file = os.path.join(item_path, 'metadata.json')
         
-        # Create movie record
-        movie = Movie.objects.create(content=content)
+        if not os.path.exists(metadata_file):
+            self.stdout.write(
+                self.style.WARNING(f'No metadata found for {os.path.basename(item_path)}')
+            )
+            return None
         
-        # Process images
-        if not self.skip_images:
-            self.process_content_images(content, movie_path)
+        with open(metadata_file, 'r', encoding='utf-8') as f:
+            metadata = json.load(f)
         
-        return movie
+        item = parse(metadata, item_path, source)
+        # Manifest key, an incremental re-run matches the item by its directory
+        item['key'] = os.path.realpath(item_path)
+        return item
 
-    def create_series(self, metadata, series_path):
-        """Create series content with seasons and episodes"""
-        # Create base content
-        content = self.create_base_content(metadata, ContentTypeChoices.SERIES)
-        
-        # Create series record
-        series = Series.objects.create(
-            content=content,
-            total_seasons=1,  # Will be updated based on actual seasons
-            total_episodes=0  # Will be calculated
-        )
+    def parse_movie(self, metadata, movie_path, source):
+        """Movie content"""
+        item = self.parse_base_content(metadata, ContentTypeChoices.MOVIE, movie_path, source)
+        
+        # Movie.duration is required, default to 120 minutes like the other importers
+        duration = 120
+        try:
+            duration = int(metadata.get('duration', duration))
+        except (ValueError, TypeError):
+            pass
+        item['movie'] = {'duration': duration}
+        return item
+
+    def parse_series(self, metadata, series_path, source):
+        """Series content with seasons and episodes"""
+        item = self.parse_base_content(metadata, ContentTypeChoices.SERIES, series_path, source)
         
-        # Process seasons
-        total_episodes = 0
         season_dirs = [d for d in os.listdir(series_path) 
                       if os.path.isdir(os.path.join(series_path, d)) and d.startswith('season_')]
         
         if season_dirs:
-            series.total_seasons = len(season_dirs)
-            
             for season_dir in sorted(season_dirs):
                 season_path = os.path.join(series_path, season_dir)
                 season_number = int(season_dir.split('_')[1])
-                
-                season = self.create_season(series, season_number, season_path, metadata)
-                episodes_count = self.create_episodes_for_season(season, season_path, metadata)
-                total_episodes += episodes_count
-                
-                self.stats['seasons_created'] += 1
+                item['seasons'].append(self.parse_season(item, season_number, season_path, metadata))
         else:
-            # Create default season if no season directories found
-            season = self.create_season(series, 1, series_path, metadata)
-            episodes_count = self.create_episodes_for_season(season, series_path, metadata)
-            total_episodes += episodes_count
-            self.stats['seasons_created'] += 1
-        
-        # Update series totals
-        series.total_episodes = total_episodes
-        series.save()
-        
-        # Process images
-        if not self.skip_images:
-            self.process_content_images(content, series_path)
+            # Default season if no season directories found
+            item['seasons'].append(self.parse_season(item, 1, series_path, metadata))
         
-        return series
+        item['series'] = {
+            'total_seasons': len(item['seasons']),
+            'total_episodes': sum(len(episodes) for _, episodes in item['seasons'])
+        }
+        return item
 
-    def create_base_content(self, metadata, content_type):
-        """Create base Content record"""
+    def parse_base_content(self, metadata, content_type, content_path, source):
+        """Content fields and reference data"""
         
         # Clean up title
         title = metadata.get('title', 'Unknown Title').strip()
@@ -267,14 +213,14 @@ class Command(BaseCommand):
         if isinstance(description, str):
             description = description.strip()[:1000]  # Limit description length
         
-        # Create content
-        content = Content.objects.create(
-            title=title,
-            description=description,
-            content_type=content_type,
-            release_date=release_date,
-            status='completed'  # Default status
-        )
+        item = new_item(source, {
+            'title': title,
+            'aliases': metadata_aliases(metadata),
+            'description': description,
+            'content_type': content_type,
+            'release_date': release_date,
+            'status': 'completed'  # Default status
+        })
         
         # Handle genres
         genres = metadata.get('genres', [])
@@ -283,33 +229,34 @@ class Command(BaseCommand):
         
         for genre_name in genres[:5]:  # Limit to 5 genres
             if genre_name and len(str(genre_name).strip()) > 0:
-                genre, created = Genre.objects.get_or_create(
-                    name=str(genre_name).strip()[:50]  # Limit genre name length
-                )
-                ContentGenre.objects.get_or_create(
-                    content=content,
-                    genre=genre
-                )
+                item['genres'].append(str(genre_name).strip()[:50])  # Limit genre name length
         
-        # Handle nations/countries
+        # Handle nations/countries, codes are derived from the name by the importer
         countries = metadata.get('countries') or metadata.get('nations', [])
         if isinstance(countries, str):
             countries = [countries]
             
         for country_name in countries[:3]:  # Limit to 3 countries
             if country_name and len(str(country_name).strip()) > 0:
-                nation, created = Nation.objects.get_or_create(
-                    name=str(country_name).strip()[:50]
+                item['nations'].append((str(country_name).strip()[:50], None))
+        
+        # Images: the poster is the banner, the background has no field but is kept next to it
+        if not self.skip_images:
+            poster_path = os.path.join(content_path, 'poster.jpg')
+            if os.path.exists(poster_path):
+                item['images'].append(
+                    ('banner_img_url', poster_path, 'posters/poster_{id}.jpg', 'posters/poster_{id}.jpg')
                 )
-                ContentNation.objects.get_or_create(
-                    content=content,
-                    nation=nation
+            background_path = os.path.join(content_path, 'background.jpg')
+            if os.path.exists(background_path):
+                item['images'].append(
+                    (None, background_path, 'backgrounds/background_{id}.jpg', 'backgrounds/background_{id}.jpg')
                 )
         
-        return content
+        return item
 
-    def create_season(self, series, season_number, season_path, metadata):
-        """Create season record"""
+    def parse_season(self, item, season_number, season_path, metadata):
+        """Season fields and its episodes"""
         season_metadata_file = os.path.join(season_path, 'metadata.json')
         season_metadata = {}
         
@@ -320,20 +267,20 @@ class Command(BaseCommand):
             except:
                 pass
         
-        season = Season.objects.create(
-            series=series,
-            order=season_number,
-            season_name=season_metadata.get('title', f"{series.content.title} - Season {season_number}"),
-            description=season_metadata.get('description', metadata.get('description', ''))[:1000],
-            release_date=series.content.release_date,
-            banner_img_url='',
-            num_episodes=0  # Will be updated later
-        )
-        
-        return season
+        content = item['content']
+        episodes, faked = self.parse_episodes_for_season(content['title'], season_number, season_path)
+        item['counts']['episodes_faked'] += faked
+        return {
+            'order': season_number,
+            'season_name': season_metadata.get('title', f"{content['title']} - Season {season_number}"),
+            'description': season_metadata.get('description', metadata.get('description', ''))[:1000],
+            'release_date': content['release_date'],
+            'banner_img_url': '',
+            'num_episodes': len(episodes)
+        }, episodes
 
-    def create_episodes_for_season(self, season, season_path, metadata):
-        """Create episodes for a season with auto-completion"""
+    def parse_episodes_for_season(self, title, season_number, season_path):
+        """Episodes of a season with auto-completion, and how many of them are placeholders"""
         episode_dirs = []
         
         # Look for episode directories
@@ -342,22 +289,14 @@ class Command(BaseCommand):
                            if os.path.isdir(os.path.join(season_path, d)) and d.startswith('episode_')]
         
         if not episode_dirs:
-            # Check if season_path is actually the series path (no season subdirs)
-            # Look for episodes directly in series directory
-            episode_dirs = [d for d in os.listdir(season_path) 
-                           if os.path.isdir(os.path.join(season_path, d)) and d.startswith('episode_')]
-        
-        if not episode_dirs:
-            self.stdout.write(f'No episodes found for season {season.order}')
-            return 0
+            self.stdout.write(f'No episodes found for season {season_number}')
+            return [], 0
         
-        # Get existing episode numbers
-        existing_episodes = []
-        episode_metadata_template = None
+        # Real episodes by number
+        real_episodes = {}
         
         for episode_dir in episode_dirs:
-            episode_path = os.path.join(season_path, episode_dir)
-            episode_metadata_file = os.path.join(episode_path, 'metadata.json')
+            episode_metadata_file = os.path.join(season_path, episode_dir, 'metadata.json')
             
             if os.path.exists(episode_metadata_file):
                 try:
@@ -365,135 +304,52 @@ class Command(BaseCommand):
                         episode_metadata = json.load(f)
                     
                     episode_number = int(episode_metadata.get('episode_number', episode_dir.split('_')[1]))
-                    existing_episodes.append(episode_number)
-                    
-                    # Use first episode as template for missing episodes
-                    if episode_metadata_template is None:
-                        episode_metadata_template = episode_metadata.copy()
+                    real_episodes.setdefault(episode_number, self.real_episode(title, episode_number, episode_metadata))
                         
                 except Exception as e:
                     logger.warning(f"Error reading episode metadata {episode_metadata_file}: {e}")
                     continue
         
-        if not existing_episodes:
-            return 0
-        
-        existing_episodes.sort()
-        min_episode = min(existing_episodes)
-        max_episode = max(existing_episodes)
-        
-        total_episodes_created = 0
-        
-        # Create missing episodes if auto-completion is enabled
-        if self.complete_episodes and episode_metadata_template:
-            all_episodes_to_create = list(range(1, max_episode + 1))
-            
-            for ep_num in all_episodes_to_create:
-                if ep_num not in existing_episodes:
-                    # Create fake episode based on template
-                    self.create_fake_episode(season, ep_num, episode_metadata_template)
-                    self.stats['episodes_faked'] += 1
-                else:
-                    # Create real episode
-                    episode_dir = f"episode_{ep_num}"
-                    episode_path = os.path.join(season_path, episode_dir)
-                    self.create_real_episode(season, episode_path)
-                    
-                self.stats['episodes_created'] += 1
-                total_episodes_created += 1
-        else:
-            # Only create existing episodes
-            for episode_dir in episode_dirs:
-                episode_path = os.path.join(season_path, episode_dir)
-                self.create_real_episode(season, episode_path)
-                self.stats['episodes_created'] += 1
-                total_episodes_created += 1
-        
-        # Update season episode count
-        season.num_episodes = total_episodes_created
-        season.save()
-        
-        return total_episodes_created
+        if not real_episodes:
+            return [], 0
+        
+        if not self.complete_episodes:
+            # Only the existing episodes
+            return [real_episodes[number] for number in sorted(real_episodes)], 0
+        
+        # Fill the gaps up to the last episode with placeholders
+        episodes, faked = [], 0
+        for ep_num in range(1, max(real_episodes) + 1):
+            if ep_num in real_episodes:
+                episodes.append(real_episodes[ep_num])
+            else:
+                episodes.append(self.fake_episode(title, ep_num))
+                faked += 1
+        return episodes, faked
 
-    def create_real_episode(self, season, episode_path):
-        """Create episode from real metadata"""
-        episode_metadata_file = os.path.join(episode_path, 'metadata.json')
-        
-        if not os.path.exists(episode_metadata_file):
-            return None
-        
-        try:
-            with open(episode_metadata_file, 'r', encoding='utf-8') as f:
-                episode_metadata = json.load(f)
-        except:
-            return None
-        
-        episode_number = int(episode_metadata.get('episode_number', 1))
-        episode_title = episode_metadata.get('title', f'Episode {episode_number}')
+    def real_episode(self, title, episode_number, episode_metadata):
+        """Episode fields from real metadata"""
+        episode_title = str(episode_metadata.get('title', f'Episode {episode_number}'))
         
         # Clean episode title - if it's just a number, make it more descriptive
         if episode_title.isdigit() or episode_title == str(episode_number):
             episode_title = f"Tập {episode_number}"
         
-        episode = Episode.objects.create(
-            season=season,
-            order=episode_number,
-            title=episode_title,
-            description=f"Tập {episode_number} của {season.series.content.title}",
-            duration=1800,  # Default 30 minutes in seconds
-        )
-        
-        return episode
-
-    def create_fake_episode(self, season, episode_number, template_metadata):
-        """Create fake episode based on template"""
-        episode_title = f"Tập {episode_number}"
-        
-        episode = Episode.objects.create(
-            season=season,
-            order=episode_number,
-            title=episode_title,
-            description=f"Tập {episode_number} của {season.series.content.title}",
-            duration=1800,  # Default 30 minutes in seconds
-        )
-        
-        return episode
+        return {
+            'order': episode_number,
+            'title': episode_title,
+            'description': f"Tập {episode_number} của {title}",
+            'duration': 1800,  # Default 30 minutes in seconds
+        }
 
-    def process_content_images(self, content, content_path):
-        """Process and save content images"""
-        # Ensure media directories exist
-        media_root = settings.MEDIA_ROOT
-        posters_dir = os.path.join(media_root, 'posters')
-        backgrounds_dir = os.path.join(media_root, 'backgrounds')
-        
-        os.makedirs(posters_dir, exist_ok=True)
-        os.makedirs(backgrounds_dir, exist_ok=True)
-        
-        # Handle poster image
-        poster_path = os.path.join(content_path, 'poster.jpg')
-        if os.path.exists(poster_path):
-            try:
-                poster_filename = f"poster_{content.id}.jpg"
-                poster_dest = os.path.join(posters_dir, poster_filename)
-                shutil.copy2(poster_path, poster_dest)
-                content.banner_img_url = f'posters/{poster_filename}'
-                self.stats['images_copied'] += 1
-            except Exception as e:
-                logger.warning(f"Error copying poster for content {content.id}: {e}")
-        
-        # Handle background image
-        background_path = os.path.join(content_path, 'background.jpg')
-        if os.path.exists(background_path):
-            try:
-                bg_filename = f"background_{content.id}.jpg"
-                bg_dest = os.path.join(backgrounds_dir, bg_filename)
-                shutil.copy2(background_path, bg_dest)
-                content.background_img_url = f'backgrounds/{bg_filename}'
-                self.stats['images_copied'] += 1
-            except Exception as e:
-                logger.warning(f"Error copying background for content {content.id}: {e}")
-        
-        content.save()
+    def fake_episode(self, title, episode_number):
+        """Placeholder episode for a missing number"""
+        return {
+            'order': episode_number,
+            'title': f"Tập {episode_number}",
+            'description': f"Tập {episode_number} của {title}",
+            'duration': 1800,  # Default 30 minutes in seconds
+        }
 
     def print_final_stats(self):
         """Print final import statistics"""
@@ -501,15 +357,17 @@ class Command(BaseCommand):
         self.stdout.write(self.style.SUCCESS("🎉 IMPORT COMPLETED"))
         self.stdout.write("="*50)
         self.stdout.write(f"📊 STATISTICS:")
-        self.stdout.write(f"  🎭 Movies imported: {self.stats['movies_processed']}")
-        self.stdout.write(f"  📺 Series imported: {self.stats['series_processed']}")
-        self.stdout.write(f"  📁 Seasons created: {self.stats['seasons_created']}")
-        self.stdout.write(f"  🎞️  Episodes created: {self.stats['episodes_created']}")
+        self.stdout.write(f"  🎭 Movies imported: {self.stats['movies']}")
+        self.stdout.write(f"  📺 Series imported: {self.stats['series']}")
+        self.stdout.write(f"  📁 Seasons created: {self.stats['seasons']}")
+        self.stdout.write(f"  🎞️  Episodes created: {self.stats['episodes']}")
         self.stdout.write(f"  🔧 Episodes auto-completed: {self.stats['episodes_faked']}")
-        self.stdout.write(f"  🖼️  Images copied: {self.stats['images_copied']}")
+        self.stdout.write(f"  🖼️  Images copied: {self.stats['images']}")
+        if self.stats['updated'] or self.stats['unchanged']:
+            self.stdout.write(f"  🔄 Titles updated: {self.stats['updated']}, unchanged: {self.stats['unchanged']}")
         self.stdout.write(f"  ❌ Errors: {self.stats['errors']}")
         
-        total_content = self.stats['movies_processed'] + self.stats['series_processed']
+        total_content = self.stats['movies'] + self.stats['series']
         self.stdout.write(f"\n📈 Total content imported: {total_content}")
         
         if self.stats['errors'] > 0:
@@ -0,0 +1,32 @@
+"""
+Django management command to (re)build the precomputed content detail documents
+"""
+from django.core.management.base import BaseCommand
+from film.models import Content
+from film.documents import rebuild_content_document
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the cached detail documents of all content (or the given ids)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'content_ids',
+            nargs='*',
+            type=int,
+            help='Only rebuild these content ids'
+        )
+
+    def handle(self, *args, **options):
+        content_ids = options['content_ids']
+        if not content_ids:
+            content_ids = Content.objects.order_by('id').values_list('id', flat=True).iterator()
+
+        rebuilt = 0
+        for content_id in content_ids:
+            if rebuild_content_document(content_id) is not None:
+                rebuilt += 1
+                if rebuilt % 100 == 0:
+                    self.stdout.write(f'Rebuilt {rebuilt} documents...')
+
+        self.stdout.write(self.style.SUCCESS(f'✅ Rebuilt {rebuilt} content documents'))
@@ -0,0 +1,33 @@
+"""
+Django management command to (re)build the search tokens of the catalog
+"""
+from django.core.management.base import BaseCommand
+from film.search import index_contents, rebuild_index, INDEX_BATCH_SIZE
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the search index of all content (or the given ids)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'content_ids',
+            nargs='*',
+            type=int,
+            help='Only rebuild these content ids'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=INDEX_BATCH_SIZE,
+            help=f'Contents indexed per transaction (default: {INDEX_BATCH_SIZE})'
+        )
+
+    def handle(self, *args, **options):
+        content_ids = options['content_ids']
+        if content_ids:
+            index_contents(content_ids)
+            indexed = len(content_ids)
+        else:
+            indexed = rebuild_index(batch_size=options['batch_size'])
+
+        self.stdout.write(self.style.SUCCESS(f'✅ Indexed {indexed} contents for search'))
@@ -0,0 +1,26 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:03
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('film', '0002_viewsession'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImportRecord',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('source', models.CharField(help_text='Absolute path of the item directory', max_length=500, unique=True)),
+                ('metadata_hash', models.CharField(help_text='sha256 of the parsed metadata', max_length=64)),
+                ('image_hashes', models.JSONField(blank=True, default=dict, help_text='sha256 of each copied image, by destination')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('content', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='import_records', to='film.content')),
+            ],
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:08
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('film', '0003_importrecord'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchToken',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('token', models.CharField(max_length=64)),
+                ('weight', models.PositiveSmallIntegerField(default=1, help_text='Sum of the weights of the fields containing the token')),
+                ('content', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='search_tokens', to='film.content')),
+            ],
+            options={
+                'unique_together': {('token', 'content')},
+            },
+        ),
+    ]
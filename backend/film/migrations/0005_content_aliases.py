@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('film', '0004_searchtoken'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='content',
+            name='aliases',
+            field=models.TextField(blank=True),
+        ),
+    ]
@@ -0,0 +1,21 @@
+from django.db import migrations
+
+
+def index_existing_contents(apps, schema_editor):
+    # The search tokens are built by film.search itself (the historical models
+    # have no tokenizer), the Content columns it reads all exist at this point.
+    # Every row is rebuilt, tokens stored before 0005 (unfolded, without the
+    # aliases and the studio) are replaced as well.
+    from film.search import rebuild_index
+    rebuild_index()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('film', '0005_content_aliases'),
+    ]
+
+    operations = [
+        migrations.RunPython(index_existing_contents, migrations.RunPython.noop, elidable=True),
+    ]
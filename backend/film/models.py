@@ -1,8 +1,10 @@
 from django.db import models
-from django.conf import settings
 from django.utils.text import slugify
-from django.db import transaction
-import os
+from django.db import transaction, IntegrityError
+from video.blobs import release_image
+from film.slugs import allocate_slug, is_slug_conflict
+
+SLUG_SAVE_ATTEMPTS = 3
 
 class Status(models.TextChoices):
     ON_GOING = 'on_going'
@@ -47,6 +49,7 @@ class Content(models.Model):
     id = models.AutoField(primary_key=True)
     title = models.CharField(max_length=255)
     original_title = models.CharField(max_length=255, blank=True)  # Tiêu đề gốc
+    aliases = models.TextField(blank=True)  # Other titles, one per line (search only)
     content_type = models.CharField(max_length=10, choices=ContentTypeChoices.choices)
     release_date = models.DateField()
     description = models.TextField()
@@ -85,29 +88,26 @@ class Content(models.Model):
         return self.content_type == ContentTypeChoices.SERIES
     
     def save(self, *args, **kwargs):
-        # Auto-generate slug if not provided
-        if not self.slug:
-            base_slug = slugify(self.title)
-            unique_slug = base_slug
-            counter = 1
-            
-            # Ensure slug is unique
-            while Content.objects.filter(slug=unique_slug).exists():
-                unique_slug = f"{base_slug}-{counter}"
-                counter += 1
-            
-            self.slug = unique_slug
-        
-        super().save(*args, **kwargs)
+        if self.slug:
+            super().save(*args, **kwargs)
+            return
+
+        # Auto-generate slug if not provided, another insert may take it first
+        for attempt in range(SLUG_SAVE_ATTEMPTS):
+            self.slug = allocate_slug(Content, self.title)
+            try:
+                with transaction.atomic():
+                    super().save(*args, **kwargs)
+                return
+            except IntegrityError:
+                if attempt == SLUG_SAVE_ATTEMPTS - 1 or not is_slug_conflict(Content, self.slug, self.pk):
+                    self.slug = ''
+                    raise
     
     def delete(self, *args, **kwargs):
-        # Clean up image files
+        # Clean up image files, shared (deduplicated) images stay until their last user is gone
         for img_field in [self.banner_img_url, self.poster_img_url]:
-            if img_field:
-                img_path = img_field.lstrip("/")
-                full_path = os.path.join(settings.BASE_DIR, img_path)
-                if os.path.exists(full_path):
-                    os.remove(full_path)
+            release_image(img_field)
         super().delete(*args, **kwargs)
 
 # Movie Model - Kế thừa từ Content
@@ -159,11 +159,7 @@ class Season(models.Model):
         return f"{self.series.content.title} - {self.season_name}"
 
     def delete(self, *args, **kwargs):
-        if self.banner_img_url:
-            banner_img_path = self.banner_img_url.lstrip("/")
-            full_path = os.path.join(settings.BASE_DIR, banner_img_path)
-            if os.path.exists(full_path):
-                os.remove(full_path)
+        release_image(self.banner_img_url)
         super().delete(*args, **kwargs)
 
 class Episode(models.Model):
@@ -187,11 +183,7 @@ class Episode(models.Model):
         return f"{self.season.series.content.title} S{self.season.order}E{self.order}"
 
     def delete(self, *args, **kwargs):
-        if self.banner_img_url:
-            banner_img_path = self.banner_img_url.lstrip("/")
-            full_path = os.path.join(settings.BASE_DIR, banner_img_path)
-            if os.path.exists(full_path):
-                os.remove(full_path)
+        release_image(self.banner_img_url)
         if self.video:
             self.video.delete()
         super().delete(*args, **kwargs)
@@ -400,3 +392,27 @@ class ViewSession(models.Model):
         elif self.episode:
             return f"ViewSession: {self.episode} - {self.watch_duration}s"
         return f"ViewSession: {self.session_id}"
+
+class ImportRecord(models.Model):
+    """Manifest of the import commands: which content a crawled item directory was imported as"""
+    source = models.CharField(max_length=500, unique=True, help_text="Absolute path of the item directory")
+    content = models.ForeignKey(Content, on_delete=models.CASCADE, related_name='import_records')
+    metadata_hash = models.CharField(max_length=64, help_text="sha256 of the parsed metadata")
+    image_hashes = models.JSONField(default=dict, blank=True, help_text="sha256 of each copied image, by destination")
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.source} -> {self.content_id}"
+
+class SearchToken(models.Model):
+    """Inverted index of the Content text used by the catalog search (see film.search)"""
+    token = models.CharField(max_length=64)
+    content = models.ForeignKey(Content, on_delete=models.CASCADE, related_name='search_tokens')
+    weight = models.PositiveSmallIntegerField(default=1, help_text="Sum of the weights of the fields containing the token")
+
+    class Meta:
+        unique_together = ('token', 'content')
+
+    def __str__(self):
+        return f"{self.token} -> {self.content_id}"
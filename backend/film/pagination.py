@@ -0,0 +1,151 @@
+"""
+Keyset (cursor) pagination helpers for the catalog list endpoints.
+
+Offset pagination makes MySQL scan and discard `offset` rows on every page, so
+deep pages get slower and slower. Cursor mode instead remembers the last row
+of the current page (ordering value + primary key) and asks for the rows
+strictly after it, which stays on the index no matter how deep the client is.
+"""
+import base64
+import datetime
+import json
+
+from django.db.models import Q
+
+# Fields of Content that can drive the keyset ordering
+CURSOR_ORDERING_FIELDS = ['views', 'rating', 'release_date', 'created_at', 'updated_at']
+
+DEFAULT_CURSOR_LIMIT = 20
+MAX_CURSOR_LIMIT = 100
+
+
+class InvalidCursor(ValueError):
+    """Raised when a cursor or a cursor ordering cannot be used"""
+
+
+def is_cursor_request(query_params):
+    """Cursor mode is opt-in: `?pagination=cursor` or any `?cursor=` value"""
+    return query_params.get('pagination') == 'cursor' or 'cursor' in query_params
+
+
+def wants_count(query_params):
+    """Cursor responses skip COUNT(*) unless the client asks for it"""
+    return str(query_params.get('include_count', '')).lower() in ('1', 'true', 'yes')
+
+
+def resolve_cursor_ordering(ordering, prefix='', default='-created_at'):
+    """
+    Map a client ordering (e.g. `-views`, `content__updated_at`) to a model field path.
+
+    Returns (field_path, descending). Only CURSOR_ORDERING_FIELDS are allowed since
+    the keyset condition needs a non-null, comparable column.
+    """
+    ordering = ordering or default
+    descending = ordering.startswith('-')
+    field = ordering.lstrip('-')
+    if prefix and field.startswith(prefix):
+        field = field[len(prefix):]
+    if field not in CURSOR_ORDERING_FIELDS:
+        raise InvalidCursor(
+            f"Ordering '{ordering}' is not supported in cursor mode. "
+            f"Use one of: {', '.join(CURSOR_ORDERING_FIELDS)}"
+        )
+    return f'{prefix}{field}', descending
+
+
+def encode_cursor(value, pk, direction='next'):
+    """Build an opaque cursor from the ordering value and pk of a boundary row"""
+    if isinstance(value, (datetime.datetime, datetime.date)):
+        value = value.isoformat()
+    payload = json.dumps({'v': value, 'pk': pk, 'd': direction}, separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Decode a cursor created by encode_cursor, returns (value, pk, direction)"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode()).decode())
+        direction = payload.get('d', 'next')
+        if direction not in ('next', 'prev'):
+            raise ValueError(direction)
+        return payload['v'], payload['pk'], direction
+    except (ValueError, KeyError, TypeError) as e:
+        raise InvalidCursor(f"Invalid cursor: {str(e)}")
+
+
+def _resolve_attr(obj, path):
+    """Follow a `content__views` style path on a model instance"""
+    for part in path.split('__'):
+        obj = getattr(obj, part)
+    return obj
+
+
+def _parse_limit(limit):
+    try:
+        limit = int(limit) if limit else DEFAULT_CURSOR_LIMIT
+    except (ValueError, TypeError):
+        raise InvalidCursor("limit must be an integer")
+    return max(1, min(limit, MAX_CURSOR_LIMIT))
+
+
+def paginate_by_cursor(queryset, query_params, prefix='', default_ordering='-created_at', count_fn=None):
+    """
+    Slice `queryset` with a keyset condition built from `?cursor=` and `?ordering=`.
+
+    The active ordering field is used as the primary key of the keyset, with `pk`
+    as the tie-breaker so rows sharing the same value (e.g. equal views) are never
+    skipped or repeated. Returns a dict with `results` (model instances), `next`,
+    `previous` and, when requested with `?include_count=true`, `count`
+    (computed by `count_fn` when given, so callers can use the cached counts).
+    """
+    field, descending = resolve_cursor_ordering(
+        query_params.get('ordering'), prefix=prefix, default=default_ordering
+    )
+    limit = _parse_limit(query_params.get('limit'))
+    cursor = query_params.get('cursor')
+
+    count = None
+    if wants_count(query_params):
+        count = count_fn() if count_fn else queryset.count()
+
+    direction = 'next'
+    if cursor:
+        value, pk, direction = decode_cursor(cursor)
+        # Walking forwards on a descending ordering means "smaller than the cursor"
+        forward_lt = descending if direction == 'next' else not descending
+        op = 'lt' if forward_lt else 'gt'
+        queryset = queryset.filter(
+            Q(**{f'{field}__{op}': value}) |
+            Q(**{field: value, f'pk__{op}': pk})
+        )
+
+    # Previous pages are fetched in reverse order and flipped back afterwards
+    reverse = direction == 'prev'
+    walk_descending = descending != reverse
+    sign = '-' if walk_descending else ''
+    queryset = queryset.order_by(f'{sign}{field}', f'{sign}pk')
+
+    rows = list(queryset[:limit + 1])
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    if reverse:
+        rows.reverse()
+
+    next_cursor = None
+    previous_cursor = None
+    if rows:
+        first, last = rows[0], rows[-1]
+        if has_more or reverse:
+            next_cursor = encode_cursor(_resolve_attr(last, field), last.pk, 'next')
+        if (cursor and not reverse) or (reverse and has_more):
+            previous_cursor = encode_cursor(_resolve_attr(first, field), first.pk, 'prev')
+
+    page = {
+        'next': next_cursor,
+        'previous': previous_cursor,
+        'results': rows,
+    }
+    if count is not None:
+        page['count'] = count
+    return page
@@ -0,0 +1,150 @@
+"""
+Full-text search over Content through a local inverted index.
+
+CombinedSearchAPIView used `title__icontains OR description__icontains`,
+a full scan of the TEXT columns on every keystroke, then serialized every
+match to sort and slice the page in Python. Instead each Content keeps its
+tokens in SearchToken (one row per distinct token, weighted by the field it
+comes from), kept up to date by film.signals and the bulk importer. A search
+is an indexed prefix lookup on the token column, grouped per content and
+ranked in SQL, so only the requested page is loaded and serialized.
+
+Tokens are folded before they are stored and before they are looked up:
+lowercased, Vietnamese/Latin diacritics stripped and đ spelled d, so
+"hanh dong" finds "Hành động" with a plain prefix lookup instead of a
+per-row transform. Besides the title and description the index covers the
+original title (romaji or English names of anime, "shingeki"), the
+alternative titles in Content.aliases and the studio name.
+
+Migration 0006 fills the index for the rows that existed before it,
+`manage.py rebuild_search_index` rebuilds it after a tokenizer change.
+"""
+import re
+import unicodedata
+
+from django.db import transaction
+from django.db.models import Case, Count, IntegerField, Max, Q, Sum, When
+
+from film.models import Content, SearchToken
+
+# Token weight per field, summed when a token appears in several fields
+FIELD_WEIGHTS = {
+    'title': 10,
+    'original_title': 6,
+    'aliases': 6,
+    'description': 1,
+}
+STUDIO_WEIGHT = 2
+# Fields whose change makes the tokens of a content stale
+INDEXED_FIELDS = set(FIELD_WEIGHTS) | {'studio', 'studio_id'}
+TOKEN_MAX_LENGTH = 64
+MAX_QUERY_TOKENS = 8
+INDEX_BATCH_SIZE = 1000
+
+TOKEN_PATTERN = re.compile(r'\w+')
+# Combining Diacritical Marks, the accents of Latin scripts. Kana voicing
+# marks (U+3099, U+309A) are left alone so that が does not become か
+DIACRITICS = re.compile('[\u0300-\u036f]')
+LETTER_FOLDS = str.maketrans({'đ': 'd', 'Đ': 'd', 'ø': 'o', 'Ø': 'o', 'ł': 'l', 'Ł': 'l'})
+
+
+def fold(text):
+    """Lowercase `text` and strip its accents: "Hành Động" -> "hanh dong" """
+    text = unicodedata.normalize('NFKD', (text or '').translate(LETTER_FOLDS))
+    return unicodedata.normalize('NFC', DIACRITICS.sub('', text)).lower()
+
+
+def tokenize(text):
+    """Folded word tokens of `text`, in order"""
+    return [token[:TOKEN_MAX_LENGTH] for token in TOKEN_PATTERN.findall(fold(text))]
+
+
+def content_tokens(content):
+    """{token: weight} of one content, `content.studio` loaded"""
+    texts = [(getattr(content, field), weight) for field, weight in FIELD_WEIGHTS.items()]
+    if content.studio_id:
+        texts.append((content.studio.name, STUDIO_WEIGHT))
+
+    weights = {}
+    for text, weight in texts:
+        for token in set(tokenize(text)):
+            weights[token] = weights.get(token, 0) + weight
+    return weights
+
+
+def index_contents(content_ids):
+    """(Re)build the tokens of the given contents"""
+    content_ids = list(content_ids)
+    for start in range(0, len(content_ids), INDEX_BATCH_SIZE):
+        chunk = content_ids[start:start + INDEX_BATCH_SIZE]
+        rows = [
+            SearchToken(token=token, content_id=content.id, weight=weight)
+            for content in Content.objects.filter(id__in=chunk).select_related('studio')
+            .only('id', 'studio__name', *FIELD_WEIGHTS)
+            for token, weight in content_tokens(content).items()
+        ]
+        with transaction.atomic():
+            SearchToken.objects.filter(content_id__in=chunk).delete()
+            # ignore_conflicts: a case-insensitive collation may still see two tokens as one
+            SearchToken.objects.bulk_create(rows, batch_size=INDEX_BATCH_SIZE, ignore_conflicts=True)
+
+
+def rebuild_index(batch_size=INDEX_BATCH_SIZE):
+    """Index every content, returns the number of contents indexed"""
+    total = 0
+    last_id = 0
+    while True:
+        ids = list(
+            Content.objects.filter(id__gt=last_id).order_by('id').values_list('id', flat=True)[:batch_size]
+        )
+        if not ids:
+            return total
+        index_contents(ids)
+        total += len(ids)
+        last_id = ids[-1]
+
+
+def search_matches(query, content_type=None):
+    """
+    Contents matching every word of `query` (each as a token prefix, so
+    results follow the user while typing), as `content_id` / `score` rows
+    ordered by relevance then views. Returns None for a query without words.
+    """
+    tokens = list(dict.fromkeys(tokenize(query)))[:MAX_QUERY_TOKENS]
+    if not tokens:
+        return None
+
+    any_token = Q()
+    for token in tokens:
+        any_token |= Q(token__startswith=token)
+    matches = SearchToken.objects.filter(any_token)
+    if content_type:
+        matches = matches.filter(content__content_type=content_type)
+
+    # One flag per query word, a content must match all of them
+    flags = {
+        f'word_{i}': Max(Case(When(token__startswith=token, then=1), default=0, output_field=IntegerField()))
+        for i, token in enumerate(tokens)
+    }
+    return (
+        matches.values('content_id')
+        .annotate(score=Sum('weight'), **flags)
+        .filter(**{name: 1 for name in flags})
+        .order_by('-score', '-content__views', 'content_id')
+    )
+
+
+def filter_by_search(queryset, query, content_type=None, field='content_id'):
+    """Rows of `queryset` whose content matches `query`, `field` points to the content id"""
+    matches = search_matches(query, content_type)
+    if matches is None:
+        return queryset.none()
+    return queryset.filter(**{f'{field}__in': matches.values('content_id')})
+
+
+def search_counts(matches):
+    """Totals of a search per content type, in one query"""
+    return Content.objects.filter(id__in=matches.values('content_id')).aggregate(
+        movies=Count('id', filter=Q(content_type='movie')),
+        series=Count('id', filter=Q(content_type='series')),
+    )
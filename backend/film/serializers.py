@@ -339,7 +339,8 @@ class CareerPersonSerializer(serializers.ModelSerializer):
 class SeriesDetailSerializer(serializers.ModelSerializer):
     """Serializer for detailed series view with full metadata"""
     content = ContentDetailSerializer(read_only=True)
-    seasons = SeasonDetailSerializer(many=True, read_only=True)
+    # Season rows only, their episodes are listed once in `episodes`
+    seasons = SeasonSerializer(many=True, read_only=True)
     episodes = serializers.SerializerMethodField()
     
     class Meta:
@@ -347,16 +348,9 @@ class SeriesDetailSerializer(serializers.ModelSerializer):
         fields = '__all__'
     
     def get_episodes(self, obj):
-        """Get all episodes from all seasons of this series"""
-        all_episodes = []
-        for season in obj.seasons.all():
-            episodes = season.episodes.all().order_by('order')
-            for episode in episodes:
-                episode_data = EpisodeSerializer(episode, context=self.context).data
-                episode_data['season_number'] = season.order
-                episode_data['season_name'] = season.season_name
-                all_episodes.append(episode_data)
-        return all_episodes
+        """Get all episodes from all seasons of this series (single query)"""
+        from film.episodes import load_series_episodes
+        return load_series_episodes(obj.pk, request=self.context.get('request'))
 
 class ViewSessionSerializer(serializers.ModelSerializer):
     class Meta:
@@ -377,3 +371,25 @@ class UpdateViewDurationSerializer(serializers.Serializer):
             raise serializers.ValidationError("Cannot provide both content_id and episode_id")
         return data
 
+
+class HeartbeatEventSerializer(serializers.Serializer):
+    """One event of a batched heartbeat, the target is content_id, episode_id or content_id + season/episode numbers"""
+    session_id = serializers.CharField(max_length=255)
+    duration_seconds = serializers.IntegerField(min_value=0)
+    content_id = serializers.IntegerField(required=False)
+    episode_id = serializers.IntegerField(required=False)
+    season_number = serializers.IntegerField(required=False)
+    episode_number = serializers.IntegerField(required=False)
+    
+    def validate(self, data):
+        has_episode_number = data.get('season_number') is not None or data.get('episode_number') is not None
+        if not data.get('content_id') and not data.get('episode_id'):
+            raise serializers.ValidationError("Either content_id or episode_id must be provided")
+        if data.get('content_id') and data.get('episode_id'):
+            raise serializers.ValidationError("Cannot provide both content_id and episode_id")
+        if has_episode_number:
+            if not data.get('content_id'):
+                raise serializers.ValidationError("season_number and episode_number require content_id")
+            if data.get('season_number') is None or data.get('episode_number') is None:
+                raise serializers.ValidationError("season_number and episode_number must be provided together")
+        return data
@@ -0,0 +1,124 @@
+"""
+Signal handlers that keep derived catalog data in sync with the database.
+"""
+from django.db.models.signals import post_init, post_save, post_delete, pre_delete
+from django.dispatch import Signal, receiver
+
+from film.models import (
+    Content, Movie, Series, Studio, Genre, Tag, Nation, Language, Person,
+    ContentGenre, ContentTag, ContentNation, ContentLanguage, ContentPerson
+)
+from film.counts import invalidate_counts
+from film.documents import schedule_document_rebuild, schedule_document_rebuilds, delete_content_document
+from film.search import INDEXED_FIELDS, index_contents
+from film.suggest import SUGGEST_FIELDS, record_suggest_change
+
+# Sent by bulk writers that bypass post_save (film.importer), with `content_ids`
+contents_bulk_saved = Signal()
+
+
+@receiver([post_save, post_delete], sender=Content)
+@receiver([post_save, post_delete], sender=Movie)
+@receiver([post_save, post_delete], sender=Series)
+@receiver([post_save, post_delete], sender=ContentGenre)
+def invalidate_catalog_counts(sender, **kwargs):
+    """Any change to catalog rows can change list totals"""
+    invalidate_counts()
+
+
+@receiver(post_init, sender=Content)
+def remember_loaded_slug(sender, instance, **kwargs):
+    """Keep the slug the row was loaded with, documents are stored by slug"""
+    instance._loaded_slug = instance.slug
+
+
+@receiver(post_save, sender=Content)
+def rebuild_document_on_content_save(sender, instance, **kwargs):
+    loaded_slug = getattr(instance, '_loaded_slug', None)
+    if loaded_slug and loaded_slug != instance.slug:
+        delete_content_document(loaded_slug)
+    instance._loaded_slug = instance.slug
+    schedule_document_rebuild(instance.pk)
+
+
+@receiver(post_delete, sender=Content)
+def delete_document_on_content_delete(sender, instance, **kwargs):
+    delete_content_document(instance.slug)
+
+
+@receiver([post_save, post_delete], sender=Movie)
+@receiver([post_save, post_delete], sender=Series)
+@receiver([post_save, post_delete], sender=ContentGenre)
+@receiver([post_save, post_delete], sender=ContentTag)
+@receiver([post_save, post_delete], sender=ContentNation)
+@receiver([post_save, post_delete], sender=ContentLanguage)
+@receiver([post_save, post_delete], sender=ContentPerson)
+def rebuild_document_on_related_change(sender, instance, **kwargs):
+    """Join rows and movie/series rows are part of the content document"""
+    schedule_document_rebuild(instance.content_id)
+
+
+@receiver(post_save, sender=Studio)
+def rebuild_studio_documents(sender, instance, created=False, **kwargs):
+    """Studio, genre... names are rendered into the documents of their contents"""
+    if not created:
+        schedule_document_rebuilds(instance.contents.values_list('id', flat=True))
+
+
+@receiver(post_save, sender=Genre)
+@receiver(post_save, sender=Tag)
+@receiver(post_save, sender=Nation)
+@receiver(post_save, sender=Language)
+def rebuild_linked_documents(sender, instance, created=False, **kwargs):
+    if not created:
+        schedule_document_rebuilds(instance.contents.values_list('content_id', flat=True))
+
+
+@receiver(post_save, sender=Person)
+def rebuild_person_documents(sender, instance, created=False, **kwargs):
+    if not created:
+        schedule_document_rebuilds(instance.works.values_list('content_id', flat=True))
+
+
+@receiver(post_save, sender=Content)
+def index_content_on_save(sender, instance, update_fields=None, **kwargs):
+    """Search tokens only depend on the text fields and the studio"""
+    if update_fields is not None and not set(update_fields) & INDEXED_FIELDS:
+        return
+    index_contents([instance.pk])
+
+
+@receiver(post_save, sender=Content)
+def publish_suggest_change_on_save(sender, instance, update_fields=None, **kwargs):
+    if update_fields is not None and not set(update_fields) & set(SUGGEST_FIELDS):
+        return
+    record_suggest_change(instance.pk)
+
+
+@receiver(post_delete, sender=Content)
+def publish_suggest_change_on_delete(sender, instance, **kwargs):
+    record_suggest_change(instance.pk)
+
+
+@receiver(post_save, sender=Studio)
+def index_studio_contents_on_save(sender, instance, created=False, update_fields=None, **kwargs):
+    """The studio name is part of the tokens of its contents"""
+    if created or (update_fields is not None and 'name' not in update_fields):
+        return
+    index_contents(instance.contents.values_list('id', flat=True))
+
+
+@receiver(pre_delete, sender=Studio)
+def remember_studio_contents(sender, instance, **kwargs):
+    """Contents lose their studio with an UPDATE (SET_NULL), which sends no signal"""
+    instance._content_ids = list(instance.contents.values_list('id', flat=True))
+
+
+@receiver(post_delete, sender=Studio)
+def index_studio_contents_on_delete(sender, instance, **kwargs):
+    index_contents(getattr(instance, '_content_ids', []))
+
+
+@receiver(post_delete, sender=Studio)
+def rebuild_studio_documents_on_delete(sender, instance, **kwargs):
+    schedule_document_rebuilds(getattr(instance, '_content_ids', []))
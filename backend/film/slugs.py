@@ -0,0 +1,71 @@
+"""
+Unique slug allocation for Content (and any model with a unique `slug`).
+
+Content.save used to probe `slug`, `slug-1`, `slug-2`, ... with one EXISTS
+query per collision, which adds up for common titles and bulk imports. Here
+every slug that can collide with a base (`base` itself or `base-N`) is read
+with one query, the first free suffix is picked in memory, and a batch of
+titles shares the same query.
+
+The allocation is only a guess under concurrent inserts: the unique index
+stays the source of truth and callers retry on IntegrityError (see
+Content.save and film.importer).
+"""
+import re
+
+from django.db.models import Q
+from django.utils.text import slugify
+
+BASE_SLUG_MAX_LENGTH = 250  # room for a "-N" suffix
+DEFAULT_SLUG = 'content'
+LOOKUP_CHUNK_SIZE = 100  # bases per query, keeps the OR list short
+
+
+def base_slug(title):
+    return slugify(title)[:BASE_SLUG_MAX_LENGTH].strip('-') or DEFAULT_SLUG
+
+
+def taken_slugs(model, bases):
+    """
+    Existing slugs equal to one of `bases` or of the form `base-N`, one query per
+    chunk. Only numeric suffixes match, `base-` alone would also load every
+    longer title that starts with the base (`the-*` for "The").
+    """
+    bases = sorted(set(bases))
+    taken = set()
+    for start in range(0, len(bases), LOOKUP_CHUNK_SIZE):
+        condition = Q()
+        for base in bases[start:start + LOOKUP_CHUNK_SIZE]:
+            condition |= Q(slug=base) | Q(slug__regex=rf'^{re.escape(base)}-[0-9]+$')
+        taken.update(model.objects.filter(condition).values_list('slug', flat=True))
+    return taken
+
+
+def next_free_slug(base, taken):
+    """`base` or `base-N` with the smallest N that is not taken, reserved in `taken`"""
+    slug, counter = base, 1
+    while slug in taken:
+        slug = f'{base}-{counter}'
+        counter += 1
+    taken.add(slug)
+    return slug
+
+
+def allocate_slugs(model, titles):
+    """Unique slugs for `titles`, in order, also unique among themselves"""
+    bases = [base_slug(title) for title in titles]
+    taken = taken_slugs(model, bases)
+    return [next_free_slug(base, taken) for base in bases]
+
+
+def allocate_slug(model, title):
+    return allocate_slugs(model, [title])[0]
+
+
+def is_slug_conflict(model, slug, exclude_pk=None):
+    """Whether an IntegrityError on save was caused by another row owning `slug`"""
+    rows = model.objects.filter(slug=slug)
+    if exclude_pk is not None:
+        rows = rows.exclude(pk=exclude_pk)
+    return rows.exists()
+
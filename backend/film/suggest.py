@@ -0,0 +1,213 @@
+"""
+In-process prefix index for the search box suggestions (search/suggest/).
+
+The search box used to call CombinedSearchAPIView on every keystroke, which
+serializes full Movie/Series objects. Suggestions only need id, slug, title
+and poster, so every worker keeps them in memory with a sorted list of
+(key, content id) entries: a lookup is a bisect to the first key starting
+with the typed prefix and a scan of the following entries, ranked by views,
+without touching the database.
+
+Keys are the folded words (see film.search.fold) of the title, original
+title and slug, from every word on, so "piece" and "one pi" both reach
+"One Piece". The ranking of a prefix is kept once computed (short prefixes
+match a large part of the catalog, and the same prefixes are typed by every
+user) until a change touches one of its keys.
+
+Workers converge through a version number in the cache. Every content change
+bumps it and stores the changed content id under the new version; workers
+compare versions at most every SYNC_INTERVAL seconds and reload only the
+changed contents, or rebuild everything when they are too far behind, when
+an entry has expired, or when invalidate_suggestions() was called (bulk
+imports, purges). View counters are written without signals, so the index
+is also rebuilt every REBUILD_INTERVAL seconds to keep the ranking fresh.
+"""
+import bisect
+import heapq
+import threading
+import time
+
+from django.core.cache import cache
+from django.db import transaction
+
+from film.models import Content
+from film.search import tokenize
+
+SUGGEST_VERSION_KEY = 'suggest_index_version'
+SUGGEST_CHANGE_TIMEOUT = 60 * 60  # 1 hour, workers further behind rebuild
+SYNC_INTERVAL = 1.0  # seconds between two version checks of a worker
+REBUILD_INTERVAL = 10 * 60  # 10 minutes
+MAX_CHANGE_REPLAY = 200  # versions replayed one by one before a full rebuild
+RANKING_CACHE_SIZE = 10000  # prefixes, the cache is emptied when full
+MAX_SUGGESTIONS = 20
+MAX_KEY_WORDS = 8
+
+# Content fields shown or indexed by the suggestions
+SUGGEST_FIELDS = ('id', 'title', 'original_title', 'slug', 'poster_img_url', 'views')
+
+
+def suggest_change_key(version):
+    return f'suggest_index_change:{version}'
+
+
+def get_suggest_version():
+    version = cache.get(SUGGEST_VERSION_KEY)
+    if version is None:
+        version = 1
+        cache.add(SUGGEST_VERSION_KEY, version, None)
+    return version
+
+
+def _bump_suggest_version():
+    try:
+        return cache.incr(SUGGEST_VERSION_KEY)
+    except ValueError:
+        # Key missing (evicted or never set), workers rebuild on the fresh version
+        cache.set(SUGGEST_VERSION_KEY, 2, None)
+        return 2
+
+
+def record_suggest_change(content_id):
+    """Publish a changed (or deleted) content to every worker, once the transaction commits"""
+    def _publish():
+        version = _bump_suggest_version()
+        cache.set(suggest_change_key(version), content_id, SUGGEST_CHANGE_TIMEOUT)
+
+    transaction.on_commit(_publish)
+
+
+def invalidate_suggestions():
+    """Make every worker rebuild its index, for changes made without signals"""
+    # The new version has no change entry, which forces a rebuild
+    transaction.on_commit(_bump_suggest_version)
+
+
+def suggestion_keys(content):
+    """Folded keys of a content, one per word of its title, original title and slug"""
+    keys = set()
+    for text in (content.title, content.original_title, content.slug.replace('-', ' ')):
+        words = tokenize(text)[:MAX_KEY_WORDS]
+        keys.update(' '.join(words[start:]) for start in range(len(words)))
+    return keys
+
+
+class PrefixIndex:
+    """Sorted (key, content id) entries and the suggestion of every content"""
+
+    def __init__(self, contents=(), version=0):
+        self.version = version
+        self.built_at = time.monotonic()
+        self.items = {}
+        self.keys = {}
+        self.entries = []
+        self.top = {}
+        self.lock = threading.Lock()
+        for content in contents:
+            self.entries.extend((key, content.id) for key in self._add(content))
+        self.entries.sort()
+
+    def _add(self, content):
+        """Store the suggestion of a content, returns its keys"""
+        self.items[content.id] = {
+            'id': content.id,
+            'slug': content.slug,
+            'title': content.title,
+            'poster_img_url': content.poster_img_url,
+            'views': content.views,
+        }
+        self.keys[content.id] = suggestion_keys(content)
+        return self.keys[content.id]
+
+    def _remove(self, content_id):
+        self.items.pop(content_id, None)
+        for key in self.keys.pop(content_id, ()):
+            position = bisect.bisect_left(self.entries, (key, content_id))
+            if position < len(self.entries) and self.entries[position] == (key, content_id):
+                del self.entries[position]
+
+    def refresh(self, content_ids, version):
+        """Reload the given contents from the database, the missing ones are removed"""
+        contents = list(Content.objects.filter(id__in=content_ids).only(*SUGGEST_FIELDS))
+        with self.lock:
+            touched = set()
+            for content_id in content_ids:
+                touched.update(self.keys.get(content_id, ()))
+                self._remove(content_id)
+            for content in contents:
+                for key in self._add(content):
+                    touched.add(key)
+                    bisect.insort(self.entries, (key, content.id))
+            # Rankings that may include the touched keys are recomputed on use
+            for key in touched:
+                for length in range(1, len(key) + 1):
+                    self.top.pop(key[:length], None)
+            self.version = version
+
+    def _rank(self, prefix):
+        """Ids of the contents with a key starting with `prefix`, most viewed first"""
+        matches = set()
+        position = bisect.bisect_left(self.entries, (prefix,))
+        while position < len(self.entries) and self.entries[position][0].startswith(prefix):
+            matches.add(self.entries[position][1])
+            position += 1
+        return heapq.nlargest(
+            MAX_SUGGESTIONS, matches, key=lambda content_id: (self.items[content_id]['views'], -content_id)
+        )
+
+    def lookup(self, query, limit=MAX_SUGGESTIONS):
+        """Suggestions (id, slug, title, poster_img_url) for what the user typed"""
+        prefix = ' '.join(tokenize(query))
+        if not prefix:
+            return []
+        with self.lock:
+            ranked = self.top.get(prefix)
+            if ranked is None:
+                if len(self.top) >= RANKING_CACHE_SIZE:
+                    self.top.clear()
+                ranked = self.top[prefix] = self._rank(prefix)
+            return [
+                {name: value for name, value in self.items[content_id].items() if name != 'views'}
+                for content_id in ranked[:limit]
+            ]
+
+
+_index = None
+_checked_at = 0.0
+_sync_lock = threading.Lock()
+
+
+def build_suggest_index(version):
+    contents = Content.objects.only(*SUGGEST_FIELDS).iterator(chunk_size=2000)
+    return PrefixIndex(contents, version)
+
+
+def get_suggest_index():
+    """The index of this worker, synced with the cached version at most every SYNC_INTERVAL"""
+    global _index, _checked_at
+
+    now = time.monotonic()
+    if _index is not None and now - _checked_at < SYNC_INTERVAL:
+        return _index
+
+    with _sync_lock:
+        if _index is not None and time.monotonic() - _checked_at < SYNC_INTERVAL:
+            return _index
+
+        version = get_suggest_version()
+        index = _index
+        if (
+            index is None
+            or version < index.version
+            or version - index.version > MAX_CHANGE_REPLAY
+            or now - index.built_at > REBUILD_INTERVAL
+        ):
+            # Version read first: changes made while building are replayed on the next sync
+            _index = build_suggest_index(version)
+        elif version > index.version:
+            changes = cache.get_many([suggest_change_key(v) for v in range(index.version + 1, version + 1)])
+            if len(changes) < version - index.version:
+                _index = build_suggest_index(version)
+            else:
+                index.refresh(set(changes.values()), version)
+        _checked_at = time.monotonic()
+        return _index
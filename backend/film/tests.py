@@ -1,3 +1,702 @@
-from django.test import TestCase
+import datetime
+import importlib
+import json
+import os
+import shutil
+import tempfile
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.apps import apps
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test import RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from film import view_counter
+from film.counts import count_cache_key, normalize_count_filters
+from film.documents import get_content_document, schedule_document_rebuild
+from film.importer import CatalogImporter, new_item
+from film.management.commands.clean_old_data import Command as CleanOldDataCommand
+from film.models import Content, ContentGenre, Episode, Genre, Movie, SearchToken, Season, Series, Studio, ViewSession
+from film.search import fold, search_matches, tokenize
+from film.serializers import SeriesDetailSerializer
+from film.slugs import allocate_slugs, taken_slugs
+from film.suggest import PrefixIndex
+
+
+def create_movie(title, **fields):
+    fields = dict({'description': 'd', 'banner_img_url': '/media/x.jpg'}, **fields)
+    content = Content.objects.create(
+        title=title, content_type='movie', release_date=datetime.date(2020, 1, 1), **fields
+    )
+    Movie.objects.create(content=content, duration=90)
+    return content
+
+
+class FakeRedisHashes:
+    """The hash and key commands used by the view counter flush and marker seeding"""
+
+    def __init__(self, data):
+        self.data = {key: {k.encode(): v.encode() for k, v in values.items()} for key, values in data.items()}
+
+    def exists(self, key):
+        return int(key in self.data)
+
+    def rename(self, key, new_key):
+        if key not in self.data:
+            raise KeyError('no such key')
+        self.data[new_key] = self.data.pop(key)
+
+    def hgetall(self, key):
+        return dict(self.data.get(key, {}))
+
+    def delete(self, *keys):
+        for key in keys:
+            self.data.pop(key, None)
+
+    def set(self, key, value, nx=False, ex=None):
+        if nx and key in self.data:
+            return None
+        self.data[key] = value
+        return True
+
+    def pipeline(self, transaction=True):
+        return FakePipeline(self)
+
+
+class FakePipeline:
+    """Queues commands and runs them on execute()"""
+
+    def __init__(self, redis):
+        self.redis, self.commands = redis, []
+
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: self.commands.append((getattr(self.redis, name), args, kwargs))
+
+    def execute(self):
+        return [command(*args, **kwargs) for command, args, kwargs in self.commands]
+
+
+class CacheTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.request = RequestFactory().get('/')
+
+    def committed(self):
+        """Run the on_commit work of the block, TestCase never commits"""
+        return self.captureOnCommitCallbacks(execute=True)
+
+
+class CursorPaginationTests(CacheTestCase):
+    def setUp(self):
+        super().setUp()
+        # Equal view counts, the primary key breaks the ties
+        self.contents = [create_movie(f'Movie {i}', views=i % 2) for i in range(5)]
+
+    def walk(self, **params):
+        ids, previous = [], None
+        response = self.client.get('/api/v1/film/movies/', dict(params, pagination='cursor', limit=2))
+        while True:
+            self.assertEqual(response.status_code, 200)
+            page = response.json()
+            ids.extend(item['content']['id'] for item in page['results'])
+            previous = page['previous']
+            if not page['next']:
+                return ids, previous
+            response = self.client.get('/api/v1/film/movies/', dict(params, cursor=page['next'], limit=2))
+
+    def test_pages_cover_every_row_once_in_order(self):
+        ids, previous = self.walk(ordering='-views')
+
+        expected = sorted(self.contents, key=lambda content: (-content.views, -content.id))
+        self.assertEqual(ids, [content.id for content in expected])
+        self.assertIsNotNone(previous)
+
+    def test_previous_cursor_returns_the_page_before(self):
+        first = self.client.get('/api/v1/film/movies/', {'pagination': 'cursor', 'limit': 2}).json()
+        second = self.client.get('/api/v1/film/movies/', {'cursor': first['next'], 'limit': 2}).json()
+        back = self.client.get('/api/v1/film/movies/', {'cursor': second['previous'], 'limit': 2}).json()
+
+        self.assertEqual(back['results'], first['results'])
+
+    def test_bad_cursor_is_rejected(self):
+        response = self.client.get('/api/v1/film/movies/', {'cursor': 'not-a-cursor'})
+
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('error', response.json())
+
+    def test_unsupported_ordering_is_rejected(self):
+        response = self.client.get('/api/v1/film/contents/', {'pagination': 'cursor', 'ordering': 'title'})
+
+        self.assertEqual(response.status_code, 400)
+
+
+class CatalogCountTests(CacheTestCase):
+    def setUp(self):
+        super().setUp()
+        for i in range(3):
+            create_movie(f'Movie {i}')
+
+    def count(self, **params):
+        response = self.client.get('/api/v1/film/movies/', dict(params, limit=1))
+        self.assertEqual(response.status_code, 200)
+        return response.json()['count']
+
+    def test_count_is_cached_until_the_catalog_changes(self):
+        self.assertEqual(self.count(), 3)
+        # Written without signals: the cached total is still served
+        Content.objects.bulk_create([Content(
+            title='Hidden', slug='hidden', content_type='movie', release_date=datetime.date(2020, 1, 1),
+            description='d', banner_img_url='/media/x.jpg'
+        )])
+        Movie.objects.bulk_create([Movie(content=Content.objects.get(slug='hidden'), duration=90)])
+        self.assertEqual(self.count(), 3)
+
+        create_movie('Movie 3')
+        self.assertEqual(self.count(), 5)
+
+    def test_cached_count_is_reused_for_every_page_and_ordering(self):
+        self.count(ordering='-views')
+        with mock.patch('film.counts.cache.set') as cache_set:
+            self.assertEqual(self.count(offset=2, ordering='release_date'), 3)
+        cache_set.assert_not_called()
+
+    def test_filters_are_normalized_in_the_cache_key(self):
+        self.assertEqual(
+            count_cache_key('movies', normalize_count_filters({'search': '  Movie  ONE ', 'limit': '5'})),
+            count_cache_key('movies', normalize_count_filters({'search': 'movie one'})),
+        )
+
+
+def create_series(title, seasons=2, episodes=3):
+    content = Content.objects.create(
+        title=title, content_type='series', release_date=datetime.date(2021, 1, 1),
+        description='d', banner_img_url='/media/x.jpg'
+    )
+    series = Series.objects.create(content=content)
+    # Created out of order, the loader sorts by season then episode number
+    for season_order in range(seasons, 0, -1):
+        season = Season.objects.create(
+            series=series, order=season_order, season_name=f'S{season_order}',
+            release_date=datetime.date(2021, 1, 1), description='x', banner_img_url=''
+        )
+        for episode_order in range(episodes, 0, -1):
+            Episode.objects.create(
+                season=season, order=episode_order, title=f'E{episode_order}',
+                description='x', banner_img_url='', duration=24
+            )
+    return content
+
+
+class SeriesEpisodesTests(CacheTestCase):
+    def episodes(self, slug, **params):
+        response = self.client.get(f'/api/v1/film/series/{slug}/episodes/', params)
+        self.assertEqual(response.status_code, 200)
+        if response.streaming:
+            return json.loads(b''.join(response.streaming_content))
+        return response.json()
+
+    def test_episodes_come_in_playback_order(self):
+        content = create_series('Show')
+
+        episodes = self.episodes(content.slug)
+
+        self.assertEqual(
+            [(episode['season_number'], episode['order']) for episode in episodes],
+            [(1, 1), (1, 2), (1, 3), (2, 1), (2, 2), (2, 3)]
+        )
+
+    def test_window_and_streaming_return_the_same_rows(self):
+        content = create_series('Show')
+
+        window = self.episodes(content.slug, season=2, **{'from': 2, 'to': 3})
+
+        self.assertEqual([(episode['season_number'], episode['order']) for episode in window], [(2, 2), (2, 3)])
+        self.assertEqual(self.episodes(content.slug, season=2, stream='true', **{'from': 2, 'to': 3}), window)
+
+    def test_query_count_does_not_grow_with_the_episodes(self):
+        small = create_series('Small', seasons=1, episodes=1)
+        large = create_series('Large', seasons=4, episodes=10)
+
+        counts = []
+        for slug in (small.slug, large.slug):
+            with CaptureQueriesContext(connection) as queries:
+                self.client.get(f'/api/v1/film/series/{slug}/')
+                self.client.get(f'/api/v1/film/series/{slug}/episodes/')
+            counts.append(len(queries))
+
+        self.assertEqual(counts[0], counts[1])
+
+    def test_series_detail_serializer_does_not_query_per_season(self):
+        counts = []
+        for content in (create_series('Small', seasons=1, episodes=1), create_series('Large', seasons=4, episodes=10)):
+            series = Series.objects.select_related('content').get(content=content)
+            with CaptureQueriesContext(connection) as queries:
+                data = SeriesDetailSerializer(series, context={'request': self.request}).data
+            counts.append(len(queries))
+
+        self.assertEqual(counts[0], counts[1])
+        self.assertEqual(len(data['seasons']), 4)
+        self.assertNotIn('episodes', data['seasons'][0])
+        self.assertEqual(len(data['episodes']), 40)
+
+    def test_bad_window_is_rejected(self):
+        content = create_series('Show')
+
+        response = self.client.get(f'/api/v1/film/series/{content.slug}/episodes/', {'season': 'x'})
+
+        self.assertEqual(response.status_code, 400)
+
+
+class ViewCounterTests(CacheTestCase):
+    def test_counted_view_rebuilds_the_cached_document(self):
+        with self.committed():
+            content = create_movie('Movie', views=3)
+        self.assertEqual(get_content_document(content.slug, self.request)['content']['views'], 3)
+
+        with mock.patch.object(view_counter, 'get_redis', return_value=None), self.committed():
+            view_counter.record_heartbeat('s1', 90, content_id=content.id)
+
+        self.assertEqual(get_content_document(content.slug, self.request)['content']['views'], 4)
+
+    def test_flush_writes_buffered_views_and_sessions(self):
+        with self.committed():
+            content = create_movie('Movie', views=3)
+        field = view_counter.session_field('s1', content_id=content.id)
+        redis = FakeRedisHashes({
+            view_counter.PENDING_KEYS['content']: {str(content.id): '2'},
+            view_counter.PENDING_KEYS['sessions']: {field: '90'},
+            view_counter.PENDING_KEYS['counted']: {field: '1'},
+        })
+
+        with mock.patch.object(view_counter, 'get_redis', return_value=redis), self.committed():
+            result = view_counter.flush_pending_views()
+
+        self.assertEqual(result, {'contents': 1, 'episodes': 0, 'sessions': 1})
+        self.assertEqual(Content.objects.get(pk=content.pk).views, 5)
+        session = ViewSession.objects.get(session_id='s1')
+        self.assertEqual((session.content_id, session.watch_duration, session.view_counted), (content.id, 90, True))
+        self.assertEqual(redis.data, {})
+        self.assertEqual(get_content_document(content.slug, self.request)['content']['views'], 5)
+
+    def test_sessions_counted_in_the_database_are_not_counted_again(self):
+        content = create_movie('Movie')
+        ViewSession.objects.create(session_id='s1', content=content, watch_duration=120, view_counted=True)
+        ViewSession.objects.create(session_id='s2', content=content, watch_duration=30)
+        redis = FakeRedisHashes({})
+
+        view_counter._seed_counted_markers(redis, [
+            {'session_id': session_id, 'content_id': content.id, 'duration_seconds': duration}
+            for session_id, duration in (('s1', 90), ('s2', 90), ('s3', 30))
+        ])
+
+        marker = view_counter.COUNTED_MARKER_PREFIX + view_counter.session_field('s1', content_id=content.id)
+        self.assertEqual(list(redis.data), [marker])
+
+
+class BatchHeartbeatTests(CacheTestCase):
+    def setUp(self):
+        super().setUp()
+        patcher = mock.patch.object(view_counter, 'get_redis', return_value=None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.content = create_movie('Movie')
+
+    def post(self, events):
+        return self.client.post('/api/v1/film/track-view/batch/', {'events': events}, content_type='application/json')
+
+    def test_each_event_gets_its_own_result(self):
+        response = self.post([
+            {'session_id': 's1', 'content_id': self.content.id, 'duration_seconds': 30},
+            {'session_id': 's1', 'content_id': self.content.id, 'duration_seconds': 90},
+            {'session_id': 's2', 'content_id': 987654, 'duration_seconds': 90},
+            {'session_id': 's3', 'duration_seconds': 90},
+        ])
+
+        self.assertEqual(response.status_code, 200)
+        results = response.json()['results']
+        self.assertEqual([result['success'] for result in results], [True, True, False, False])
+        self.assertEqual([result.get('view_counted') for result in results[:2]], [False, True])
+        self.assertEqual(Content.objects.get(pk=self.content.pk).views, 1)
+        self.assertEqual(ViewSession.objects.get(session_id='s1').watch_duration, 90)
+
+    def test_a_session_is_counted_once(self):
+        for _ in range(2):
+            self.post([{'session_id': 's1', 'content_id': self.content.id, 'duration_seconds': 120}])
+
+        self.assertEqual(Content.objects.get(pk=self.content.pk).views, 1)
+
+    def test_empty_or_oversized_batches_are_rejected(self):
+        event = {'session_id': 's1', 'content_id': self.content.id, 'duration_seconds': 1}
+
+        self.assertEqual(self.post([]).status_code, 400)
+        self.assertEqual(self.post([event] * (view_counter.MAX_HEARTBEAT_BATCH + 1)).status_code, 400)
+
+
+class ContentDocumentTests(CacheTestCase):
+    def test_document_is_rebuilt_after_a_rolled_back_savepoint(self):
+        with self.committed():
+            content = create_movie('Movie')
+        get_content_document(content.slug, self.request)
+
+        with self.committed():
+            try:
+                with transaction.atomic():
+                    Content.objects.filter(pk=content.pk).update(title='Rolled back')
+                    schedule_document_rebuild(content.pk)
+                    raise RuntimeError
+            except RuntimeError:
+                pass
+            content.title = 'Renamed'
+            content.save()
+
+        self.assertEqual(get_content_document(content.slug, self.request)['content']['title'], 'Renamed')
+
+    def test_genre_rename_rebuilds_the_documents_of_its_contents(self):
+        with self.committed():
+            content = create_movie('Movie')
+            genre = Genre.objects.create(name='Action', slug='action')
+            ContentGenre.objects.create(content=content, genre=genre)
+        get_content_document(content.slug, self.request)
+
+        with self.committed():
+            genre.name = 'Hành động'
+            genre.save()
+
+        genres = get_content_document(content.slug, self.request)['content']['genres']
+        self.assertIn('Hành động', str(genres))
+
+
+class SlugAllocationTests(TestCase):
+    def test_batch_takes_the_first_free_suffixes_in_one_query(self):
+        for slug in ('movie', 'movie-1', 'movie-3', 'movie-night'):
+            create_movie(slug, slug=slug)
+
+        with self.assertNumQueries(1):
+            slugs = allocate_slugs(Content, ['Movie', 'Movie', 'Movie Night', 'Khác'])
+
+        self.assertEqual(slugs, ['movie-2', 'movie-4', 'movie-night-1', 'khac'])
+
+    def test_only_numeric_suffixes_are_loaded(self):
+        for slug in ('the', 'the-2', 'the-matrix', 'the-2nd-act'):
+            create_movie(slug, slug=slug)
+
+        self.assertEqual(taken_slugs(Content, ['the']), {'the', 'the-2'})
+
+    def test_save_retries_when_the_slug_was_taken_meanwhile(self):
+        create_movie('Movie')
+
+        with mock.patch('film.models.allocate_slug', side_effect=['movie', 'movie-1']):
+            content = create_movie('Movie')
+
+        self.assertEqual(content.slug, 'movie-1')
+
+
+class CatalogImportTests(TestCase):
+    def setUp(self):
+        self.data_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.data_dir, ignore_errors=True)
+
+    def write_metadata(self, directory, metadata):
+        path = os.path.join(self.data_dir, directory, 'metadata.json')
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w') as f:
+            json.dump(metadata, f)
+
+    def run_import(self, **options):
+        output = StringIO()
+        with tempfile.TemporaryDirectory() as media_root, override_settings(MEDIA_ROOT=media_root):
+            call_command('import_crawled_data', data_dir=self.data_dir, stdout=output, **options)
+        return output.getvalue()
+
+    def test_batch_shares_reference_rows_and_slugs_stay_unique(self):
+        self.write_metadata('movies/m0', {'title': 'Movie', 'genres': ['Action']})
+        self.write_metadata('movies/m1', {'title': 'Movie', 'genres': ['action', 'Drama']})
+        self.write_metadata('series/s0', {'title': 'Show', 'genres': ['Drama']})
+        self.write_metadata('series/s0/season_1/episode_1', {'title': 'Pilot'})
+        self.write_metadata('series/s0/season_1/episode_3', {'title': 'Finale'})
+
+        self.run_import(complete_episodes=True)
+
+        self.assertEqual(sorted(Genre.objects.values_list('name', flat=True)), ['Action', 'Drama'])
+        self.assertEqual(sorted(Content.objects.values_list('slug', flat=True)), ['movie', 'movie-1', 'show'])
+        self.assertEqual(ContentGenre.objects.count(), 4)
+        season = Season.objects.get()
+        self.assertEqual(season.num_episodes, 3)
+        self.assertEqual(list(season.episodes.order_by('order').values_list('order', flat=True)),
+                         [1, 2, 3])
+
+    def test_failing_item_is_skipped_without_its_batch(self):
+        command = BaseCommand(stdout=StringIO())
+        importer = CatalogImporter(command)
+        content = {'title': 'Movie', 'content_type': 'movie', 'release_date': datetime.date(2020, 1, 1)}
+        for source, fields in (('good', content), ('bad', dict(content, unknown_field=1))):
+            importer.add(new_item(source, fields, movie={'duration': 90}))
+
+        importer.finish()
+
+        self.assertEqual(list(Content.objects.values_list('title', flat=True)), ['Movie'])
+        self.assertEqual((importer.stats['movies'], importer.stats['errors']), (1, 1))
+        self.assertIn('Error processing bad', command.stdout.getvalue())
+
+    def test_worker_pool_imports_the_same_catalog(self):
+        for index in range(6):
+            self.write_metadata(f'movies/m{index}', {'title': f'Movie {index % 2}', 'genres': [f'G{index % 3}']})
+        os.makedirs(os.path.join(self.data_dir, 'movies', 'broken'))
+        with open(os.path.join(self.data_dir, 'movies', 'broken', 'metadata.json'), 'w') as f:
+            f.write('{')
+
+        def imported():
+            return list(Content.objects.order_by('id').values_list(
+                'title', 'slug', 'content_genres__genre__name'
+            ))
+
+        self.run_import()
+        sequential = imported()
+        Content.objects.all().delete()
+        output = self.run_import(workers=4, batch_size=2)
+
+        self.assertEqual(len(sequential), 6)
+        self.assertEqual(imported(), sequential)
+        self.assertIn('Error processing movie broken', output)
+
+
+class IncrementalImportTests(TestCase):
+    def setUp(self):
+        self.data_dir = tempfile.mkdtemp()
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.data_dir, ignore_errors=True)
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+
+    def write_movie(self, metadata):
+        path = os.path.join(self.data_dir, 'movies', 'm0', 'metadata.json')
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w') as f:
+            json.dump(metadata, f)
+
+    def run_import(self):
+        with override_settings(MEDIA_ROOT=self.media_root):
+            call_command('import_crawled_data', data_dir=self.data_dir, incremental=True, stdout=StringIO())
+
+    def test_changed_title_is_updated_in_place(self):
+        self.write_movie({'title': 'Movie', 'year': 2010, 'genres': ['Action', 'Drama']})
+        self.run_import()
+        self.write_movie({'title': 'Movie', 'year': 2011, 'genres': ['Action', 'Comedy']})
+        self.run_import()
+
+        content = Content.objects.get()
+        self.assertEqual(content.release_date.year, 2011)
+        self.assertEqual(
+            sorted(content.content_genres.values_list('genre__name', flat=True)), ['Action', 'Comedy']
+        )
+
+    def test_unchanged_title_is_skipped(self):
+        self.write_movie({'title': 'Movie', 'year': 2010, 'genres': ['Action']})
+        self.run_import()
+        Content.objects.update(views=7)
+        self.run_import()
+
+        self.assertEqual(Content.objects.get().views, 7)
+        self.assertEqual(Content.objects.count(), 1)
+
+
+class SearchIndexTests(TestCase):
+    def matched_ids(self, query, content_type=None):
+        return [match['content_id'] for match in search_matches(query, content_type)]
+
+    def test_every_word_must_match_a_token_prefix(self):
+        night = create_movie('Night Train')
+        create_movie('Night Shift')
+
+        self.assertEqual(self.matched_ids('nig tra'), [night.id])
+        self.assertEqual(self.matched_ids('train night'), [night.id])
+        self.assertEqual(self.matched_ids('rain'), [])
+        self.assertIsNone(search_matches('  ?! '))
+
+    def test_title_matches_rank_before_description_then_views(self):
+        in_description = create_movie('Other', description='a dragon story', views=100)
+        quiet = create_movie('Dragon', views=1)
+        popular = create_movie('Dragon Returns', views=50)
+
+        self.assertEqual(self.matched_ids('dragon'), [popular.id, quiet.id, in_description.id])
+
+    def test_edited_title_is_reindexed(self):
+        content = create_movie('Old Name')
+        content.title = 'New Name'
+        content.save(update_fields=['title'])
+
+        self.assertEqual(self.matched_ids('old'), [])
+        self.assertEqual(self.matched_ids('new'), [content.id])
+
+    def test_combined_search_pages_in_relevance_order(self):
+        series = create_series('Dragon Saga', seasons=1, episodes=1)
+        movie = create_movie('Dragon', views=10)
+        create_movie('Unrelated')
+
+        response = self.client.get('/api/v1/film/search/combined/', {'search': 'dragon', 'limit': 1})
+
+        data = response.json()
+        self.assertEqual((data['count'], data['total_movies'], data['total_series']), (2, 1, 1))
+        self.assertEqual([result['content']['id'] for result in data['results']], [movie.id])
+        response = self.client.get('/api/v1/film/search/combined/', {'search': 'dragon', 'offset': 1})
+        self.assertEqual([result['content']['id'] for result in response.json()['results']], [series.id])
+
+    def test_combined_search_requires_a_query(self):
+        response = self.client.get('/api/v1/film/search/combined/', {'search': ' '})
+
+        self.assertEqual(response.status_code, 400)
+
+    def test_migration_indexes_existing_contents(self):
+        content = create_movie('Night Train')
+        SearchToken.objects.all().delete()
+
+        migration = importlib.import_module('film.migrations.0006_index_existing_contents')
+        migration.index_existing_contents(apps, None)
+
+        self.assertEqual(self.matched_ids('train'), [content.id])
+
+
+class SearchFoldingTests(TestCase):
+    def test_accents_and_case_are_folded(self):
+        self.assertEqual(fold('Hành Động'), 'hanh dong')
+        self.assertEqual(tokenize('Đảo Hải Tặc: Ørsted!'), ['dao', 'hai', 'tac', 'orsted'])
+        # Kana voicing marks are part of the letter
+        self.assertEqual(fold('ガ'), 'ガ')
+
+    def test_unaccented_query_finds_accented_title(self):
+        content = create_movie('Hành Động Mạnh')
+
+        self.assertEqual([match['content_id'] for match in search_matches('hanh dong')], [content.id])
+        self.assertEqual([match['content_id'] for match in search_matches('HÀNH')], [content.id])
+
+    def test_other_titles_and_studio_are_searchable(self):
+        studio = Studio.objects.create(name='MAPPA', slug='mappa')
+        content = create_movie(
+            'Đại Chiến Titan', original_title='Shingeki no Kyojin', aliases='Attack on Titan', studio=studio
+        )
+        for query in ('shingeki', 'attack', 'mappa'):
+            self.assertEqual([match['content_id'] for match in search_matches(query)], [content.id], query)
+
+        studio.name = 'Wit Studio'
+        studio.save()
+
+        self.assertEqual(list(search_matches('mappa')), [])
+        self.assertEqual([match['content_id'] for match in search_matches('wit')], [content.id])
+
+    def test_migration_replaces_tokens_indexed_before_folding(self):
+        studio = Studio.objects.create(name='MAPPA', slug='mappa')
+        content = create_movie('Hành Động', aliases='Action Story', studio=studio)
+        SearchToken.objects.all().delete()
+        SearchToken.objects.create(token='hành', content=content, weight=10)
+
+        migration = importlib.import_module('film.migrations.0006_index_existing_contents')
+        migration.index_existing_contents(apps, None)
+
+        self.assertFalse(SearchToken.objects.filter(token='hành').exists())
+        for query in ('hanh', 'action', 'mappa'):
+            self.assertEqual([match['content_id'] for match in search_matches(query)], [content.id], query)
+
+
+class SuggestIndexTests(CacheTestCase):
+    def setUp(self):
+        super().setUp()
+        # A fresh index per test, synced with the cache on every request
+        for name, value in (('_index', None), ('SYNC_INTERVAL', 0)):
+            patcher = mock.patch(f'film.suggest.{name}', value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def titles(self, index, query, **kwargs):
+        return [suggestion['title'] for suggestion in index.lookup(query, **kwargs)]
+
+    def suggest(self, query):
+        response = self.client.get('/api/v1/film/search/suggest/', {'search': query})
+        return [suggestion['title'] for suggestion in response.json()['results']]
+
+    def test_any_word_is_matched_by_prefix_most_viewed_first(self):
+        contents = [
+            create_movie('One Piece', views=5),
+            create_movie('Piece of Cake', views=9),
+            create_movie('Đảo Hải Tặc', original_title='One Piece Film', views=1),
+        ]
+        index = PrefixIndex(contents)
+
+        self.assertEqual(self.titles(index, 'piece'), ['Piece of Cake', 'One Piece', 'Đảo Hải Tặc'])
+        self.assertEqual(self.titles(index, 'ONE pi'), ['One Piece', 'Đảo Hải Tặc'])
+        self.assertEqual(self.titles(index, 'dao hai'), ['Đảo Hải Tặc'])
+        self.assertEqual(self.titles(index, 'piece', limit=1), ['Piece of Cake'])
+        self.assertEqual(index.lookup(' - '), [])
+
+    def test_refresh_replaces_changed_and_removes_deleted_contents(self):
+        kept, renamed, deleted = (create_movie(title) for title in ('Dune', 'Dungeon', 'Dunkirk'))
+        index = PrefixIndex([kept, renamed, deleted])
+        self.assertEqual(len(index.lookup('dun')), 3)
+
+        Content.objects.filter(pk=renamed.pk).update(title='Castle', slug='castle')
+        Content.objects.filter(pk=deleted.pk).delete()
+        index.refresh({renamed.id, deleted.id}, version=2)
+
+        self.assertEqual(self.titles(index, 'dun'), ['Dune'])
+        self.assertEqual(self.titles(index, 'cas'), ['Castle'])
+        self.assertEqual(index.version, 2)
+
+    def test_endpoint_follows_committed_changes(self):
+        with self.committed():
+            content = create_movie('Naruto')
+        self.assertEqual(self.suggest('nar'), ['Naruto'])
+
+        with self.committed():
+            content.title = 'Naruto Shippuden'
+            content.save()
+
+        self.assertEqual(self.suggest('naruto shi'), ['Naruto Shippuden'])
+
+
+class CleanOldDataTests(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        for i in range(3):
+            content = create_movie(f'Movie {i}')
+            ContentGenre.objects.create(content=content, genre=Genre.objects.get_or_create(name='Action', slug='action')[0])
+
+    def purge(self, **options):
+        with override_settings(MEDIA_ROOT=self.media_root):
+            call_command('clean_old_data', confirm=True, stdout=StringIO(), **options)
+        self.assertFalse(SearchToken.objects.exists())
+        self.assertFalse(Content.objects.exists())
+        self.assertFalse(Genre.objects.exists())
+
+    def test_default_purge(self):
+        self.assertTrue(SearchToken.objects.exists())
+        self.purge()
+
+    def test_chunked_purge(self):
+        self.purge(chunked=True, chunk_size=2)
+
+    def test_truncate_purge(self):
+        self.purge(truncate=True)
+
+    def test_interrupted_chunked_purge_resumes(self):
+        with mock.patch.object(CleanOldDataCommand, 'drop_content_documents', side_effect=RuntimeError('killed')):
+            with self.assertRaises(RuntimeError):
+                call_command('clean_old_data', confirm=True, chunked=True, chunk_size=2, stdout=StringIO())
+        self.assertFalse(Movie.objects.exists())
+        self.assertEqual(Content.objects.count(), 3)
+
+        self.purge(chunked=True, chunk_size=2)
+
+    def test_media_entries_are_removed_except_placeholders(self):
+        for name in ('banner/default.jpg', 'banner/0123.jpg', 'videos/video_1/source.mp4'):
+            path = os.path.join(self.media_root, name)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            open(path, 'wb').close()
+
+        self.purge()
+
+        self.assertEqual(os.listdir(os.path.join(self.media_root, 'banner')), ['default.jpg'])
+        self.assertEqual(os.listdir(os.path.join(self.media_root, 'videos')), [])
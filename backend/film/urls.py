@@ -20,6 +20,7 @@ urlpatterns = [
     path('episodes/<int:pk>/', EpisodeRetrieveUpdateAPIView.as_view(), name='episode_detail'),
     path('series/<int:content_id>/seasons/<int:season_number>/episodes/<int:episode_number>/video/', EpisodeVideoAPIView.as_view(), name='episode_video'),
     path('track-view/', UpdateViewDurationAPIView.as_view(), name='track_view'),
+    path('track-view/batch/', BatchTrackViewAPIView.as_view(), name='track_view_batch'),
     path('track-episode-view/', TrackEpisodeViewAPIView.as_view(), name='track_episode_view'),
     path('tags/', TagListCreateAPIView.as_view(), name='tag_browse'),
     path('nations/', NationListCreateAPIView.as_view(), name='nation_browse'),
@@ -28,5 +29,6 @@ urlpatterns = [
     path('movies/browse/genre/', BrowseMoviesByGenreView.as_view(), name='movie_browse'),
     path('series/similar/', SimilarSeriesAPIView.as_view(), name='similar_series'),
     path('search/combined/', CombinedSearchAPIView.as_view(), name='combined_search'),
+    path('search/suggest/', SearchSuggestAPIView.as_view(), name='search_suggest'),
     path('', include(router.urls)),
 ]
@@ -1,23 +1,8 @@
-import os
-from django.conf import settings
 import json
-import uuid
+from video.blobs import store_image
 def save_img(file):
-    directory = os.path.join(settings.MEDIA_ROOT, 'banner')
-    os.makedirs(directory, exist_ok=True)
-    
-    filename, ext = os.path.splitext(file.name)
-    path = os.path.join(directory, file.name)
-    
-    while os.path.exists(path):
-        new_filename = f"{filename}_{uuid.uuid4().hex[:8]}{ext}"
-        path = os.path.join(directory, new_filename)
-    
-    with open(path, 'wb+') as destination:
-        for chunk in file.chunks():
-            destination.write(chunk)
-    
-    return path.replace(f"{settings.MEDIA_ROOT}/", settings.MEDIA_URL)
+    """Store an uploaded image under media/banner/, identical images share one file"""
+    return store_image(file)
 def ensure_list_int(value):
     """Parse JSON and make sure the value is list[int]"""
     try:
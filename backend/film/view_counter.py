@@ -0,0 +1,446 @@
+"""
+Redis-buffered view counting.
+
+Every counted view used to run `F('views') + 1` UPDATEs on the Content and
+Episode rows, and every heartbeat did a ViewSession get_or_create. During a
+popular release thousands of viewers hit the same few Content rows and the
+row locks serialize those writes.
+
+Heartbeats now only touch Redis:
+  - session durations are kept (max) in a hash,
+  - the "counted after 60 seconds" decision is a SET NX marker, seeded from
+    ViewSession.view_counted when it is missing,
+  - view increments are HINCRBY on per-kind hashes.
+The `flush_view_counts` management command periodically moves the buffered
+increments into MySQL with batched CASE updates and upserts the ViewSession
+rows. Reads add the not-yet-flushed deltas so counters stay fresh.
+
+When the cache is not Redis (e.g. local development) everything falls back to
+writing ViewSession rows and counters directly, with the same 60 second rule
+as ViewSession.update_view_duration.
+"""
+import logging
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, Q, Value, When
+from django.utils import timezone
+
+from film.documents import schedule_document_rebuild
+from film.models import Content, Episode, ViewSession
+
+logger = logging.getLogger(__name__)
+
+VIEW_THRESHOLD_SECONDS = 60
+COUNTED_MARKER_TTL = 30 * 24 * 60 * 60  # 30 days
+FLUSH_BATCH_SIZE = 500
+MAX_HEARTBEAT_BATCH = 200
+
+PENDING_KEYS = {
+    'content': 'views:pending:content',
+    'episode': 'views:pending:episode',
+    'sessions': 'views:pending:sessions',
+    'counted': 'views:pending:counted',
+}
+FLUSHING_SUFFIX = ':flushing'
+COUNTED_MARKER_PREFIX = 'views:counted:'
+
+# KEYS: sessions, counted, content deltas, episode deltas, counted marker
+# ARGV: session field, duration, threshold, content id, episode id, series content id, marker ttl
+HEARTBEAT_SCRIPT = """
+local current = tonumber(redis.call('HGET', KEYS[1], ARGV[1]) or '-1')
+local duration = tonumber(ARGV[2])
+if duration > current then
+    redis.call('HSET', KEYS[1], ARGV[1], duration)
+end
+if duration < tonumber(ARGV[3]) then
+    return {0, redis.call('EXISTS', KEYS[5])}
+end
+if not redis.call('SET', KEYS[5], 1, 'NX', 'EX', ARGV[7]) then
+    return {0, 1}
+end
+redis.call('HSET', KEYS[2], ARGV[1], 1)
+if ARGV[4] ~= '' then redis.call('HINCRBY', KEYS[3], ARGV[4], 1) end
+if ARGV[5] ~= '' then redis.call('HINCRBY', KEYS[4], ARGV[5], 1) end
+if ARGV[6] ~= '' then redis.call('HINCRBY', KEYS[3], ARGV[6], 1) end
+return {1, 1}
+"""
+
+
+def get_redis():
+    """Raw Redis client behind the default cache, None when the cache is not Redis"""
+    if not getattr(settings, 'VIEW_COUNT_BUFFER_ENABLED', True):
+        return None
+    try:
+        from django_redis import get_redis_connection
+        return get_redis_connection('default')
+    except (ImportError, NotImplementedError):
+        return None
+
+
+def session_field(session_id, content_id=None, episode_id=None):
+    return f"{session_id}|{content_id or ''}|{episode_id or ''}"
+
+
+def parse_session_field(field):
+    session_id, content_id, episode_id = field.rsplit('|', 2)
+    return session_id, int(content_id) if content_id else None, int(episode_id) if episode_id else None
+
+
+def _decode(value):
+    return value.decode() if isinstance(value, bytes) else value
+
+
+def _heartbeat_args(event):
+    field = session_field(event['session_id'], event.get('content_id'), event.get('episode_id'))
+    return (
+        HEARTBEAT_SCRIPT, 5,
+        PENDING_KEYS['sessions'], PENDING_KEYS['counted'],
+        PENDING_KEYS['content'], PENDING_KEYS['episode'],
+        COUNTED_MARKER_PREFIX + field,
+        field, int(event['duration_seconds']), VIEW_THRESHOLD_SECONDS,
+        event.get('content_id') or '', event.get('episode_id') or '',
+        event.get('series_content_id') or '',
+        COUNTED_MARKER_TTL,
+    )
+
+
+def record_heartbeat(session_id, duration_seconds, content_id=None, episode_id=None, series_content_id=None):
+    """
+    Record one player heartbeat.
+
+    Returns (view_counted, newly_counted). For episodes, `series_content_id` is
+    the series Content that also gets the view.
+    """
+    return record_heartbeats([{
+        'session_id': session_id,
+        'duration_seconds': duration_seconds,
+        'content_id': content_id,
+        'episode_id': episode_id,
+        'series_content_id': series_content_id,
+    }])[0]
+
+
+def record_heartbeats(events):
+    """
+    Record many heartbeats in one round trip (plus one EXISTS round trip for
+    the heartbeats past the threshold).
+
+    `events` are dicts with session_id, duration_seconds and either content_id
+    or episode_id (+ series_content_id). Events are applied in order, so
+    repeated heartbeats of one session inside a batch behave like separate
+    calls. Returns one (view_counted, newly_counted) tuple per event.
+    """
+    if not events:
+        return []
+    redis_client = get_redis()
+    if redis_client is None:
+        return _record_heartbeats_direct(events)
+
+    _seed_counted_markers(redis_client, events)
+    pipe = redis_client.pipeline(transaction=False)
+    for event in events:
+        pipe.eval(*_heartbeat_args(event))
+    return [(bool(view_counted), bool(newly_counted)) for newly_counted, view_counted in pipe.execute()]
+
+
+def _seed_counted_markers(redis_client, events):
+    """
+    Set the counted marker of sessions the database already counted.
+
+    Markers only exist for views counted through Redis in the last
+    COUNTED_MARKER_TTL, a session counted before the buffer was enabled or
+    whose marker expired would otherwise be counted again. The database is
+    only read for the markers that are missing.
+    """
+    fields = list(dict.fromkeys(
+        session_field(e['session_id'], e.get('content_id'), e.get('episode_id'))
+        for e in events if int(e['duration_seconds']) >= VIEW_THRESHOLD_SECONDS
+    ))
+    if not fields:
+        return
+    pipe = redis_client.pipeline(transaction=False)
+    for field in fields:
+        pipe.exists(COUNTED_MARKER_PREFIX + field)
+    missing = [field for field, exists in zip(fields, pipe.execute()) if not exists]
+    if not missing:
+        return
+
+    counted = {
+        session_field(*key) for key in ViewSession.objects.filter(
+            session_id__in={parse_session_field(field)[0] for field in missing}, view_counted=True
+        ).values_list('session_id', 'content_id', 'episode_id')
+    }
+    to_seed = [field for field in missing if field in counted]
+    if not to_seed:
+        return
+    pipe = redis_client.pipeline(transaction=False)
+    for field in to_seed:
+        pipe.set(COUNTED_MARKER_PREFIX + field, 1, nx=True, ex=COUNTED_MARKER_TTL)
+    pipe.execute()
+
+
+def _record_heartbeats_direct(events):
+    """Unbuffered path: ViewSession rows and counters are written right away, in bulk"""
+    keys = [(e['session_id'], e.get('content_id'), e.get('episode_id')) for e in events]
+    existing = {
+        (vs.session_id, vs.content_id, vs.episode_id): vs
+        for vs in ViewSession.objects.filter(session_id__in={key[0] for key in keys})
+    }
+    created, touched = {}, {}
+    content_deltas, episode_deltas = {}, {}
+    results = []
+    for event, key in zip(events, keys):
+        view_session = existing.get(key) or created.get(key)
+        if key in existing:
+            touched[key] = view_session
+        elif view_session is None:
+            session_id, content_id, episode_id = key
+            view_session = created[key] = ViewSession(
+                session_id=session_id, content_id=content_id, episode_id=episode_id, watch_duration=0
+            )
+        duration = int(event['duration_seconds'])
+        view_session.watch_duration = max(view_session.watch_duration, duration)
+        newly_counted = duration >= VIEW_THRESHOLD_SECONDS and not view_session.view_counted
+        if newly_counted:
+            view_session.view_counted = True
+            if view_session.content_id:
+                content_deltas[view_session.content_id] = content_deltas.get(view_session.content_id, 0) + 1
+            else:
+                episode_deltas[view_session.episode_id] = episode_deltas.get(view_session.episode_id, 0) + 1
+                series_content_id = event.get('series_content_id')
+                if series_content_id:
+                    content_deltas[series_content_id] = content_deltas.get(series_content_id, 0) + 1
+        results.append((view_session.view_counted, newly_counted))
+
+    now = timezone.now()
+    for view_session in touched.values():
+        view_session.updated_at = now
+    with transaction.atomic():
+        if touched:
+            ViewSession.objects.bulk_update(list(touched.values()), ['watch_duration', 'view_counted', 'updated_at'])
+        if created:
+            ViewSession.objects.bulk_create(list(created.values()), ignore_conflicts=True)
+        _bulk_increment_views(Content, content_deltas, FLUSH_BATCH_SIZE)
+        _bulk_increment_views(Episode, episode_deltas, FLUSH_BATCH_SIZE)
+    return results
+
+
+def resolve_heartbeat_targets(events):
+    """
+    Resolve the targets of heartbeat events with one query per target kind.
+
+    Events may point at a content (`content_id`), an episode (`episode_id`) or
+    an episode of a series by number (`content_id` + `season_number` +
+    `episode_number`). Returns a list aligned with `events` holding
+    {'content_id', 'episode_id', 'series_content_id'} or None when the target
+    does not exist.
+    """
+    content_ids = {e['content_id'] for e in events if e.get('content_id') and e.get('season_number') is None}
+    episode_ids = {e['episode_id'] for e in events if e.get('episode_id')}
+    numbered = {
+        (e['content_id'], e['season_number'], e['episode_number'])
+        for e in events if e.get('content_id') and e.get('season_number') is not None
+    }
+
+    found_contents = set()
+    if content_ids:
+        found_contents = set(Content.objects.filter(id__in=content_ids).values_list('id', flat=True))
+
+    found_episodes = {}
+    if episode_ids:
+        found_episodes = dict(Episode.objects.filter(id__in=episode_ids).values_list(
+            'id', 'season__series__content_id'
+        ))
+
+    found_numbered = {}
+    if numbered:
+        condition = Q()
+        for content_id, season_number, episode_number in numbered:
+            condition |= Q(season__series__content_id=content_id, season__order=season_number, order=episode_number)
+        for row in Episode.objects.filter(condition).values(
+            'id', 'season__series__content_id', 'season__order', 'order'
+        ):
+            key = (row['season__series__content_id'], row['season__order'], row['order'])
+            found_numbered[key] = row['id']
+
+    targets = []
+    for e in events:
+        if e.get('episode_id'):
+            target = None if e['episode_id'] not in found_episodes else {
+                'content_id': None, 'episode_id': e['episode_id'],
+                'series_content_id': found_episodes[e['episode_id']],
+            }
+        elif e.get('season_number') is not None:
+            episode_id = found_numbered.get((e['content_id'], e['season_number'], e['episode_number']))
+            target = None if episode_id is None else {
+                'content_id': None, 'episode_id': episode_id, 'series_content_id': e['content_id'],
+            }
+        else:
+            target = None if e['content_id'] not in found_contents else {
+                'content_id': e['content_id'], 'episode_id': None, 'series_content_id': None,
+            }
+        targets.append(target)
+    return targets
+
+
+def pending_view_deltas(kind, ids):
+    """Buffered increments not yet flushed, as {id: delta}"""
+    ids = [i for i in ids if i is not None]
+    redis_client = get_redis()
+    if redis_client is None or not ids:
+        return {}
+    key = PENDING_KEYS[kind]
+    pipe = redis_client.pipeline(transaction=False)
+    pipe.hmget(key, ids)
+    pipe.hmget(key + FLUSHING_SUFFIX, ids)
+    pending, flushing = pipe.execute()
+    deltas = {}
+    for object_id, a, b in zip(ids, pending, flushing):
+        delta = int(a or 0) + int(b or 0)
+        if delta:
+            deltas[object_id] = delta
+    return deltas
+
+
+def merge_pending_views(items, kind='content'):
+    """Add pending deltas to serialized dicts that have `id` and `views`"""
+    items = [item for item in items if item]
+    try:
+        deltas = pending_view_deltas(kind, [item.get('id') for item in items])
+    except Exception as e:
+        # Counters are only slightly stale without the deltas, never fail the read
+        logger.warning(f"Could not read pending view deltas: {e}")
+        return
+    for item in items:
+        delta = deltas.get(item.get('id'))
+        if delta and item.get('views') is not None:
+            item['views'] += delta
+
+
+def _take_snapshot(redis_client, key):
+    """
+    Move a pending hash aside and return its contents.
+
+    A leftover `:flushing` hash (a flush that crashed half-way) is processed
+    again before new data is taken.
+    """
+    flushing_key = key + FLUSHING_SUFFIX
+    if not redis_client.exists(flushing_key):
+        try:
+            redis_client.rename(key, flushing_key)
+        except Exception:
+            # RENAME fails when nothing is pending
+            return flushing_key, {}
+    data = redis_client.hgetall(flushing_key)
+    return flushing_key, {_decode(k): _decode(v) for k, v in data.items()}
+
+
+def _batches(items, size):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def _bulk_increment_views(model, deltas, batch_size):
+    """One UPDATE ... SET views = views + CASE id WHEN ... per batch, in pk order"""
+    items = sorted((int(pk), int(delta)) for pk, delta in deltas.items())
+    for batch in _batches(items, batch_size):
+        whens = [When(pk=pk, then=Value(delta)) for pk, delta in batch]
+        model.objects.filter(pk__in=[pk for pk, _ in batch]).update(
+            views=F('views') + Case(*whens, default=Value(0), output_field=IntegerField())
+        )
+    if model is Content:
+        # The UPDATE sends no signals, cached detail documents carry the view count
+        for pk, _ in items:
+            schedule_document_rebuild(pk)
+
+
+def _upsert_sessions(durations, counted, batch_size):
+    """Create or update ViewSession rows for every buffered session in bulk"""
+    fields = sorted(set(durations) | set(counted))
+    for batch in _batches(fields, batch_size):
+        parsed = {field: parse_session_field(field) for field in batch}
+        existing = {
+            (vs.session_id, vs.content_id, vs.episode_id): vs
+            for vs in ViewSession.objects.filter(
+                session_id__in={session_id for session_id, _, _ in parsed.values()}
+            )
+        }
+        to_update, to_create = [], []
+        now = timezone.now()
+        for field, key in parsed.items():
+            duration = int(durations.get(field, 0))
+            is_counted = field in counted
+            view_session = existing.get(key)
+            if view_session is None:
+                session_id, content_id, episode_id = key
+                to_create.append(ViewSession(
+                    session_id=session_id,
+                    content_id=content_id,
+                    episode_id=episode_id,
+                    watch_duration=duration,
+                    view_counted=is_counted,
+                ))
+            else:
+                view_session.watch_duration = max(view_session.watch_duration, duration)
+                view_session.view_counted = view_session.view_counted or is_counted
+                view_session.updated_at = now
+                to_update.append(view_session)
+        if to_update:
+            ViewSession.objects.bulk_update(to_update, ['watch_duration', 'view_counted', 'updated_at'])
+        if to_create:
+            ViewSession.objects.bulk_create(to_create, ignore_conflicts=True)
+
+
+def flush_pending_views(batch_size=FLUSH_BATCH_SIZE):
+    """
+    Write the buffered increments and sessions to the database.
+
+    Returns a dict with how many contents, episodes and sessions were written.
+    """
+    redis_client = get_redis()
+    if redis_client is None:
+        return {'contents': 0, 'episodes': 0, 'sessions': 0}
+
+    snapshots = {kind: _take_snapshot(redis_client, key) for kind, key in PENDING_KEYS.items()}
+    content_deltas = snapshots['content'][1]
+    episode_deltas = snapshots['episode'][1]
+    durations = snapshots['sessions'][1]
+    counted = snapshots['counted'][1]
+
+    # Sessions can point at rows deleted since the heartbeat
+    valid_contents = set(Content.objects.filter(
+        pk__in=[int(pk) for pk in content_deltas]
+    ).values_list('pk', flat=True))
+    valid_episodes = set(Episode.objects.filter(
+        pk__in=[int(pk) for pk in episode_deltas]
+    ).values_list('pk', flat=True))
+    session_targets = [parse_session_field(field) for field in set(durations) | set(counted)]
+    valid_contents |= set(Content.objects.filter(
+        pk__in={c for _, c, _ in session_targets if c}
+    ).values_list('pk', flat=True))
+    valid_episodes |= set(Episode.objects.filter(
+        pk__in={e for _, _, e in session_targets if e}
+    ).values_list('pk', flat=True))
+
+    def _is_valid(field):
+        _, content_id, episode_id = parse_session_field(field)
+        return (content_id in valid_contents) if content_id else (episode_id in valid_episodes)
+
+    content_deltas = {pk: d for pk, d in content_deltas.items() if int(pk) in valid_contents}
+    episode_deltas = {pk: d for pk, d in episode_deltas.items() if int(pk) in valid_episodes}
+    durations = {f: d for f, d in durations.items() if _is_valid(f)}
+    counted = {f: c for f, c in counted.items() if _is_valid(f)}
+
+    with transaction.atomic():
+        _bulk_increment_views(Content, content_deltas, batch_size)
+        _bulk_increment_views(Episode, episode_deltas, batch_size)
+        _upsert_sessions(durations, counted, batch_size)
+
+    redis_client.delete(*[flushing_key for flushing_key, _ in snapshots.values()])
+
+    return {
+        'contents': len(content_deltas),
+        'episodes': len(episode_deltas),
+        'sessions': len(set(durations) | set(counted)),
+    }
@@ -1,4 +1,5 @@
 from django.shortcuts import render
+from django.http import StreamingHttpResponse
 from django.core.cache import cache
 from django.db.models import Q, Count, Prefetch
 from rest_framework.views import APIView
@@ -9,7 +10,9 @@ from rest_framework.response import Response
 from rest_framework import status, viewsets
 from rest_framework.decorators import action
 from drf_yasg import openapi
-from video.serializers import VideoUploadSerializer, VideoSerializer
+from video.serializers import VideoUploadSerializer, VideoSerializer, VideoMetadataSerializer
+from video.jobs import latest_transcode_status
+from video.utils import demo_video_metadata
 from film.serializers import (
     GenreSerializer, TagSerializer, NationSerializer, PersonSerializer,
     ContentSerializer, MovieSerializer, SeriesSerializer, SeasonSerializer,
@@ -18,7 +21,7 @@ from film.serializers import (
     MovieGeneralInfoSerializer, MovieDetailSerializer, SeriesDetailSerializer,
     CreateSeasonSerializer, SeasonGeneralInfoSerializer, SeasonDetailSerializer, 
     CreateEpisodeSerializer, CareerPersonSerializer, ContentDetailSerializer,
-    UpdateViewDurationSerializer
+    UpdateViewDurationSerializer, HeartbeatEventSerializer
 )
 from rest_framework.exceptions import ValidationError
 from rest_framework.parsers import MultiPartParser, FormParser
@@ -26,6 +29,17 @@ import os
 import shutil
 from django.conf import settings
 from film.utils import save_img, ensure_list_int
+from video.blobs import discard_unreferenced_image
+from film.pagination import InvalidCursor, is_cursor_request, paginate_by_cursor
+from film.counts import get_catalog_count
+from film.documents import get_content_document
+from film.search import search_matches, search_counts, filter_by_search
+from film.suggest import get_suggest_index, MAX_SUGGESTIONS
+from film.episodes import parse_episode_window, load_series_episodes, stream_series_episodes
+from film.view_counter import (
+    record_heartbeat, record_heartbeats, resolve_heartbeat_targets, merge_pending_views,
+    MAX_HEARTBEAT_BATCH
+)
 from film.enums import CareerEnum
 import json
 from django.db import transaction
@@ -357,11 +371,8 @@ class MovieListCreateAPIView(APIView):
                 raise ValueError(movie_serializer.errors)
 
         except Exception as e:
-            banner_img_path = banner_img_path.lstrip("/")
-            banner_img_path = os.path.join(settings.BASE_DIR, banner_img_path)
-            if banner_img_path and os.path.exists(banner_img_path):
-
-                os.remove(banner_img_path)
+            # Deduplicated images already used elsewhere keep their file
+            discard_unreferenced_image(banner_img_path)
 
             # Xóa record video nếu đã tạo nhưng bị lỗi
             if video_instance:
@@ -379,11 +390,15 @@ class MovieListCreateAPIView(APIView):
         operation_summary="Get all movies",
         operation_description="Get all movies in the database with filtering, search, and pagination support",
         manual_parameters=[
-            openapi.Parameter('search', openapi.IN_QUERY, description="Search movies by title or description", type=openapi.TYPE_STRING),
+            openapi.Parameter('search', openapi.IN_QUERY, description="Search movies by title, other titles, studio or description (accents are ignored)", type=openapi.TYPE_STRING),
             openapi.Parameter('limit', openapi.IN_QUERY, description="Number of movies to return", type=openapi.TYPE_INTEGER),
             openapi.Parameter('offset', openapi.IN_QUERY, description="Offset for pagination", type=openapi.TYPE_INTEGER),
             openapi.Parameter('ordering', openapi.IN_QUERY, description="Order by field (e.g., -views, -release_date)", type=openapi.TYPE_STRING),
             openapi.Parameter('genre', openapi.IN_QUERY, description="Filter by genre ID", type=openapi.TYPE_INTEGER),
+            openapi.Parameter('exact_count', openapi.IN_QUERY, description="Set to false to accept an estimated total for unfiltered lists", type=openapi.TYPE_BOOLEAN),
+            openapi.Parameter('pagination', openapi.IN_QUERY, description="Set to 'cursor' to use keyset pagination instead of offset", type=openapi.TYPE_STRING, enum=['cursor']),
+            openapi.Parameter('cursor', openapi.IN_QUERY, description="Opaque cursor from a previous 'next'/'previous' field (implies cursor mode)", type=openapi.TYPE_STRING),
+            openapi.Parameter('include_count', openapi.IN_QUERY, description="Include the total count in cursor mode", type=openapi.TYPE_BOOLEAN),
         ],
         responses={200: MovieGeneralInfoSerializer(many=True), 403: openapi.Response(description="Permission denied"),}
     )
@@ -394,10 +409,7 @@ class MovieListCreateAPIView(APIView):
             # Apply search filtering
             search = request.query_params.get('search')
             if search:
-                queryset = queryset.filter(
-                    Q(content__title__icontains=search) |
-                    Q(content__description__icontains=search)
-                )
+                queryset = filter_by_search(queryset, search, content_type='movie')
             
             # Apply genre filtering
             genre = request.query_params.get('genre')
@@ -413,8 +425,21 @@ class MovieListCreateAPIView(APIView):
                 else:
                     queryset = queryset.order_by(f'content__{ordering}' if ordering in ['views', 'rating', 'release_date', 'created_at', 'updated_at'] else ordering)
             
+            # Keyset pagination (opt-in), skips the offset scan and the count
+            if is_cursor_request(request.query_params):
+                try:
+                    page = paginate_by_cursor(
+                        queryset, request.query_params, prefix='content__',
+                        count_fn=lambda: get_catalog_count(queryset, 'movies', request.query_params)[0]
+                    )
+                except InvalidCursor as e:
+                    return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+                page['results'] = MovieGeneralInfoSerializer(page['results'], many=True, context={'request': request}).data
+                merge_pending_views([item['content'] for item in page['results']])
+                return Response(page, status=status.HTTP_200_OK)
+
             # Count total results for pagination
-            total_count = queryset.count()
+            total_count, count_is_estimate = get_catalog_count(queryset, 'movies', request.query_params)
             
             # Apply offset and limit for pagination
             offset = request.query_params.get('offset', 0)
@@ -436,11 +461,15 @@ class MovieListCreateAPIView(APIView):
             # Prepare response data
             serializer = MovieGeneralInfoSerializer(results, many=True, context={'request': request})
             
+            merge_pending_views([item['content'] for item in serializer.data])
+            
             # Always return paginated response format for consistency
             response_data = {
                 'count': total_count,
                 'results': serializer.data
             }
+            if count_is_estimate:
+                response_data['count_is_estimate'] = True
             
             return Response(response_data, status=status.HTTP_200_OK)
         except Exception as e:
@@ -464,10 +493,7 @@ class SeriesListCreateAPIView(APIView):
             # Apply search filtering
             search = request.query_params.get('search')
             if search:
-                queryset = queryset.filter(
-                    Q(content__title__icontains=search) |
-                    Q(content__description__icontains=search)
-                )
+                queryset = filter_by_search(queryset, search, content_type='series')
             
             # Apply genre filtering
             genre = request.query_params.get('genre')
@@ -483,8 +509,21 @@ class SeriesListCreateAPIView(APIView):
                 else:
                     queryset = queryset.order_by(f'content__{ordering}' if ordering in ['views', 'rating', 'release_date', 'created_at', 'updated_at'] else ordering)
             
+            # Keyset pagination (opt-in), skips the offset scan and the count
+            if is_cursor_request(request.query_params):
+                try:
+                    page = paginate_by_cursor(
+                        queryset, request.query_params, prefix='content__',
+                        count_fn=lambda: get_catalog_count(queryset, 'series', request.query_params)[0]
+                    )
+                except InvalidCursor as e:
+                    return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+                page['results'] = SeriesSerializer(page['results'], many=True, context={'request': request}).data
+                merge_pending_views([item['content'] for item in page['results']])
+                return Response(page, status=status.HTTP_200_OK)
+
             # Count total results for pagination
-            total_count = queryset.count()
+            total_count, count_is_estimate = get_catalog_count(queryset, 'series', request.query_params)
             
             # Apply offset and limit for pagination
             offset = request.query_params.get('offset', 0)
@@ -506,11 +545,15 @@ class SeriesListCreateAPIView(APIView):
             # Prepare response data
             serializer = SeriesSerializer(results, many=True, context={'request': request})
             
+            merge_pending_views([item['content'] for item in serializer.data])
+            
             # Always return paginated response format for consistency
             response_data = {
                 'count': total_count,
                 'results': serializer.data
             }
+            if count_is_estimate:
+                response_data['count_is_estimate'] = True
             
             return Response(response_data, status=status.HTTP_200_OK)
         except Exception as e:
@@ -687,10 +730,8 @@ class SeasonCreateAPIView(APIView):
                 raise ValueError(season_serializer.errors)
 
         except Exception as e:
-            banner_img_path = banner_img_path.lstrip("/")
-            banner_img_path = os.path.join(settings.BASE_DIR, banner_img_path)
-            if banner_img_path and os.path.exists(banner_img_path):
-                os.remove(banner_img_path)
+            # Deduplicated images already used elsewhere keep their file
+            discard_unreferenced_image(banner_img_path)
 
             return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
         
@@ -750,11 +791,12 @@ class MovieRetrieveUpdateAPIView(APIView):
     )
     def get(self, request, slug):
         try:
-            # Get movie through content slug
-            content = get_object_or_404(Content, slug=slug, content_type='movie')
-            movie = get_object_or_404(Movie, content=content)
-            serializer = MovieDetailSerializer(movie, context={'request': request})
-            return Response(serializer.data, status=status.HTTP_200_OK)
+            # Served from the precomputed content document (one cache lookup)
+            document = get_content_document(slug, request)
+            if document is None or document['movie'] is None:
+                return Response({"error": "Movie not found"}, status=status.HTTP_404_NOT_FOUND)
+            merge_pending_views([document['movie']['content']])
+            return Response(document['movie'], status=status.HTTP_200_OK)
 
         except Exception as e:
             return Response(
@@ -866,11 +908,12 @@ class SeriesViewSet(viewsets.ModelViewSet):
         operation_summary="Retrieve all series",
         operation_description="Fetches a list of all available series with filtering, search, and pagination support.",
         manual_parameters=[
-            openapi.Parameter('search', openapi.IN_QUERY, description="Search series by title or description", type=openapi.TYPE_STRING),
+            openapi.Parameter('search', openapi.IN_QUERY, description="Search series by title, other titles, studio or description (accents are ignored)", type=openapi.TYPE_STRING),
             openapi.Parameter('limit', openapi.IN_QUERY, description="Number of series to return", type=openapi.TYPE_INTEGER),
             openapi.Parameter('offset', openapi.IN_QUERY, description="Offset for pagination", type=openapi.TYPE_INTEGER),
             openapi.Parameter('ordering', openapi.IN_QUERY, description="Order by field (e.g., -views, -release_date)", type=openapi.TYPE_STRING),
             openapi.Parameter('genre', openapi.IN_QUERY, description="Filter by genre ID", type=openapi.TYPE_INTEGER),
+            openapi.Parameter('exact_count', openapi.IN_QUERY, description="Set to false to accept an estimated total for unfiltered lists", type=openapi.TYPE_BOOLEAN),
         ],
         responses={
             200: openapi.Response(
@@ -885,10 +928,7 @@ class SeriesViewSet(viewsets.ModelViewSet):
         # Apply search filtering
         search = request.query_params.get('search')
         if search:
-            queryset = queryset.filter(
-                Q(content__title__icontains=search) |
-                Q(content__description__icontains=search)
-            )
+            queryset = filter_by_search(queryset, search, content_type='series')
         
         # Apply genre filtering
         genre = request.query_params.get('genre')
@@ -905,7 +945,7 @@ class SeriesViewSet(viewsets.ModelViewSet):
                 queryset = queryset.order_by(f'content__{ordering}' if ordering in ['views', 'rating', 'release_date', 'created_at', 'updated_at'] else ordering)
         
         # Count total results for pagination
-        total_count = queryset.count()
+        total_count, count_is_estimate = get_catalog_count(queryset, 'series', request.query_params)
         
         # Apply offset and limit for pagination
         offset = request.query_params.get('offset', 0)
@@ -927,11 +967,15 @@ class SeriesViewSet(viewsets.ModelViewSet):
         # Prepare response data
         serializer = self.get_serializer(results, many=True)
         
+        merge_pending_views([item['content'] for item in serializer.data])
+        
         # Always return paginated response format for consistency
         response_data = {
             'count': total_count,
             'results': serializer.data
         }
+        if count_is_estimate:
+            response_data['count_is_estimate'] = True
         
         return Response(response_data, status=status.HTTP_200_OK)
 
@@ -1071,6 +1115,12 @@ class SeriesViewSet(viewsets.ModelViewSet):
     @swagger_auto_schema(
         operation_summary="Get all episodes of a series",
         operation_description="Fetches all episodes from all seasons of a specific series, ordered by season and episode number.",
+        manual_parameters=[
+            openapi.Parameter('season', openapi.IN_QUERY, description="Only episodes of this season number", type=openapi.TYPE_INTEGER),
+            openapi.Parameter('from', openapi.IN_QUERY, description="First episode number to return (inclusive)", type=openapi.TYPE_INTEGER),
+            openapi.Parameter('to', openapi.IN_QUERY, description="Last episode number to return (inclusive)", type=openapi.TYPE_INTEGER),
+            openapi.Parameter('stream', openapi.IN_QUERY, description="Stream the JSON array as it is built", type=openapi.TYPE_BOOLEAN),
+        ],
         responses={
             200: openapi.Response(
                 description="List of episodes",
@@ -1084,20 +1134,24 @@ class SeriesViewSet(viewsets.ModelViewSet):
         """Get all episodes of a series"""
         try:
             series = self.get_object()
-            all_episodes = []
-            
-            # Get all seasons of this series ordered by season order
-            seasons = series.seasons.all().order_by('order')
-            
-            for season in seasons:
-                # Get all episodes of this season ordered by episode order
-                episodes = season.episodes.all().order_by('order')
-                for episode in episodes:
-                    episode_data = EpisodeSerializer(episode, context={'request': request}).data
-                    episode_data['season_number'] = season.order
-                    episode_data['season_name'] = season.season_name
-                    all_episodes.append(episode_data)
-            
+
+            try:
+                window = parse_episode_window(request.query_params)
+            except ValueError:
+                return Response(
+                    {"error": "season, from and to must be integers"},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+
+            # One query for all seasons, ordered by (season order, episode order)
+            if str(request.query_params.get('stream', '')).lower() in ('1', 'true', 'yes'):
+                return StreamingHttpResponse(
+                    stream_series_episodes(series.pk, request=request, **window),
+                    content_type='application/json'
+                )
+
+            all_episodes = load_series_episodes(series.pk, request=request, **window)
+            merge_pending_views(all_episodes, kind='episode')
             return Response(all_episodes, status=status.HTTP_200_OK)
             
         except Exception as e:
@@ -1243,10 +1297,8 @@ class EpisodeCreateAPIView(APIView):
                     return Response(episode_serializer.data, status=status.HTTP_201_CREATED)
                 return Response(episode_serializer.errors, status=status.HTTP_400_BAD_REQUEST)
         except Exception as e:
-            banner_img_path = banner_img_path.lstrip("/")
-            banner_img_path = os.path.join(settings.BASE_DIR, banner_img_path)
-            if banner_img_path and os.path.exists(banner_img_path):
-                os.remove(banner_img_path)
+            # Deduplicated images already used elsewhere keep their file
+            discard_unreferenced_image(banner_img_path)
             if video_instance:
                 # video_folder = os.path.dirname(video_instance.original_video_path)
                 # video_folder = video_folder.lstrip("/")
@@ -1475,6 +1527,35 @@ class ContentListAPIView(APIView):
                 required=False,
                 description="Offset for pagination (optional)"
             ),
+            openapi.Parameter(
+                name="pagination",
+                in_=openapi.IN_QUERY,
+                type=openapi.TYPE_STRING,
+                enum=["cursor"],
+                required=False,
+                description="Set to 'cursor' to use keyset pagination (optional)"
+            ),
+            openapi.Parameter(
+                name="cursor",
+                in_=openapi.IN_QUERY,
+                type=openapi.TYPE_STRING,
+                required=False,
+                description="Opaque cursor from a previous 'next'/'previous' field (optional)"
+            ),
+            openapi.Parameter(
+                name="ordering",
+                in_=openapi.IN_QUERY,
+                type=openapi.TYPE_STRING,
+                required=False,
+                description="Ordering for cursor mode, e.g. -created_at, -views (optional)"
+            ),
+            openapi.Parameter(
+                name="include_count",
+                in_=openapi.IN_QUERY,
+                type=openapi.TYPE_BOOLEAN,
+                required=False,
+                description="Include the total count in cursor mode (optional)"
+            ),
         ],
         responses={
             200: openapi.Response(
@@ -1501,6 +1582,16 @@ class ContentListAPIView(APIView):
             if status_filter:
                 queryset = queryset.filter(status=status_filter)
             
+            # Keyset pagination (opt-in), keeps the plain list response by default
+            if is_cursor_request(request.query_params):
+                try:
+                    page = paginate_by_cursor(queryset, request.query_params)
+                except InvalidCursor as e:
+                    return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+                page['results'] = ContentSerializer(page['results'], many=True, context={'request': request}).data
+                merge_pending_views(page['results'])
+                return Response(page, status=status.HTTP_200_OK)
+            
             # Apply pagination
             if offset:
                 queryset = queryset[int(offset):]
@@ -1509,6 +1600,7 @@ class ContentListAPIView(APIView):
             
             # Serialize and return
             serializer = ContentSerializer(queryset, many=True, context={'request': request})
+            merge_pending_views(serializer.data)
             return Response(serializer.data, status=status.HTTP_200_OK)
             
         except Exception as e:
@@ -1535,9 +1627,12 @@ class ContentDetailAPIView(APIView):
     )
     def get(self, request, slug):
         try:
-            content = get_object_or_404(Content, slug=slug)
-            serializer = ContentDetailSerializer(content, context={'request': request})
-            return Response(serializer.data, status=status.HTTP_200_OK)
+            # Served from the precomputed content document (one cache lookup)
+            document = get_content_document(slug, request)
+            if document is None:
+                return Response({"error": "Content not found"}, status=status.HTTP_404_NOT_FOUND)
+            merge_pending_views([document['content']])
+            return Response(document['content'], status=status.HTTP_200_OK)
             
         except Exception as e:
             return Response(
@@ -1839,7 +1934,7 @@ class CombinedSearchAPIView(APIView):
     
     @swagger_auto_schema(
         operation_summary="Search both movies and series",
-        operation_description="Searches both movies and series with a single query and returns combined results with pagination.",
+        operation_description="Searches both movies and series with a single query and returns combined results with pagination. Every word of the query must match the start of a word of the title, original title, other titles, studio or description, accents ignored; results are ranked by where the words match (title first), then by views.",
         manual_parameters=[
             openapi.Parameter('search', openapi.IN_QUERY, description="Search query for both movies and series", type=openapi.TYPE_STRING, required=True),
             openapi.Parameter('limit', openapi.IN_QUERY, description="Number of results to return per page", type=openapi.TYPE_INTEGER),
@@ -1873,54 +1968,43 @@ class CombinedSearchAPIView(APIView):
         offset = int(request.query_params.get('offset', 0))
         
         try:
-            # Search movies
-            movie_queryset = Movie.objects.select_related('content').filter(
-                Q(content__title__icontains=search_query) |
-                Q(content__description__icontains=search_query)
-            )
-            
-            # Search series  
-            series_queryset = Series.objects.select_related('content').filter(
-                Q(content__title__icontains=search_query) |
-                Q(content__description__icontains=search_query)
-            )
-            
-            # Get total counts
-            total_movies = movie_queryset.count()
-            total_series = series_queryset.count()
+            # Ranked and paginated in the search index, only the page is loaded
+            matches = search_matches(search_query)
+            if matches is None:
+                return Response({
+                    'count': 0,
+                    'results': [],
+                    'total_movies': 0,
+                    'total_series': 0
+                }, status=status.HTTP_200_OK)
+
+            counts = search_counts(matches)
+            total_movies = counts['movies']
+            total_series = counts['series']
             total_count = total_movies + total_series
-            
-            # Combine and sort by relevance (title match first, then description)
-            all_results = []
-            
+
+            page_ids = [match['content_id'] for match in matches[offset:offset + limit]]
+
+            movies = Movie.objects.select_related('content').filter(content_id__in=page_ids)
+            series_list = Series.objects.select_related('content').filter(content_id__in=page_ids)
+
+            results_by_id = {}
+
             # Add movies with content_type field
-            for movie in movie_queryset:
+            for movie in movies:
                 movie_data = MovieGeneralInfoSerializer(movie, context={'request': request}).data
                 movie_data['content_type'] = 'movie'
-                all_results.append(movie_data)
-            
+                results_by_id[movie.content_id] = movie_data
+
             # Add series with content_type field
-            for series in series_queryset:
+            for series in series_list:
                 series_data = SeriesSerializer(series, context={'request': request}).data
                 series_data['content_type'] = 'series'
-                all_results.append(series_data)
-            
-            # Sort by title relevance (exact matches first, then partial matches)
-            def sort_key(item):
-                title = item.get('content', {}).get('title', '').lower()
-                search_lower = search_query.lower()
-                if title == search_lower:
-                    return 0  # Exact match
-                elif title.startswith(search_lower):
-                    return 1  # Starts with query
-                else:
-                    return 2  # Contains query
-            
-            all_results.sort(key=sort_key)
-            
-            # Apply pagination
-            paginated_results = all_results[offset:offset + limit]
-            
+                results_by_id[series.content_id] = series_data
+
+            # Keep the relevance order of the index
+            paginated_results = [results_by_id[content_id] for content_id in page_ids if content_id in results_by_id]
+
             return Response({
                 'count': total_count,
                 'results': paginated_results,
@@ -1934,22 +2018,80 @@ class CombinedSearchAPIView(APIView):
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
 
+class SearchSuggestAPIView(APIView):
+    """Search box suggestions from the in-memory prefix index"""
+    permission_classes = [AllowAny]
+
+    @swagger_auto_schema(
+        operation_summary="Search suggestions",
+        operation_description="Suggests titles while the user types. Every word of the title, original title and slug is matched by prefix, accents ignored, most viewed first. Served from memory, no database query.",
+        manual_parameters=[
+            openapi.Parameter('search', openapi.IN_QUERY, description="What the user typed so far", type=openapi.TYPE_STRING, required=True),
+            openapi.Parameter('limit', openapi.IN_QUERY, description=f"Number of suggestions (default 10, max {MAX_SUGGESTIONS})", type=openapi.TYPE_INTEGER),
+        ],
+        responses={
+            200: openapi.Response(
+                description="Suggestions",
+                examples={
+                    "application/json": {
+                        "results": [
+                            {"id": 1, "slug": "one-piece", "title": "One Piece", "poster_img_url": "http://localhost:8000/media/posters/1.jpg"}
+                        ]
+                    }
+                }
+            ),
+        }
+    )
+    def get(self, request):
+        try:
+            limit = int(request.query_params.get('limit', 10))
+        except (ValueError, TypeError):
+            limit = 10
+        limit = max(1, min(limit, MAX_SUGGESTIONS))
+
+        try:
+            suggestions = get_suggest_index().lookup(request.query_params.get('search', ''), limit)
+            for suggestion in suggestions:
+                poster = suggestion['poster_img_url']
+                if not poster:
+                    suggestion['poster_img_url'] = None
+                elif not poster.startswith('http'):
+                    suggestion['poster_img_url'] = request.build_absolute_uri('/' + poster.lstrip('/'))
+            return Response({'results': suggestions}, status=status.HTTP_200_OK)
+        except Exception as e:
+            return Response(
+                {"error": f"Suggestions failed: {str(e)}"},
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR
+            )
+
 class MovieVideoAPIView(APIView):
     """API to get video stream for a movie"""
     permission_classes = [AllowAny]
     
     @swagger_auto_schema(
         operation_summary="Get movie video stream",
-        operation_description="Get HLS video stream URL for a specific movie",
+        operation_description="Get the HLS master playlist URL (adaptive bitrate) and available renditions for a specific movie",
         responses={
             200: openapi.Response(
                 description="Video stream information",
                 examples={
                     "application/json": {
-                        "hls_url": "/media/videos/video_123/hls/index.m3u8",
+                        "hls_url": "/media/videos/video_123/hls/master.m3u8",
                         "original_url": "/media/videos/video_123/demo_video.mp4",
                         "title": "Movie Title",
-                        "duration": 1480
+                        "duration": 25,
+                        "duration_seconds": 1480.5,
+                        "thumbnails": {
+                            "vtt": "/media/videos/video_123/hls/thumbnails/thumbnails.vtt",
+                            "sprites": ["/media/videos/video_123/hls/thumbnails/sprite_000.jpg", "/media/videos/video_123/hls/thumbnails/sprite_001.jpg"],
+                            "interval": 10, "width": 160, "height": 90, "columns": 10, "rows": 10
+                        },
+                        "metadata": {
+                            "duration": 1480.5, "width": 1920, "height": 1080,
+                            "video_codec": "h264", "audio_codec": "aac", "bitrate": 4200000,
+                            "probed_at": "2025-01-01T00:00:00Z", "segment_count": 149, "hls_size": 1582140416
+                        },
+                        "transcode_status": "succeeded"
                     }
                 }
             ),
@@ -1968,8 +2110,8 @@ class MovieVideoAPIView(APIView):
                 hls_url = movie.video.hls_path
                 original_url = movie.video.original_video_path
                 
-                # Ensure absolute URLs
-                if not hls_url.startswith('http'):
+                # Ensure absolute URLs (hls_path stays empty until the transcode job has finished)
+                if hls_url and not hls_url.startswith('http'):
                     hls_url = f"{base_url}{hls_url}"
                 if not original_url.startswith('http'):
                     original_url = f"{base_url}{original_url}"
@@ -1978,15 +2120,33 @@ class MovieVideoAPIView(APIView):
                     'hls_url': hls_url,
                     'original_url': original_url,
                     'title': movie.content.title,
-                    'duration': movie.duration
+                    'duration': movie.duration,  # minutes
+                    # Probed length, the minutes above until the file has been probed
+                    'duration_seconds': movie.video.duration or movie.duration * 60,
+                    'metadata': VideoMetadataSerializer(movie.video).data,
+                    'renditions': [
+                        dict(rendition, playlist=f"{base_url}{rendition['playlist']}")
+                        for rendition in movie.video.renditions
+                    ],
+                    # WebVTT seek previews (`sprite_000.jpg#xywh=...` cues) and the sprite sheets they point at
+                    'thumbnails': dict(
+                        movie.video.thumbnails,
+                        vtt=f"{base_url}{movie.video.thumbnails['vtt']}",
+                        sprites=[f"{base_url}{sprite}" for sprite in movie.video.thumbnails['sprites']]
+                    ) if movie.video.thumbnails else None,
+                    'transcode_status': latest_transcode_status(movie.video)
                 }, status=status.HTTP_200_OK)
             else:
-                # Return demo video if no video attached
+                # Return demo video if no video attached, its metadata is probed once per process
+                demo_metadata = demo_video_metadata()
+                demo_seconds = (demo_metadata or {}).get('duration') or movie.duration * 60
                 return Response({
                     'hls_url': f'{base_url}/media/videos/demo/hls/index.m3u8',
                     'original_url': f'{base_url}/media/videos/demo/demo_video.mp4',
                     'title': f'{movie.content.title} (Demo)',
-                    'duration': 1480  # ~24 minutes
+                    'duration': demo_seconds,  # the demo reply has always given seconds here
+                    'duration_seconds': demo_seconds,
+                    'metadata': demo_metadata
                 }, status=status.HTTP_200_OK)
                 
         except Movie.DoesNotExist:
@@ -2000,7 +2160,7 @@ class EpisodeVideoAPIView(APIView):
     
     @swagger_auto_schema(
         operation_summary="Get episode video stream",
-        operation_description="Get HLS video stream URL for a specific series episode",
+        operation_description="Get the HLS master playlist URL (adaptive bitrate) and available renditions for a specific series episode",
         manual_parameters=[
             openapi.Parameter(
                 name="content_id",
@@ -2029,10 +2189,22 @@ class EpisodeVideoAPIView(APIView):
                 description="Video stream information",
                 examples={
                     "application/json": {
-                        "hls_url": "/media/videos/video_456/hls/index.m3u8",
+                        "hls_url": "/media/videos/video_456/hls/master.m3u8",
                         "original_url": "/media/videos/video_456/episode_video.mp4",
                         "title": "Series Title - S1E1",
-                        "duration": 1440
+                        "duration": 24,
+                        "duration_seconds": 1440.0,
+                        "thumbnails": {
+                            "vtt": "/media/videos/video_456/hls/thumbnails/thumbnails.vtt",
+                            "sprites": ["/media/videos/video_456/hls/thumbnails/sprite_000.jpg", "/media/videos/video_456/hls/thumbnails/sprite_001.jpg"],
+                            "interval": 10, "width": 160, "height": 90, "columns": 10, "rows": 10
+                        },
+                        "metadata": {
+                            "duration": 1440.0, "width": 1280, "height": 720,
+                            "video_codec": "h264", "audio_codec": "aac", "bitrate": 2500000,
+                            "probed_at": "2025-01-01T00:00:00Z", "segment_count": 144, "hls_size": 823132160
+                        },
+                        "transcode_status": "succeeded"
                     }
                 }
             ),
@@ -2057,8 +2229,8 @@ class EpisodeVideoAPIView(APIView):
                 hls_url = episode.video.hls_path
                 original_url = episode.video.original_video_path
                 
-                # Ensure absolute URLs
-                if not hls_url.startswith('http'):
+                # Ensure absolute URLs (hls_path stays empty until the transcode job has finished)
+                if hls_url and not hls_url.startswith('http'):
                     hls_url = f"{base_url}{hls_url}"
                 if not original_url.startswith('http'):
                     original_url = f"{base_url}{original_url}"
@@ -2067,15 +2239,33 @@ class EpisodeVideoAPIView(APIView):
                     'hls_url': hls_url,
                     'original_url': original_url,
                     'title': f'{episode.season.series.content.title} - S{season_number}E{episode_number}',
-                    'duration': episode.duration
+                    'duration': episode.duration,  # minutes
+                    # Probed length, the minutes above until the file has been probed
+                    'duration_seconds': episode.video.duration or episode.duration * 60,
+                    'metadata': VideoMetadataSerializer(episode.video).data,
+                    'renditions': [
+                        dict(rendition, playlist=f"{base_url}{rendition['playlist']}")
+                        for rendition in episode.video.renditions
+                    ],
+                    # WebVTT seek previews (`sprite_000.jpg#xywh=...` cues) and the sprite sheets they point at
+                    'thumbnails': dict(
+                        episode.video.thumbnails,
+                        vtt=f"{base_url}{episode.video.thumbnails['vtt']}",
+                        sprites=[f"{base_url}{sprite}" for sprite in episode.video.thumbnails['sprites']]
+                    ) if episode.video.thumbnails else None,
+                    'transcode_status': latest_transcode_status(episode.video)
                 }, status=status.HTTP_200_OK)
             else:
-                # Return demo video if no video attached
+                # Return demo video if no video attached, its metadata is probed once per process
+                demo_metadata = demo_video_metadata()
+                demo_seconds = (demo_metadata or {}).get('duration') or episode.duration * 60
                 return Response({
                     'hls_url': f'{base_url}/media/videos/demo/hls/index.m3u8',
                     'original_url': f'{base_url}/media/videos/demo/demo_video.mp4',
                     'title': f'{episode.season.series.content.title} - S{season_number}E{episode_number} (Demo)',
-                    'duration': 1480  # ~24 minutes
+                    'duration': demo_seconds,  # the demo reply has always given seconds here
+                    'duration_seconds': demo_seconds,
+                    'metadata': demo_metadata
                 }, status=status.HTTP_200_OK)
                 
         except Episode.DoesNotExist:
@@ -2119,32 +2309,27 @@ class UpdateViewDurationAPIView(APIView):
         episode_id = data.get('episode_id')
         
         try:
-            # Get or create view session
+            # Heartbeats are buffered in Redis and flushed to the database in bulk
             if content_id:
-                content = get_object_or_404(Content, id=content_id)
-                view_session, created = ViewSession.objects.get_or_create(
-                    session_id=session_id,
-                    content=content,
-                    defaults={'watch_duration': 0}
+                if not Content.objects.filter(id=content_id).exists():
+                    return Response({'error': 'Content or episode not found'}, status=status.HTTP_404_NOT_FOUND)
+                view_counted, newly_counted = record_heartbeat(
+                    session_id, duration_seconds, content_id=content_id
                 )
             else:
-                # For episode, we need to find it by season and episode number from the request
-                # But since we only have episode_id in serializer, let's modify this
-                episode = get_object_or_404(Episode, id=episode_id)
-                view_session, created = ViewSession.objects.get_or_create(
-                    session_id=session_id,
-                    episode=episode,
-                    defaults={'watch_duration': 0}
+                episode = Episode.objects.filter(id=episode_id).values('id', 'season__series__content_id').first()
+                if not episode:
+                    return Response({'error': 'Content or episode not found'}, status=status.HTTP_404_NOT_FOUND)
+                view_counted, newly_counted = record_heartbeat(
+                    session_id, duration_seconds,
+                    episode_id=episode_id,
+                    series_content_id=episode['season__series__content_id']
                 )
             
-            # Update view duration and potentially increment views
-            old_view_counted = view_session.view_counted
-            view_session.update_view_duration(duration_seconds)
-            
             return Response({
                 'success': True,
-                'view_counted': view_session.view_counted,
-                'message': 'View counted' if not old_view_counted and view_session.view_counted else 'Duration updated'
+                'view_counted': view_counted,
+                'message': 'View counted' if newly_counted else 'Duration updated'
             }, status=status.HTTP_200_OK)
             
         except (Content.DoesNotExist, Episode.DoesNotExist):
@@ -2152,6 +2337,106 @@ class UpdateViewDurationAPIView(APIView):
         except Exception as e:
             return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
+class BatchTrackViewAPIView(APIView):
+    """API to record many coalesced player heartbeats in one request"""
+    permission_classes = [AllowAny]
+    
+    @swagger_auto_schema(
+        operation_summary="Track view duration in batch",
+        operation_description=(
+            f"Record up to {MAX_HEARTBEAT_BATCH} heartbeats at once. Each event targets a content "
+            "(content_id), an episode (episode_id) or an episode of a series by number "
+            "(content_id + season_number + episode_number). Results are returned per event, "
+            "in the same order; an invalid event does not fail the others."
+        ),
+        request_body=openapi.Schema(
+            type=openapi.TYPE_OBJECT,
+            properties={
+                'events': openapi.Schema(
+                    type=openapi.TYPE_ARRAY,
+                    items=openapi.Schema(
+                        type=openapi.TYPE_OBJECT,
+                        properties={
+                            'session_id': openapi.Schema(type=openapi.TYPE_STRING, description='Unique session identifier'),
+                            'duration_seconds': openapi.Schema(type=openapi.TYPE_INTEGER, description='Watch duration in seconds'),
+                            'content_id': openapi.Schema(type=openapi.TYPE_INTEGER, description='Content ID (or series content ID with season/episode numbers)'),
+                            'episode_id': openapi.Schema(type=openapi.TYPE_INTEGER, description='Episode ID'),
+                            'season_number': openapi.Schema(type=openapi.TYPE_INTEGER, description='Season number'),
+                            'episode_number': openapi.Schema(type=openapi.TYPE_INTEGER, description='Episode number'),
+                        },
+                        required=['session_id', 'duration_seconds']
+                    )
+                ),
+            },
+            required=['events']
+        ),
+        responses={
+            200: openapi.Response(
+                description="Per-event results",
+                examples={
+                    "application/json": {
+                        "success": True,
+                        "results": [
+                            {"index": 0, "success": True, "view_counted": True, "message": "View counted"},
+                            {"index": 1, "success": False, "error": "Content or episode not found"}
+                        ]
+                    }
+                }
+            ),
+            400: "Bad request - events missing or batch too large"
+        }
+    )
+    def post(self, request):
+        events = request.data if isinstance(request.data, list) else request.data.get('events')
+        
+        if not isinstance(events, list) or not events:
+            return Response({'error': 'events must be a non-empty list'}, status=status.HTTP_400_BAD_REQUEST)
+        if len(events) > MAX_HEARTBEAT_BATCH:
+            return Response({
+                'error': f'At most {MAX_HEARTBEAT_BATCH} events can be sent in one batch'
+            }, status=status.HTTP_400_BAD_REQUEST)
+        
+        try:
+            # Validate every event on its own so one bad event doesn't drop the batch
+            results = [None] * len(events)
+            valid = []
+            for index, event in enumerate(events):
+                serializer = HeartbeatEventSerializer(data=event)
+                if serializer.is_valid():
+                    valid.append((index, serializer.validated_data))
+                else:
+                    results[index] = {'index': index, 'success': False, 'error': serializer.errors}
+            
+            # One query per target kind instead of one lookup per event
+            targets = resolve_heartbeat_targets([data for _, data in valid])
+            heartbeats = []
+            for (index, data), target in zip(valid, targets):
+                if target is None:
+                    results[index] = {'index': index, 'success': False, 'error': 'Content or episode not found'}
+                    continue
+                heartbeats.append((index, dict(target, session_id=data['session_id'], duration_seconds=data['duration_seconds'])))
+            
+            recorded = record_heartbeats([event for _, event in heartbeats])
+            for (index, event), (view_counted, newly_counted) in zip(heartbeats, recorded):
+                if newly_counted:
+                    message = 'View counted for both episode and series' if event['episode_id'] else 'View counted'
+                else:
+                    message = 'Duration updated'
+                results[index] = {
+                    'index': index,
+                    'success': True,
+                    'view_counted': view_counted,
+                    'message': message
+                }
+            
+            return Response({
+                'success': True,
+                'results': results
+            }, status=status.HTTP_200_OK)
+            
+        except Exception as e:
+            return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
 class TrackEpisodeViewAPIView(APIView):
     """API specifically for tracking episode views with series content info"""
     permission_classes = [AllowAny]
@@ -2200,29 +2485,26 @@ class TrackEpisodeViewAPIView(APIView):
         
         try:
             # Get the specific episode
-            episode = get_object_or_404(
-                Episode,
+            episode = Episode.objects.filter(
                 season__series__content_id=content_id,
                 season__order=season_number,
                 order=episode_number
+            ).values('id', 'season__series__content_id').first()
+            if not episode:
+                return Response({'error': 'Episode not found'}, status=status.HTTP_404_NOT_FOUND)
+            
+            # Heartbeats are buffered in Redis and flushed to the database in bulk
+            view_counted, newly_counted = record_heartbeat(
+                session_id, int(duration_seconds),
+                episode_id=episode['id'],
+                series_content_id=episode['season__series__content_id']
             )
             
-            # Get or create view session for this episode
-            view_session, created = ViewSession.objects.get_or_create(
-                session_id=session_id,
-                episode=episode,
-                defaults={'watch_duration': 0}
-            )
-            
-            # Update view duration and potentially increment views
-            old_view_counted = view_session.view_counted
-            view_session.update_view_duration(duration_seconds)
-            
-            message = 'View counted for both episode and series' if not old_view_counted and view_session.view_counted else 'Duration updated'
+            message = 'View counted for both episode and series' if newly_counted else 'Duration updated'
             
             return Response({
                 'success': True,
-                'view_counted': view_session.view_counted,
+                'view_counted': view_counted,
                 'message': message
             }, status=status.HTTP_200_OK)
             
@@ -0,0 +1,144 @@
+"""
+Lazily created Elasticsearch client behind a circuit breaker.
+
+Importing the search app used to open the connection and check/create the
+indices, so every process (web workers, management commands, the transcode
+worker) made blocking calls to the cluster while booting and failed to start
+when it was slow or down. Now nothing talks to Elasticsearch until the first
+search or indexing call: the client (one pooled urllib3 transport per
+process) is built on first use, and indices are created by the first
+indexing call or by `manage.py index_search_documents --init`. Searches on a
+missing index fall back to the database.
+
+Calls go through `breaker`. After ELASTIC_BREAKER_FAILURES consecutive
+connection errors, timeouts or 5xx answers it opens and calls fail at once
+with SearchUnavailable, callers fall back to the database (film.search).
+After ELASTIC_BREAKER_RESET seconds one caller pings the cluster; if it
+answers the breaker closes again, otherwise it stays open for another
+period. The state is per process, each worker probes the cluster on its own.
+"""
+import logging
+import threading
+import time
+
+from django.conf import settings
+from elastic_transport import TransportError
+from elasticsearch import ApiError, Elasticsearch
+
+logger = logging.getLogger(__name__)
+
+
+class SearchUnavailable(Exception):
+    """The search backend is disabled, unreachable or failing"""
+
+
+def search_backend_enabled():
+    return getattr(settings, 'ELASTIC_ENABLED', False)
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    """The Elasticsearch client of this process, created on first use (no network call)"""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = Elasticsearch(
+                    settings.ELASTIC_HOST,
+                    basic_auth=(settings.ELASTIC_USERNAME, settings.ELASTIC_PASSWORD),
+                    connections_per_node=settings.ELASTIC_MAX_CONNECTIONS,
+                    request_timeout=settings.ELASTIC_REQUEST_TIMEOUT,
+                    max_retries=1,
+                    retry_on_timeout=False,
+                )
+    return _client
+
+
+def is_backend_failure(error):
+    """Errors that say the cluster is unhealthy, as opposed to a bad request"""
+    if isinstance(error, TransportError):
+        return True
+    return isinstance(error, ApiError) and error.status_code >= 500
+
+
+class CircuitBreaker:
+    CLOSED = 'closed'
+    OPEN = 'open'
+
+    def __init__(self, failure_threshold, reset_timeout, health_check):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.health_check = health_check
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.lock = threading.Lock()
+
+    def allow(self):
+        """Whether a call may go to the backend, probes it when the open period is over"""
+        if self.state == self.CLOSED:
+            return True
+        if time.monotonic() - self.opened_at < self.reset_timeout:
+            return False
+        # Half open: one caller runs the health check, the others keep failing fast
+        if not self.lock.acquire(blocking=False):
+            return False
+        try:
+            if self.state == self.CLOSED:
+                return True
+            try:
+                healthy = bool(self.health_check())
+            except Exception:
+                healthy = False
+            if healthy:
+                logger.info('Search backend is healthy again, closing the circuit')
+                # One more failure before a real success opens it again
+                self.state = self.CLOSED
+                self.failures = self.failure_threshold - 1
+            else:
+                self.opened_at = time.monotonic()
+            return healthy
+        finally:
+            self.lock.release()
+
+    def record_success(self):
+        self.state = self.CLOSED
+        self.failures = 0
+
+    def record_failure(self):
+        self.failures += 1
+        if self.failures >= self.failure_threshold and self.state != self.OPEN:
+            logger.warning('Search backend failed %d times in a row, opening the circuit', self.failures)
+            self.state = self.OPEN
+            self.opened_at = time.monotonic()
+
+    def call(self, function, *args, **kwargs):
+        """Run `function` against the backend, SearchUnavailable when it cannot or did not answer"""
+        if not self.allow():
+            raise SearchUnavailable('Search backend circuit is open')
+        try:
+            result = function(*args, **kwargs)
+        except Exception as e:
+            if not is_backend_failure(e):
+                raise
+            self.record_failure()
+            raise SearchUnavailable(str(e)) from e
+        self.record_success()
+        return result
+
+
+breaker = CircuitBreaker(
+    failure_threshold=getattr(settings, 'ELASTIC_BREAKER_FAILURES', 3),
+    reset_timeout=getattr(settings, 'ELASTIC_BREAKER_RESET', 30),
+    health_check=lambda: get_client().ping(),
+)
+
+
+def call_search_backend(function, *args, **kwargs):
+    """`function(client, *args, **kwargs)` through the breaker, SearchUnavailable when disabled"""
+    if not search_backend_enabled():
+        raise SearchUnavailable('Search backend is disabled')
+    return breaker.call(function, get_client(), *args, **kwargs)
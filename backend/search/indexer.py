@@ -0,0 +1,216 @@
+"""
+Feeding ContentIndex from the catalog.
+
+Full indexing streams Content in primary key batches, with the studio,
+genre and cast names of a batch loaded by 3 queries. Each batch is sent
+with the elasticsearch bulk helper as one request, so memory and request
+size stay flat whatever the catalog size.
+
+Incremental sync goes through a queue of content ids. Signals (search.signals)
+collect the ids touched by a transaction and push them once it commits, into
+a Redis set, so repeated changes of a content coalesce until the next drain
+(`manage.py index_search_documents --sync`). Contents that no longer exist
+are deleted from the index. Without Redis (local development) the ids are
+synced right after the commit instead, unless the search.client circuit
+breaker is open.
+
+Every function takes the elasticsearch client as an argument, any object
+with the `bulk`/`indices` API of elasticsearch.Elasticsearch (a local node or
+an in-memory stand-in) works.
+"""
+import logging
+
+from django.db.models import Prefetch
+from elasticsearch import helpers
+
+from core.transactions import on_commit_batch
+from film.models import Content, ContentGenre, ContentPerson
+from search.client import SearchUnavailable, call_search_backend, search_backend_enabled
+from search.search_indexes import ContentIndex
+
+logger = logging.getLogger(__name__)
+
+INDEX_BATCH_SIZE = 500
+BULK_REQUEST_TIMEOUT = 60  # seconds
+SYNC_QUEUE_KEY = 'search:sync:pending'
+FLUSHING_SUFFIX = ':flushing'
+MAX_CAST = 20  # cast names per document
+
+
+def get_redis():
+    """Raw Redis client behind the default cache, None when the cache is not Redis"""
+    try:
+        from django_redis import get_redis_connection
+        return get_redis_connection('default')
+    except (ImportError, NotImplementedError):
+        return None
+
+
+# Indices known to exist in this process, checked once instead of on every sync
+_ensured_indices = set()
+
+
+def ensure_index(client, recreate=False):
+    """
+    Create the index (mapping and analyzers) if missing, drop it first with
+    `recreate`. Must run before the first write, elasticsearch would otherwise
+    auto-create the index with a dynamic mapping and no accent folding.
+    """
+    index = ContentIndex._index
+    if recreate:
+        client.indices.delete(index=index._name, ignore_unavailable=True)
+        _ensured_indices.discard(index._name)
+    if index._name in _ensured_indices:
+        return
+    if not client.indices.exists(index=index._name):
+        index.create(using=client)
+    _ensured_indices.add(index._name)
+
+
+def forget_index():
+    """The index was dropped behind this process, the next ensure_index checks the cluster again"""
+    _ensured_indices.discard(ContentIndex._index._name)
+
+
+def content_document(content):
+    """Source of the ContentIndex document of a content, related rows prefetched"""
+    return {
+        'content_id': content.id,
+        'content_type': content.content_type,
+        'slug': content.slug,
+        'title': content.title,
+        'original_title': content.original_title,
+        'aliases': content.aliases.splitlines(),
+        'description': content.description,
+        'studio': content.studio.name if content.studio_id else None,
+        'genres': [link.genre.name for link in content.content_genres.all()],
+        'cast': list(dict.fromkeys(link.person.name for link in content.cast_crew.all()))[:MAX_CAST],
+        'poster_img_url': content.poster_img_url,
+        'views': content.views,
+        'rating': content.rating,
+        'release_date': content.release_date,
+    }
+
+
+def content_batches(content_ids=None, batch_size=INDEX_BATCH_SIZE):
+    """Contents with their studio, genres and cast, `batch_size` at a time in id order"""
+    queryset = Content.objects.select_related('studio').prefetch_related(
+        Prefetch('content_genres', queryset=ContentGenre.objects.select_related('genre')),
+        Prefetch('cast_crew', queryset=ContentPerson.objects.select_related('person')),
+    ).order_by('id')
+    if content_ids is not None:
+        queryset = queryset.filter(id__in=list(content_ids))
+
+    last_id = 0
+    while True:
+        batch = list(queryset.filter(id__gt=last_id)[:batch_size])
+        if not batch:
+            return
+        yield batch
+        last_id = batch[-1].id
+
+
+def index_actions(contents):
+    index_name = ContentIndex._index._name
+    for content in contents:
+        yield {
+            '_op_type': 'index',
+            '_index': index_name,
+            '_id': content.id,
+            '_source': content_document(content),
+        }
+
+
+def delete_actions(content_ids):
+    index_name = ContentIndex._index._name
+    for content_id in content_ids:
+        yield {'_op_type': 'delete', '_index': index_name, '_id': content_id}
+
+
+def _send(client, actions, batch_size):
+    """One bulk request per `batch_size` actions, returns (succeeded, errors)"""
+    succeeded, errors = helpers.bulk(
+        client, actions, chunk_size=batch_size, raise_on_error=False, stats_only=False
+    )
+    # A delete of a document that was never indexed is not an error
+    errors = [error for error in errors if error.get('delete', {}).get('status') != 404]
+    return succeeded, errors
+
+
+def index_all(client, content_ids=None, batch_size=INDEX_BATCH_SIZE, progress=None):
+    """
+    Index every content (or the given ids) and delete the given ids that no
+    longer exist. Returns {'indexed', 'deleted', 'errors'}.
+    """
+    result = {'indexed': 0, 'deleted': 0, 'errors': []}
+    seen = set()
+    for batch in content_batches(content_ids, batch_size):
+        succeeded, errors = _send(client, index_actions(batch), batch_size)
+        result['indexed'] += succeeded
+        result['errors'].extend(errors)
+        seen.update(content.id for content in batch)
+        if progress:
+            progress(result)
+
+    if content_ids is not None:
+        missing = set(content_ids) - seen
+        if missing:
+            succeeded, errors = _send(client, delete_actions(sorted(missing)), batch_size)
+            result['deleted'] += len(missing)
+            result['errors'].extend(errors)
+    return result
+
+
+def _push_sync(content_ids):
+    try:
+        redis_client = get_redis()
+        if redis_client is not None:
+            redis_client.sadd(SYNC_QUEUE_KEY, *content_ids)
+            return
+        call_search_backend(sync_now, content_ids)
+    except SearchUnavailable as e:
+        logger.warning('Search sync of %d contents skipped: %s', len(content_ids), e)
+    except Exception:
+        # The database change is committed, a full index run repairs the document
+        logger.exception('Search sync of %d contents failed', len(content_ids))
+
+
+def enqueue_sync(content_ids):
+    """
+    Queue contents for the next sync once the current transaction commits.
+
+    Ids are collected per transaction and pushed with a single SADD, an
+    import touching the same content many times queues it once.
+    """
+    if not search_backend_enabled():
+        return
+    on_commit_batch('search_sync', _push_sync, (content_id for content_id in content_ids if content_id))
+
+
+def sync_now(client, content_ids):
+    ensure_index(client)
+    return index_all(client, content_ids)
+
+
+def drain_sync_queue(client, batch_size=INDEX_BATCH_SIZE):
+    """
+    Sync the queued contents, returns the index_all result (None when the
+    queue is not in Redis).
+
+    The queue is renamed before it is read, ids queued meanwhile wait for the
+    next drain. A snapshot left by a failed drain is retried first.
+    """
+    redis_client = get_redis()
+    if redis_client is None:
+        return None
+
+    flushing_key = SYNC_QUEUE_KEY + FLUSHING_SUFFIX
+    if not redis_client.exists(flushing_key):
+        if not redis_client.exists(SYNC_QUEUE_KEY):
+            return {'indexed': 0, 'deleted': 0, 'errors': []}
+        redis_client.rename(SYNC_QUEUE_KEY, flushing_key)
+
+    content_ids = {int(content_id) for content_id in redis_client.smembers(flushing_key)}
+    result = index_all(client, content_ids, batch_size)
+    redis_client.delete(flushing_key)
+    return result
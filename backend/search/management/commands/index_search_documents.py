@@ -0,0 +1,115 @@
+"""
+Django management command to feed the Elasticsearch content index
+"""
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from search.client import get_client
+from search.indexer import (
+    ensure_index, index_all, drain_sync_queue, get_redis, INDEX_BATCH_SIZE, BULK_REQUEST_TIMEOUT
+)
+
+
+class Command(BaseCommand):
+    help = 'Bulk index all content (or the given ids) into Elasticsearch, or drain the incremental sync queue'
+
+    def __init__(self, *args, client=None, **kwargs):
+        # call_command(Command(client=...)) runs against another client (tests)
+        super().__init__(*args, **kwargs)
+        self.client = client
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'content_ids',
+            nargs='*',
+            type=int,
+            help='Only index these content ids (deleted ones are removed from the index)'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=INDEX_BATCH_SIZE,
+            help=f'Documents per bulk request (default: {INDEX_BATCH_SIZE})'
+        )
+        parser.add_argument(
+            '--recreate',
+            action='store_true',
+            help='Drop and recreate the index (mapping changes) before indexing'
+        )
+        parser.add_argument(
+            '--init',
+            action='store_true',
+            help='Only create the index if it is missing (with --recreate: drop it first)'
+        )
+        parser.add_argument(
+            '--sync',
+            action='store_true',
+            help='Only index the contents queued by the signals since the last sync'
+        )
+        parser.add_argument(
+            '--interval',
+            type=int,
+            default=0,
+            help='With --sync, keep running and sync every N seconds (default: sync once and exit)'
+        )
+
+    def handle(self, *args, **options):
+        self.batch_size = max(1, options['batch_size'])
+        client = self.get_client()
+        interval = options['interval'] if options['sync'] else 0
+
+        if not interval:
+            if not client.ping():
+                raise CommandError(f'Elasticsearch is not reachable at {settings.ELASTIC_HOST}')
+            ensure_index(client, recreate=options['recreate'])
+            if options['init']:
+                self.stdout.write(self.style.SUCCESS('✅ Search index is ready'))
+                return
+
+        if not options['sync']:
+            content_ids = options['content_ids'] or None
+            self.stdout.write('🔎 Indexing contents...')
+            result = index_all(client, content_ids, self.batch_size, progress=self.progress)
+            self.report(result)
+            return
+
+        if get_redis() is None:
+            self.stdout.write(
+                self.style.WARNING('The sync queue is not in Redis (cache is not Redis), contents are synced on commit')
+            )
+            return
+
+        while True:
+            try:
+                # Checked once per process, a worker started before the cluster waits for it
+                ensure_index(client)
+                result = drain_sync_queue(client, self.batch_size)
+                if result['indexed'] or result['deleted'] or result['errors']:
+                    self.report(result)
+            except Exception as e:
+                if not interval:
+                    raise
+                # Keep the worker alive, the queued ids are retried on the next run
+                self.stdout.write(self.style.ERROR(f'❌ Sync failed: {str(e)}'))
+
+            if not interval:
+                break
+            time.sleep(interval)
+
+    def get_client(self):
+        if self.client is not None:
+            return self.client
+        # Bulk requests take longer than the user facing queries the default timeout is meant for
+        return get_client().options(request_timeout=BULK_REQUEST_TIMEOUT)
+
+    def progress(self, result):
+        self.stdout.write(f'  Indexed {result["indexed"]} contents')
+
+    def report(self, result):
+        for error in result['errors'][:10]:
+            self.stdout.write(self.style.ERROR(f'  ❌ {error}'))
+        style = self.style.WARNING if result['errors'] else self.style.SUCCESS
+        self.stdout.write(style(
+            f'✅ Indexed {result["indexed"]} contents, removed {result["deleted"]}, '
+            f'{len(result["errors"])} errors'
+        ))
@@ -0,0 +1,48 @@
+"""
+Signal handlers that queue contents for the Elasticsearch sync (search.indexer).
+"""
+from django.db.models.signals import post_save, post_delete, pre_delete
+from django.dispatch import receiver
+
+from film.models import Content, ContentGenre, ContentPerson, Genre, Person, Studio
+from film.signals import contents_bulk_saved
+from search.indexer import enqueue_sync
+
+
+@receiver([post_save, post_delete], sender=Content)
+def queue_content(sender, instance, **kwargs):
+    enqueue_sync([instance.pk])
+
+
+@receiver([post_save, post_delete], sender=ContentGenre)
+@receiver([post_save, post_delete], sender=ContentPerson)
+def queue_linked_content(sender, instance, **kwargs):
+    """Genre and cast names are part of the content document"""
+    enqueue_sync([instance.content_id])
+
+
+@receiver(post_save, sender=Studio)
+@receiver(post_save, sender=Genre)
+@receiver(post_save, sender=Person)
+def queue_renamed_contents(sender, instance, created=False, update_fields=None, **kwargs):
+    """A renamed studio, genre or person changes the documents that show its name"""
+    if created or (update_fields is not None and 'name' not in update_fields):
+        return
+    if sender is Studio:
+        content_ids = instance.contents.values_list('id', flat=True)
+    elif sender is Genre:
+        content_ids = instance.contents.values_list('content_id', flat=True)
+    else:
+        content_ids = instance.works.values_list('content_id', flat=True)
+    enqueue_sync(content_ids)
+
+
+@receiver(pre_delete, sender=Studio)
+def queue_studio_contents(sender, instance, **kwargs):
+    """Contents lose their studio with an UPDATE (SET_NULL), which sends no signal"""
+    enqueue_sync(instance.contents.values_list('id', flat=True))
+
+
+@receiver(contents_bulk_saved)
+def queue_bulk_saved_contents(sender, content_ids, **kwargs):
+    enqueue_sync(content_ids)
@@ -1,3 +1,378 @@
-from django.test import TestCase
+import datetime
+import json
+from collections import namedtuple
+from io import StringIO
+from unittest import mock
+from urllib.parse import parse_qs, urlsplit
 
-# Create your tests here.
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import transaction
+from django.test import TestCase, override_settings
+from elastic_transport import ApiResponseMeta, BaseNode, ConnectionError, HttpHeaders, NodeConfig
+from elasticsearch import ApiError, BadRequestError, Elasticsearch
+
+from film.models import Content
+from search import client as search_client, indexer
+from search.client import CircuitBreaker, SearchUnavailable
+from search.indexer import SYNC_QUEUE_KEY, FLUSHING_SUFFIX, drain_sync_queue, enqueue_sync, index_all
+from search.management.commands.index_search_documents import Command
+
+NodeResponse = namedtuple('NodeResponse', ['meta', 'body'])
+
+
+class InMemoryNode(BaseNode):
+    """
+    Elasticsearch node answering from memory, enough of the API for the
+    indexer: ping, index exists/create/delete, _bulk and a match-all _search.
+    The real client (and its bulk helper) is used on top of it.
+    """
+    indices = {}
+    bulk_requests = []
+    down = False
+
+    @classmethod
+    def reset(cls):
+        cls.indices = {}
+        cls.bulk_requests = []
+        cls.down = False
+
+    def respond(self, status, body=None):
+        headers = HttpHeaders({'content-type': 'application/json', 'x-elastic-product': 'Elasticsearch'})
+        meta = ApiResponseMeta(status=status, http_version='1.1', headers=headers, duration=0.0, node=self.config)
+        return NodeResponse(meta, json.dumps(body if body is not None else {}).encode())
+
+    def perform_request(self, method, target, body=None, headers=None, request_timeout=None):
+        if self.down:
+            raise ConnectionError('in-memory node is down')
+        url = urlsplit(target)
+        parts = [part for part in url.path.split('/') if part]
+        query = parse_qs(url.query)
+
+        if not parts:
+            return self.respond(200, {'version': {'number': '8.19.0'}})
+        if parts[-1] == '_bulk':
+            return self.bulk(body)
+
+        index = parts[0]
+        if method == 'HEAD':
+            return self.respond(200 if index in self.indices else 404)
+        if method == 'PUT' and len(parts) == 1:
+            self.indices[index] = {}
+            return self.respond(200, {'acknowledged': True, 'index': index})
+        if method == 'DELETE' and len(parts) == 1:
+            if index not in self.indices and query.get('ignore_unavailable') != ['true']:
+                return self.missing_index(index)
+            self.indices.pop(index, None)
+            return self.respond(200, {'acknowledged': True})
+        if parts[-1] == '_search':
+            if index not in self.indices:
+                return self.missing_index(index)
+            hits = [
+                {'_index': index, '_id': doc_id, '_score': 1.0, '_source': source, 'sort': [1.0, source.get('views', 0)]}
+                for doc_id, source in self.indices[index].items()
+            ]
+            return self.respond(200, {'took': 1, 'timed_out': False, 'hits': {'total': {'value': len(hits), 'relation': 'eq'}, 'hits': hits}})
+        return self.respond(400, {'error': {'type': 'illegal_argument_exception', 'reason': f'{method} {target}'}, 'status': 400})
+
+    def missing_index(self, index):
+        error = {'type': 'index_not_found_exception', 'reason': f'no such index [{index}]'}
+        return self.respond(404, {'error': error, 'status': 404})
+
+    def bulk(self, body):
+        lines = [json.loads(line) for line in body.decode().splitlines() if line.strip()]
+        self.bulk_requests.append(lines)
+        items = []
+        position = 0
+        while position < len(lines):
+            (op_type, action), = lines[position].items()
+            documents = self.indices.setdefault(action['_index'], {})
+            doc_id = str(action['_id'])
+            if op_type == 'delete':
+                status = 200 if documents.pop(doc_id, None) is not None else 404
+                position += 1
+            else:
+                status = 200 if doc_id in documents else 201
+                documents[doc_id] = lines[position + 1]
+                position += 2
+            items.append({op_type: {'_index': action['_index'], '_id': doc_id, 'status': status}})
+        errors = any(not 200 <= list(item.values())[0]['status'] < 300 for item in items)
+        return self.respond(200, {'took': 1, 'errors': errors, 'items': items})
+
+
+def in_memory_client():
+    InMemoryNode.reset()
+    return Elasticsearch('http://in-memory:9200', node_class=InMemoryNode)
+
+
+class FakeRedis:
+    """The set commands of the sync queue"""
+
+    def __init__(self):
+        self.data = {}
+
+    def sadd(self, key, *values):
+        self.data.setdefault(key, set()).update(str(value).encode() for value in values)
+
+    def smembers(self, key):
+        return set(self.data.get(key, set()))
+
+    def exists(self, key):
+        return int(key in self.data)
+
+    def rename(self, key, new_key):
+        self.data[new_key] = self.data.pop(key)
+
+    def delete(self, key):
+        self.data.pop(key, None)
+
+
+def create_content(title, **fields):
+    return Content.objects.create(
+        title=title, content_type='movie', release_date=datetime.date(2020, 1, 1),
+        description='d', banner_img_url='/media/x.jpg', **fields
+    )
+
+
+class IndexAllTests(TestCase):
+    def setUp(self):
+        self.client_es = in_memory_client()
+        self.contents = [create_content(f'Movie {i}') for i in range(5)]
+
+    def documents(self):
+        return InMemoryNode.indices.get('contents', {})
+
+    def test_sends_one_bulk_request_per_batch(self):
+        result = index_all(self.client_es, batch_size=2)
+
+        self.assertEqual(result, {'indexed': 5, 'deleted': 0, 'errors': []})
+        self.assertEqual([len(request) // 2 for request in InMemoryNode.bulk_requests], [2, 2, 1])
+        self.assertEqual(self.documents()[str(self.contents[0].id)]['title'], 'Movie 0')
+
+    def test_deletes_given_ids_that_no_longer_exist(self):
+        index_all(self.client_es)
+        gone = self.contents[0].id
+        Content.objects.filter(id=gone).delete()
+
+        result = index_all(self.client_es, [gone, self.contents[1].id])
+
+        self.assertEqual(result['indexed'], 1)
+        self.assertEqual(result['deleted'], 1)
+        self.assertEqual(result['errors'], [])
+        self.assertNotIn(str(gone), self.documents())
+
+    def test_delete_of_a_never_indexed_document_is_not_an_error(self):
+        result = index_all(self.client_es, [987654])
+
+        self.assertEqual(result, {'indexed': 0, 'deleted': 1, 'errors': []})
+
+
+class DrainSyncQueueTests(TestCase):
+    def setUp(self):
+        self.client_es = in_memory_client()
+        self.redis = FakeRedis()
+        patcher = mock.patch.object(indexer, 'get_redis', return_value=self.redis)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.contents = [create_content(f'Movie {i}') for i in range(3)]
+
+    def test_renames_the_queue_and_indexes_it(self):
+        self.redis.sadd(SYNC_QUEUE_KEY, self.contents[0].id, self.contents[1].id)
+
+        result = drain_sync_queue(self.client_es)
+
+        self.assertEqual(result['indexed'], 2)
+        self.assertEqual(self.redis.data, {})
+        self.assertEqual(set(InMemoryNode.indices['contents']), {str(self.contents[0].id), str(self.contents[1].id)})
+
+    def test_failed_drain_keeps_the_snapshot_for_the_next_run(self):
+        self.redis.sadd(SYNC_QUEUE_KEY, self.contents[0].id)
+        InMemoryNode.down = True
+        with self.assertRaises(ConnectionError):
+            drain_sync_queue(self.client_es)
+        self.assertIn(SYNC_QUEUE_KEY + FLUSHING_SUFFIX, self.redis.data)
+
+        # Queued meanwhile: waits for the drain after the snapshot retry
+        self.redis.sadd(SYNC_QUEUE_KEY, self.contents[2].id)
+        InMemoryNode.down = False
+        result = drain_sync_queue(self.client_es)
+
+        self.assertEqual(result['indexed'], 1)
+        self.assertEqual(set(InMemoryNode.indices['contents']), {str(self.contents[0].id)})
+        self.assertEqual(self.redis.smembers(SYNC_QUEUE_KEY), {str(self.contents[2].id).encode()})
+        self.assertNotIn(SYNC_QUEUE_KEY + FLUSHING_SUFFIX, self.redis.data)
+
+
+@override_settings(ELASTIC_ENABLED=True)
+class EnqueueSyncTests(TestCase):
+    def setUp(self):
+        patcher = mock.patch.object(indexer, '_push_sync')
+        self.push = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_ids_of_a_transaction_are_pushed_once(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            enqueue_sync([1, 2])
+            enqueue_sync([2, 3])
+
+        self.push.assert_called_once_with({1, 2, 3})
+
+    def test_rolled_back_savepoint_does_not_swallow_later_ids(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            try:
+                with transaction.atomic():
+                    enqueue_sync([1])
+                    raise RuntimeError
+            except RuntimeError:
+                pass
+            enqueue_sync([2])
+
+        # The rolled back id comes along, syncing it again only reads the current row
+        self.push.assert_called_once_with({1, 2})
+
+
+class IndexCommandTests(TestCase):
+    def setUp(self):
+        self.client_es = in_memory_client()
+        self.contents = [create_content(f'Movie {i}') for i in range(3)]
+        indexer._ensured_indices.clear()
+        self.addCleanup(indexer._ensured_indices.clear)
+
+    def test_indexes_everything_into_a_created_index(self):
+        out = StringIO()
+        call_command(Command(client=self.client_es), batch_size=2, stdout=out)
+
+        self.assertEqual(len(InMemoryNode.indices['contents']), 3)
+        self.assertEqual(len(InMemoryNode.bulk_requests), 2)
+        self.assertIn('Indexed 3 contents', out.getvalue())
+
+    def test_sync_drains_the_queue(self):
+        redis = FakeRedis()
+        redis.sadd(SYNC_QUEUE_KEY, self.contents[1].id)
+        out = StringIO()
+        with mock.patch.object(indexer, 'get_redis', return_value=redis), \
+                mock.patch('search.management.commands.index_search_documents.get_redis', return_value=redis):
+            call_command(Command(client=self.client_es), sync=True, stdout=out)
+
+        self.assertEqual(set(InMemoryNode.indices['contents']), {str(self.contents[1].id)})
+        self.assertEqual(redis.data, {})
+
+    def test_unreachable_cluster_fails_the_command(self):
+        InMemoryNode.down = True
+        with self.assertRaises(CommandError):
+            call_command(Command(client=self.client_es), stdout=StringIO())
+
+
+def api_error(error_class, status):
+    meta = ApiResponseMeta(
+        status=status, http_version='1.1', headers=HttpHeaders(), duration=0.0,
+        node=NodeConfig('http', 'localhost', 9200)
+    )
+    return error_class(f'status {status}', meta, {})
+
+
+class CircuitBreakerTests(TestCase):
+    def setUp(self):
+        self.healthy = False
+        self.now = 1000.0
+        patcher = mock.patch('search.client.time.monotonic', side_effect=lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.breaker = CircuitBreaker(failure_threshold=2, reset_timeout=30, health_check=lambda: self.healthy)
+        self.failing = mock.Mock(side_effect=ConnectionError('down'))
+
+    def open_breaker(self):
+        for _ in range(2):
+            with self.assertRaises(SearchUnavailable):
+                self.breaker.call(self.failing)
+
+    def test_opens_after_consecutive_failures_and_fails_fast(self):
+        self.open_breaker()
+
+        with self.assertRaises(SearchUnavailable):
+            self.breaker.call(self.failing)
+        self.assertEqual(self.breaker.state, CircuitBreaker.OPEN)
+        self.assertEqual(self.failing.call_count, 2)
+
+    def test_server_errors_count_and_bad_requests_do_not(self):
+        with self.assertRaises(BadRequestError):
+            self.breaker.call(mock.Mock(side_effect=api_error(BadRequestError, 400)))
+        self.assertEqual(self.breaker.failures, 0)
+
+        for _ in range(2):
+            with self.assertRaises(SearchUnavailable):
+                self.breaker.call(mock.Mock(side_effect=api_error(ApiError, 503)))
+        self.assertEqual(self.breaker.state, CircuitBreaker.OPEN)
+
+    def test_half_open_probe_closes_the_breaker_when_healthy(self):
+        self.open_breaker()
+        self.now += 31
+        self.healthy = True
+
+        self.assertEqual(self.breaker.call(lambda: 'ok'), 'ok')
+        self.assertEqual(self.breaker.state, CircuitBreaker.CLOSED)
+
+    def test_failed_probe_keeps_the_breaker_open_for_another_period(self):
+        self.open_breaker()
+        self.now += 31
+
+        with self.assertRaises(SearchUnavailable):
+            self.breaker.call(lambda: 'ok')
+        self.now += 10
+        self.healthy = True
+        with self.assertRaises(SearchUnavailable):
+            self.breaker.call(lambda: 'ok')
+        self.assertEqual(self.breaker.state, CircuitBreaker.OPEN)
+
+
+@override_settings(ELASTIC_ENABLED=True)
+class SearchMoviesTests(TestCase):
+    def setUp(self):
+        self.client_es = in_memory_client()
+        for patcher in (
+            mock.patch.object(search_client, 'get_client', return_value=self.client_es),
+            mock.patch.object(search_client, 'breaker', CircuitBreaker(3, 30, self.client_es.ping)),
+            # Signals would sync every saved row
+            mock.patch.object(indexer, '_push_sync'),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        indexer._ensured_indices.clear()
+        self.addCleanup(indexer._ensured_indices.clear)
+        self.content = create_content('Chainsaw Man')
+
+    def search(self, query):
+        response = self.client.get('/api/v1/search/movies/', {'q': query})
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_answers_from_elasticsearch(self):
+        index_all(self.client_es)
+
+        result = self.search('chainsaw')
+
+        self.assertEqual(result['backend'], 'elasticsearch')
+        self.assertEqual([hit['id'] for hit in result['results']], [self.content.id])
+
+    def test_missing_index_falls_back_to_the_database(self):
+        indexer._ensured_indices.add('contents')
+
+        result = self.search('chainsaw')
+
+        self.assertEqual(result['backend'], 'database')
+        self.assertEqual([hit['id'] for hit in result['results']], [self.content.id])
+        self.assertNotIn('contents', indexer._ensured_indices)
+        self.assertEqual(search_client.breaker.failures, 0)
+
+    def test_unreachable_cluster_falls_back_to_the_database(self):
+        InMemoryNode.down = True
+
+        result = self.search('chainsaw')
+
+        self.assertEqual(result['backend'], 'database')
+        self.assertEqual(search_client.breaker.failures, 1)
+
+    def test_missing_query_is_rejected(self):
+        response = self.client.get('/api/v1/search/movies/')
+
+        self.assertEqual(response.status_code, 400)
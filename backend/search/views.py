@@ -2,8 +2,58 @@ from django.http import JsonResponse
 from drf_yasg import openapi
 from drf_yasg.utils import swagger_auto_schema
 from rest_framework.decorators import api_view
+from elasticsearch import NotFoundError
 from elasticsearch_dsl import Q
-from search.search_indexes import MovieIndex, SeasonIndex
+from film.models import Content
+from film.search import search_matches
+from search.client import SearchUnavailable, call_search_backend
+from search.indexer import forget_index
+from search.search_indexes import ContentIndex
+
+MAX_RESULTS = 50
+
+
+def search_elasticsearch(client, query):
+    """
+    Matching contents from the Elasticsearch index. A missing index (never
+    built, or dropped) raises SearchUnavailable, the database answers until
+    the indexer creates and fills it again.
+    """
+    search_query = Q(
+        "bool",
+        should=[
+            Q("multi_match", query=query, fields=["title^3", "original_title^2", "aliases^2", "studio", "cast", "description"], fuzziness="AUTO", prefix_length=2),
+            Q("match_phrase_prefix", title=query),
+            Q("match_phrase", title=query)
+        ],
+        minimum_should_match=1
+    )
+
+    # Relevance first, popular titles break ties
+    try:
+        hits = ContentIndex.search(using=client).query(search_query).sort('_score', '-views')[:MAX_RESULTS].execute()
+    except NotFoundError as e:
+        # The next sync creates it again with its mapping
+        forget_index()
+        raise SearchUnavailable(f'Search index is missing: {e}') from e
+
+    return [
+        {"type": hit.content_type, "id": hit.content_id, "slug": hit.slug, "title": hit.title}
+        for hit in hits
+    ]
+
+
+def search_database(query):
+    """Same results from the database token index (film.search), while Elasticsearch is unavailable"""
+    matches = search_matches(query)
+    if matches is None:
+        return []
+    content_ids = [match['content_id'] for match in matches[:MAX_RESULTS]]
+    contents = Content.objects.in_bulk(content_ids)
+    return [
+        {"type": contents[content_id].content_type, "id": content_id, "slug": contents[content_id].slug, "title": contents[content_id].title}
+        for content_id in content_ids if content_id in contents
+    ]
 
 @swagger_auto_schema(
     method='get',
@@ -13,41 +63,30 @@ from search.search_indexes import MovieIndex, SeasonIndex
         )
     ],
     responses={200: openapi.Response(
-        description="List of matching movies or seasons",
+        description="List of matching movies or series",
         examples={
             "application/json": {
                 "results": [
-                    {"type": "movie", "id": 1},
-                    {"type": "season", "id": 2}
-                ]
+                    {"type": "movie", "id": 1, "slug": "one-piece-film-red", "title": "One Piece Film Red"},
+                    {"type": "series", "id": 2, "slug": "one-piece", "title": "One Piece"}
+                ],
+                "backend": "elasticsearch"
             }
         }
     )}
 )
 @api_view(['GET'])
 def search_movies(request):
-    ''' Query to search for movies and seasons '''
+    ''' Query to search for movies and series, from the database while Elasticsearch is unavailable '''
     query = request.GET.get('q', '').strip()
     if not query:
         return JsonResponse({'error': 'Missing query'}, status=400)
 
-    search_query = Q(
-        "bool",
-        should=[
-            Q("multi_match", query=query, fields=["movie_name^3", "season_name^2"], fuzziness="AUTO", prefix_length=2),
-            Q("wildcard", movie_name=f"*{query}*"),  
-            Q("wildcard", season_name=f"*{query}*"),
-            Q("match_phrase", movie_name=query),  
-            Q("match_phrase", season_name=query)
-        ],
-        minimum_should_match=1
-    )
-
-    # 
-    movie_results = MovieIndex.search().query(search_query)[:50].execute()
-    season_results = SeasonIndex.search().query(search_query)[:50].execute()
-
-    results = [{"type": "movie", "id": hit.meta.id} for hit in movie_results] + \
-              [{"type": "season", "id": hit.meta.id} for hit in season_results]
+    try:
+        results = call_search_backend(search_elasticsearch, query)
+        backend = 'elasticsearch'
+    except SearchUnavailable:
+        results = search_database(query)
+        backend = 'database'
 
-    return JsonResponse({'results': results[:50]})
+    return JsonResponse({'results': results, 'backend': backend})
@@ -1,7 +1,19 @@
 from django.contrib import admin
-from video.models import Video
+from video.models import Video, TranscodeJob, MediaBlob
 
 @admin.register(Video)
 class VideoAdmin(admin.ModelAdmin):
     list_display = ('original_video_path', 'hls_path', 'id')  # Hiển thị các trường này trong danh sách admin
 
+
+@admin.register(TranscodeJob)
+class TranscodeJobAdmin(admin.ModelAdmin):
+    list_display = ('id', 'video', 'status', 'progress', 'attempts', 'worker', 'created_at', 'finished_at')
+    list_filter = ('status',)
+
+
+@admin.register(MediaBlob)
+class MediaBlobAdmin(admin.ModelAdmin):
+    list_display = ('sha256', 'kind', 'path', 'size', 'ref_count', 'created_at')
+    list_filter = ('kind',)
+    search_fields = ('sha256', 'path')
@@ -0,0 +1,165 @@
+"""
+Content-addressed storage for uploaded videos and images.
+
+Every upload is hashed (streaming SHA-256) and recorded as a MediaBlob. When
+the same bytes are uploaded again the new copy is dropped and the existing
+file is shared:
+  - videos point at the stored source file and reuse its HLS output, so
+    ffmpeg does not run a second time,
+  - images (banners, posters) are stored once as banner/<sha256><ext>.
+Blobs are reference counted and their files are only removed when nothing
+uses them anymore.
+"""
+import hashlib
+import os
+import shutil
+import uuid
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F
+
+from video.models import MediaBlob, Video, TranscodeJob
+from video.jobs import enqueue_transcode
+from video.utils import media_url, media_path
+
+IMAGE_DIRECTORY = 'banner'
+DEFAULT_IMAGES = {'banner/default.jpg'}  # shared placeholders, never deleted
+
+
+def _get_or_create_blob(sha256, kind, path, size):
+    """Returns (blob, created), concurrent uploads of the same file end up on one row"""
+    try:
+        with transaction.atomic():
+            return MediaBlob.objects.create(sha256=sha256, kind=kind, path=path, size=size, ref_count=1), True
+    except IntegrityError:
+        blob = MediaBlob.objects.select_for_update().get(sha256=sha256)
+        MediaBlob.objects.filter(pk=blob.pk).update(ref_count=F('ref_count') + 1)
+        return blob, False
+
+
+def attach_video_blob(video, file_path, sha256):
+    """
+    Register the uploaded file of `video` by its hash.
+
+    A new hash queues the HLS conversion. A known hash removes the new copy,
+    points the video at the stored file, its HLS output and probed metadata
+    and only queues a conversion if the earlier one failed. Returns the
+    TranscodeJob producing the HLS output, or None when it is already available.
+    """
+    with transaction.atomic():
+        blob, created = _get_or_create_blob(
+            sha256, MediaBlob.Kind.VIDEO, media_url(file_path), os.path.getsize(file_path)
+        )
+        video.blob = blob
+        if created:
+            video.save(update_fields=['blob'])
+            return enqueue_transcode(video, file_path)
+
+        # Same bytes as an earlier upload: drop the copy, share the stored file
+        upload_dir = os.path.dirname(file_path)
+        if os.path.dirname(media_path(blob.path)) != upload_dir:
+            shutil.rmtree(upload_dir, ignore_errors=True)
+        video.original_video_path = blob.path
+        others = Video.objects.filter(blob=blob).exclude(pk=video.pk)
+        source = others.exclude(hls_path='').first() or others.exclude(probed_at=None).first()
+        shared_fields = ['hls_path', 'renditions', 'thumbnails'] + Video.METADATA_FIELDS + Video.HLS_STATS_FIELDS
+        if source:
+            for field in shared_fields:
+                setattr(video, field, getattr(source, field))
+        video.save(update_fields=['blob', 'original_video_path'] + shared_fields)
+        if video.hls_path:
+            return None
+
+        job = TranscodeJob.objects.filter(video__blob=blob).order_by('-created_at', '-id').first()
+        if job is None or job.status == TranscodeJob.Status.FAILED:
+            job = enqueue_transcode(video, media_path(blob.path))
+        return job
+
+
+def release_video_blob(blob_id):
+    """Recount the videos using a blob after one was deleted, drop the blob when none is left"""
+    with transaction.atomic():
+        blob = MediaBlob.objects.select_for_update().filter(pk=blob_id).first()
+        if blob is None:
+            return
+        refs = Video.objects.filter(blob_id=blob_id).count()
+        if refs:
+            MediaBlob.objects.filter(pk=blob_id).update(ref_count=refs)
+        else:
+            blob.delete()
+
+
+def video_file_in_use(original_video_path):
+    """True while a video or a blob still points at this source file"""
+    return (
+        Video.objects.filter(original_video_path=original_video_path).exists()
+        or MediaBlob.objects.filter(path=original_video_path).exists()
+    )
+
+
+def store_image(file):
+    """
+    Save an uploaded image once per content and return its URL.
+
+    The upload is hashed while it is written to a temp file, which is then
+    either renamed to banner/<sha256><ext> or dropped when that file exists.
+    """
+    directory = os.path.join(settings.MEDIA_ROOT, IMAGE_DIRECTORY)
+    os.makedirs(directory, exist_ok=True)
+    ext = os.path.splitext(file.name)[1].lower()
+
+    temp_path = os.path.join(directory, f".upload-{uuid.uuid4().hex}{ext}")
+    digest = hashlib.sha256()
+    size = 0
+    with open(temp_path, 'wb') as destination:
+        for chunk in file.chunks():
+            destination.write(chunk)
+            digest.update(chunk)
+            size += len(chunk)
+    sha256 = digest.hexdigest()
+
+    final_path = os.path.join(directory, f"{sha256}{ext}")
+    blob, created = _get_or_create_blob(sha256, MediaBlob.Kind.IMAGE, media_url(final_path), size)
+    if created or not os.path.exists(media_path(blob.path)):
+        os.replace(temp_path, media_path(blob.path))
+    else:
+        os.remove(temp_path)
+    return blob.path
+
+
+def release_image(url):
+    """
+    Drop one reference to an image, removing the file with the last one.
+
+    Images saved before deduplication have no blob and are removed right away,
+    like they always were.
+    """
+    if not url or url[len(settings.MEDIA_URL):] in DEFAULT_IMAGES:
+        return
+    with transaction.atomic():
+        blob = MediaBlob.objects.select_for_update().filter(path=url, kind=MediaBlob.Kind.IMAGE).first()
+        if blob is not None and blob.ref_count > 1:
+            MediaBlob.objects.filter(pk=blob.pk).update(ref_count=F('ref_count') - 1)
+            return
+        if blob is not None:
+            blob.delete()
+    full_path = media_path(url)
+    if os.path.exists(full_path):
+        os.remove(full_path)
+
+
+def discard_unreferenced_image(url):
+    """
+    Remove an image saved in a transaction that was rolled back.
+
+    The blob row went away with the rollback when the image was new, a
+    duplicate of an existing image still has its row and is kept.
+    """
+    if not url or url[len(settings.MEDIA_URL):] in DEFAULT_IMAGES:
+        return
+    if MediaBlob.objects.filter(path=url).exists():
+        return
+    full_path = media_path(url)
+    if os.path.exists(full_path):
+        os.remove(full_path)
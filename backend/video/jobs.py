@@ -0,0 +1,186 @@
+"""
+Database-backed transcoding queue.
+
+Uploads only store the file and enqueue a TranscodeJob, the HLS conversion is
+done by `python manage.py transcode_worker`, outside of the web workers.
+Jobs are claimed with SELECT ... FOR UPDATE SKIP LOCKED so several worker
+processes can share the queue, and running jobs report ffmpeg progress.
+Each job starts with a probe stage: ffprobe runs once and its results
+(duration, resolution, codecs, bitrate) are stored on the Video, the HLS
+segment count and size are added when the conversion is done.
+"""
+import logging
+import os
+import socket
+import time
+from datetime import timedelta
+
+from django.apps import apps
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from video.models import TranscodeJob, Video
+from video.utils import (
+    generate_hls, generate_abr_hls, probe_media, media_metadata, hls_output_stats, remove_stale_hls_outputs,
+    TranscodeError
+)
+
+logger = logging.getLogger(__name__)
+
+PROGRESS_SAVE_INTERVAL = 2  # seconds between progress writes
+STALE_JOB_TIMEOUT = timedelta(minutes=10)  # running jobs without a progress write for this long are requeued
+
+
+def default_worker_name():
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def enqueue_transcode(video, source_path):
+    """Queue the HLS conversion of an uploaded file"""
+    return TranscodeJob.objects.create(video=video, source_path=source_path)
+
+
+def latest_transcode_status(video):
+    """Status of the most recent job of a video, None for videos uploaded before the queue existed"""
+    return (
+        TranscodeJob.objects.filter(video=video)
+        .order_by('-created_at', '-id')
+        .values_list('status', flat=True)
+        .first()
+    )
+
+
+def claim_next_job(worker_name):
+    """Atomically take the oldest queued job, or return None when the queue is empty"""
+    with transaction.atomic():
+        job = (
+            TranscodeJob.objects
+            .select_for_update(skip_locked=True)
+            .filter(status=TranscodeJob.Status.QUEUED)
+            .order_by('created_at')
+            .first()
+        )
+        if job is None:
+            return None
+        job.status = TranscodeJob.Status.RUNNING
+        job.attempts += 1
+        job.worker = worker_name
+        job.progress = 0
+        job.started_at = timezone.now()
+        job.finished_at = None
+        job.save()
+    return job
+
+
+def requeue_stale_jobs():
+    """Put back running jobs whose worker died (no progress write for STALE_JOB_TIMEOUT)"""
+    cutoff = timezone.now() - STALE_JOB_TIMEOUT
+    return TranscodeJob.objects.filter(
+        status=TranscodeJob.Status.RUNNING, updated_at__lt=cutoff
+    ).update(status=TranscodeJob.Status.QUEUED, error='Worker stopped responding', updated_at=timezone.now())
+
+
+def _progress_writer(job_id):
+    """Progress callback that writes at most every PROGRESS_SAVE_INTERVAL seconds"""
+    last_write = [0.0]
+
+    def write(percent):
+        now = time.monotonic()
+        if now - last_write[0] < PROGRESS_SAVE_INTERVAL:
+            return
+        last_write[0] = now
+        # Without a known duration only updated_at moves, which keeps the job from looking stale
+        fields = {'updated_at': timezone.now()}
+        if percent is not None:
+            fields['progress'] = round(percent, 1)
+        TranscodeJob.objects.filter(id=job_id).update(**fields)
+
+    return write
+
+
+def record_media_metadata(video, probe):
+    """
+    Store the ffprobe results on the video and on the videos sharing its file.
+
+    Movies and episodes without a duration get the probed one (in minutes),
+    durations typed in by hand are kept.
+    """
+    metadata = media_metadata(probe)
+    metadata['probed_at'] = timezone.now()
+    for field, value in metadata.items():
+        setattr(video, field, value)
+    video.save(update_fields=list(metadata))
+    if video.blob_id:
+        Video.objects.filter(blob_id=video.blob_id).exclude(pk=video.pk).update(**metadata)
+
+    if metadata['duration']:
+        # Imported here, film imports the video app and not the other way round
+        from film.documents import schedule_document_rebuilds
+
+        minutes = max(1, round(metadata['duration'] / 60))
+        videos = Video.objects.filter(blob_id=video.blob_id) if video.blob_id else Video.objects.filter(pk=video.pk)
+        for model_name, content_field in (('Movie', 'content_id'), ('Episode', 'season__series__content_id')):
+            empty = apps.get_model('film', model_name).objects.filter(video__in=videos, duration=0)
+            content_ids = list(empty.values_list(content_field, flat=True))
+            if empty.update(duration=minutes):
+                # The UPDATE sends no signals, the detail documents show the duration
+                schedule_document_rebuilds(content_ids)
+    return metadata
+
+
+def run_transcode_job(job):
+    """
+    Convert the source file of a claimed job to HLS and record the result.
+
+    Failed attempts are queued again until `max_attempts` is reached.
+    """
+    video = job.video
+    progress_callback = _progress_writer(job.id)
+    # Fresh folder per job, files already served (and cached as immutable) are never rewritten
+    version = f"job_{job.id}"
+    probe = probe_media(job.source_path)
+    if probe is not None:
+        record_media_metadata(video, probe)
+    try:
+        if getattr(settings, 'HLS_ABR_ENABLED', True):
+            hls_url, renditions, thumbnails = generate_abr_hls(
+                job.source_path, video, progress_callback=progress_callback, probe=probe, version=version
+            )
+        else:
+            renditions = []
+            hls_url, thumbnails = generate_hls(
+                job.source_path, video, progress_callback=progress_callback, probe=probe, version=version
+            )
+    except (TranscodeError, OSError) as e:
+        logger.warning(f"Transcode job {job.id} failed: {e}")
+        job.error = str(e)
+        job.finished_at = timezone.now()
+        job.status = (
+            TranscodeJob.Status.QUEUED if job.attempts < job.max_attempts else TranscodeJob.Status.FAILED
+        )
+        job.save(update_fields=['error', 'finished_at', 'status', 'updated_at'])
+        return job
+
+    segment_count, hls_size = hls_output_stats(hls_url)
+    with transaction.atomic():
+        video.hls_path = hls_url
+        video.renditions = renditions
+        video.thumbnails = thumbnails
+        video.segment_count = segment_count
+        video.hls_size = hls_size
+        video.save(update_fields=['hls_path', 'renditions', 'thumbnails', 'segment_count', 'hls_size'])
+        if video.blob_id:
+            # Duplicate uploads of the same file share this output (and drop the earlier ones)
+            Video.objects.filter(blob_id=video.blob_id).exclude(pk=video.pk).update(
+                hls_path=hls_url, renditions=renditions, thumbnails=thumbnails,
+                segment_count=segment_count, hls_size=hls_size
+            )
+        job.status = TranscodeJob.Status.SUCCEEDED
+        job.progress = 100
+        job.error = ''
+        job.finished_at = timezone.now()
+        job.save(update_fields=['status', 'progress', 'error', 'finished_at', 'updated_at'])
+    # Nothing points at the earlier outputs of this file anymore
+    remove_stale_hls_outputs(job.source_path, version)
+    return job
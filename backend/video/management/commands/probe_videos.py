@@ -0,0 +1,53 @@
+"""
+Django management command that probes videos uploaded before the transcode
+jobs recorded media metadata
+"""
+from django.core.management.base import BaseCommand
+from video.models import Video
+from video.jobs import record_media_metadata
+from video.utils import probe_media, media_path, hls_output_stats
+
+
+class Command(BaseCommand):
+    help = 'Store ffprobe metadata (duration, resolution, codecs, bitrate) and HLS stats on existing videos'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--all',
+            action='store_true',
+            help='Probe every video again, not only the ones without metadata'
+        )
+        parser.add_argument(
+            '--limit',
+            type=int,
+            default=None,
+            help='Maximum number of videos to probe'
+        )
+
+    def handle(self, *args, **options):
+        videos = Video.objects.exclude(original_video_path='').order_by('id')
+        if not options['all']:
+            videos = videos.filter(probed_at__isnull=True)
+        if options['limit']:
+            videos = videos[:options['limit']]
+
+        probed = failed = 0
+        for video in videos.iterator():
+            probe = probe_media(media_path(video.original_video_path))
+            if probe is None:
+                failed += 1
+                self.stdout.write(self.style.WARNING(f'⚠️ Video {video.id}: cannot probe {video.original_video_path}'))
+                continue
+
+            metadata = record_media_metadata(video, probe)
+            if video.hls_path:
+                video.segment_count, video.hls_size = hls_output_stats(video.hls_path)
+                video.save(update_fields=Video.HLS_STATS_FIELDS)
+            probed += 1
+            self.stdout.write(
+                f"🎞️ Video {video.id}: {metadata['width']}x{metadata['height']} "
+                f"{metadata['video_codec']}/{metadata['audio_codec']}, {metadata['duration']}s, "
+                f"{video.segment_count} segments"
+            )
+
+        self.stdout.write(self.style.SUCCESS(f'✅ Probed {probed} videos ({failed} failed)'))
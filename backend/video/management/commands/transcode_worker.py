@@ -0,0 +1,77 @@
+"""
+Django management command that processes queued HLS transcoding jobs
+"""
+import time
+from concurrent.futures import ThreadPoolExecutor
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from video.jobs import claim_next_job, requeue_stale_jobs, run_transcode_job, default_worker_name
+
+
+class Command(BaseCommand):
+    help = 'Run queued video transcoding jobs with a bounded number of concurrent ffmpeg processes'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--concurrency',
+            type=int,
+            default=2,
+            help='Maximum number of jobs transcoded at the same time, each running up to '
+                 'HLS_RENDITION_WORKERS ffmpeg processes (default: 2)'
+        )
+        parser.add_argument(
+            '--poll-interval',
+            type=float,
+            default=2.0,
+            help='Seconds to wait before checking an empty queue again'
+        )
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Process the jobs currently queued and exit'
+        )
+
+    def handle(self, *args, **options):
+        concurrency = max(1, options['concurrency'])
+        poll_interval = options['poll_interval']
+        worker_name = default_worker_name()
+
+        requeued = requeue_stale_jobs()
+        if requeued:
+            self.stdout.write(self.style.WARNING(f'⚠️ Requeued {requeued} stale jobs'))
+        self.stdout.write(f'🎬 Transcode worker {worker_name} started ({concurrency} slots)')
+
+        # Each slot is a thread waiting on the ffmpeg processes of its job, the encoding itself runs outside Python
+        running = set()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            while True:
+                running = {future for future in running if not future.done()}
+
+                job = None
+                if len(running) < concurrency:
+                    job = claim_next_job(worker_name)
+                    if job is not None:
+                        self.stdout.write(f'▶️ Job {job.id}: video {job.video_id} (attempt {job.attempts})')
+                        running.add(pool.submit(self.run_job, job))
+                        continue
+
+                if options['once'] and job is None and not running:
+                    break
+                if not running:
+                    requeue_stale_jobs()
+                time.sleep(poll_interval)
+
+        self.stdout.write(self.style.SUCCESS('✅ Transcode worker stopped'))
+
+    def run_job(self, job):
+        close_old_connections()
+        try:
+            job = run_transcode_job(job)
+            if job.status == job.Status.SUCCEEDED:
+                self.stdout.write(self.style.SUCCESS(f'✅ Job {job.id} done: {job.video.hls_path}'))
+            else:
+                self.stdout.write(self.style.ERROR(f'❌ Job {job.id} {job.status}: {job.error[-200:]}'))
+        except Exception as e:
+            self.stdout.write(self.style.ERROR(f'❌ Job {job.id} crashed: {str(e)}'))
+        finally:
+            close_old_connections()
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('video', '0002_transcodejob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='video',
+            name='renditions',
+            field=models.JSONField(blank=True, default=list, help_text='HLS renditions listed in the master playlist'),
+        ),
+    ]
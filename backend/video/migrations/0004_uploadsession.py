@@ -0,0 +1,30 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:48
+
+import django.db.models.deletion
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('video', '0003_video_renditions'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UploadSession',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('filename', models.CharField(max_length=255)),
+                ('file_path', models.CharField(help_text='Absolute path the chunks are written to', max_length=500)),
+                ('size', models.BigIntegerField(help_text='Total size announced by the client, in bytes')),
+                ('offset', models.BigIntegerField(default=0, help_text='Bytes received and verified so far')),
+                ('sha256', models.CharField(blank=True, help_text='Optional checksum of the whole file', max_length=64)),
+                ('status', models.CharField(choices=[('uploading', 'Uploading'), ('completed', 'Completed')], default='uploading', max_length=10)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('video', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='upload_session', to='video.video')),
+            ],
+        ),
+    ]
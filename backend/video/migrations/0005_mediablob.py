@@ -0,0 +1,34 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:51
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('video', '0004_uploadsession'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MediaBlob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('sha256', models.CharField(max_length=64, unique=True)),
+                ('kind', models.CharField(choices=[('video', 'Video'), ('image', 'Image')], max_length=10)),
+                ('path', models.CharField(help_text='URL of the stored file (under MEDIA_URL)', max_length=500)),
+                ('size', models.BigIntegerField(default=0)),
+                ('ref_count', models.PositiveIntegerField(default=1, help_text='Number of videos / image fields using the file')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['path'], name='video_media_path_95c0a5_idx')],
+            },
+        ),
+        migrations.AddField(
+            model_name='video',
+            name='blob',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='videos', to='video.mediablob'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('video', '0006_video_metadata'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='video',
+            name='thumbnails',
+            field=models.JSONField(blank=True, default=dict, help_text='WebVTT seek preview track and its sprite sheets'),
+        ),
+    ]
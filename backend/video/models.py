@@ -1,20 +1,124 @@
 from django.db import models
 import os
+import uuid
 from video.utils import video_upload_path
 from django.conf import settings
 import shutil
+
+class MediaBlob(models.Model):
+    """An uploaded file stored once per content hash, shared by every upload of the same bytes"""
+
+    class Kind(models.TextChoices):
+        VIDEO = 'video'
+        IMAGE = 'image'
+
+    sha256 = models.CharField(max_length=64, unique=True)
+    kind = models.CharField(max_length=10, choices=Kind.choices)
+    path = models.CharField(max_length=500, help_text="URL of the stored file (under MEDIA_URL)")
+    size = models.BigIntegerField(default=0)
+    ref_count = models.PositiveIntegerField(default=1, help_text="Number of videos / image fields using the file")
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['path']),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} {self.sha256[:12]} ({self.ref_count} refs)"
+
 class Video(models.Model):
     original_video_path = models.CharField(max_length=255, blank=True, help_text="Path to original video file")
     hls_path = models.CharField(max_length=255, blank=True, help_text="Path to file M3U8")
+    renditions = models.JSONField(default=list, blank=True, help_text="HLS renditions listed in the master playlist")
+    thumbnails = models.JSONField(default=dict, blank=True, help_text="WebVTT seek preview track and its sprite sheets")
+    blob = models.ForeignKey(MediaBlob, on_delete=models.SET_NULL, null=True, blank=True, related_name='videos')
+
+    # Filled in by the probe stage of the transcode job (ffprobe runs once per upload)
+    duration = models.FloatField(null=True, blank=True, help_text="Duration in seconds")
+    width = models.PositiveIntegerField(null=True, blank=True)
+    height = models.PositiveIntegerField(null=True, blank=True)
+    video_codec = models.CharField(max_length=50, blank=True)
+    audio_codec = models.CharField(max_length=50, blank=True)
+    bitrate = models.PositiveBigIntegerField(null=True, blank=True, help_text="Overall bitrate of the source in bit/s")
+    segment_count = models.PositiveIntegerField(default=0, help_text="HLS segments per rendition")
+    hls_size = models.PositiveBigIntegerField(default=0, help_text="Total bytes of the HLS output")
+    probed_at = models.DateTimeField(null=True, blank=True)
+
+    # Probe results, copied as a whole to videos sharing the same file
+    METADATA_FIELDS = ['duration', 'width', 'height', 'video_codec', 'audio_codec', 'bitrate', 'probed_at']
+    HLS_STATS_FIELDS = ['segment_count', 'hls_size']
 
     def __str__(self):
         return os.path.basename(self.original_video_path)
 
     def delete(self, *args, **kwargs):
+        from video.blobs import release_video_blob, video_file_in_use
         original_video_path = self.original_video_path
+        blob_id = self.blob_id
+        super().delete(*args, **kwargs)
+
+        # Deduplicated uploads share the folder of the first upload, keep it while anyone uses it
+        if blob_id:
+            release_video_blob(blob_id)
+        if not original_video_path or video_file_in_use(original_video_path):
+            return
         video_folder = os.path.dirname(original_video_path)
         video_folder = video_folder.lstrip("/")
         video_folder = os.path.join(settings.BASE_DIR, video_folder)
         if os.path.exists(video_folder) and os.path.isdir(video_folder):
             shutil.rmtree(video_folder)
-        super().delete(*args, **kwargs)
\ No newline at end of file
+
+class TranscodeJob(models.Model):
+    """A queued HLS conversion of an uploaded video, processed by `manage.py transcode_worker`"""
+
+    class Status(models.TextChoices):
+        QUEUED = 'queued'
+        RUNNING = 'running'
+        SUCCEEDED = 'succeeded'
+        FAILED = 'failed'
+
+    video = models.ForeignKey(Video, on_delete=models.CASCADE, related_name='transcode_jobs')
+    source_path = models.CharField(max_length=500, help_text="Absolute path of the uploaded file to convert")
+    status = models.CharField(max_length=10, choices=Status.choices, default=Status.QUEUED)
+    progress = models.FloatField(default=0, help_text="Percentage (0-100) parsed from ffmpeg -progress")
+    attempts = models.PositiveSmallIntegerField(default=0)
+    max_attempts = models.PositiveSmallIntegerField(default=3)
+    error = models.TextField(blank=True)
+    worker = models.CharField(max_length=100, blank=True, help_text="Worker that ran the last attempt")
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['created_at']
+        indexes = [
+            models.Index(fields=['status', 'created_at']),
+        ]
+
+    def __str__(self):
+        return f"TranscodeJob {self.id} (video {self.video_id}): {self.status}"
+
+
+
+class UploadSession(models.Model):
+    """A resumable upload, chunks are appended straight into the final file of its Video"""
+
+    class Status(models.TextChoices):
+        UPLOADING = 'uploading'
+        COMPLETED = 'completed'
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    video = models.OneToOneField(Video, on_delete=models.CASCADE, related_name='upload_session')
+    filename = models.CharField(max_length=255)
+    file_path = models.CharField(max_length=500, help_text="Absolute path the chunks are written to")
+    size = models.BigIntegerField(help_text="Total size announced by the client, in bytes")
+    offset = models.BigIntegerField(default=0, help_text="Bytes received and verified so far")
+    sha256 = models.CharField(max_length=64, blank=True, help_text="Optional checksum of the whole file")
+    status = models.CharField(max_length=10, choices=Status.choices, default=Status.UPLOADING)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"UploadSession {self.id}: {self.offset}/{self.size}"
@@ -1,8 +1,9 @@
 from rest_framework import serializers
-from .models import Video
+from .models import Video, TranscodeJob, UploadSession
 import os
+import hashlib
 from django.conf import settings
-from video.utils import generate_hls
+from video.blobs import attach_video_blob
 
 class VideoUploadSerializer(serializers.ModelSerializer):
     file = serializers.FileField(write_only=True)  # Nhận file video từ request
@@ -22,21 +23,48 @@ class VideoUploadSerializer(serializers.ModelSerializer):
         # File name format: /media/videos/video_{instance_id}/file_name.mp4
         file_path = os.path.join(upload_dir, video_file.name)
 
-        # Lưu file vào đường dẫn
+        # Lưu file vào đường dẫn, hashing it on the way for deduplication
+        digest = hashlib.sha256()
         with open(file_path, 'wb+') as destination:
             for chunk in video_file.chunks():
                 destination.write(chunk)
+                digest.update(chunk)
 
         # Cập nhật đường dẫn file vào database
         video_instance.original_video_path = file_path.replace(f"{settings.MEDIA_ROOT}/", settings.MEDIA_URL)
-        generate_hls(file_path, video_instance)
-        video_instance.hls_path = f"{settings.MEDIA_URL}videos/video_{video_instance.id}/index.m3u8"
         video_instance.save()
 
+        # HLS conversion runs in `manage.py transcode_worker`, hls_path is filled in when it is done.
+        # A file uploaded before reuses the stored copy and its HLS output, the job is then None
+        video_instance.transcode_job = attach_video_blob(video_instance, file_path, digest.hexdigest())
+
         return video_instance
 
+class VideoMetadataSerializer(serializers.ModelSerializer):
+    """Probed media metadata, null until the transcode job has probed the file"""
+    class Meta:
+        model = Video
+        fields = Video.METADATA_FIELDS + Video.HLS_STATS_FIELDS
+
 class VideoSerializer(serializers.ModelSerializer):
     class Meta:
         model = Video
-        fields = ['id', 'original_video_path', 'hls_path']
+        fields = ['id', 'original_video_path', 'hls_path', 'renditions', 'thumbnails'] + VideoMetadataSerializer.Meta.fields
 
+class TranscodeJobSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = TranscodeJob
+        fields = [
+            'id', 'video', 'status', 'progress', 'attempts', 'error',
+            'created_at', 'started_at', 'finished_at', 'updated_at'
+        ]
+
+class UploadSessionCreateSerializer(serializers.Serializer):
+    filename = serializers.CharField(max_length=255)
+    size = serializers.IntegerField(min_value=1)
+    sha256 = serializers.RegexField(r'^[0-9a-fA-F]{64}$', required=False, allow_blank=True)
+
+class UploadSessionSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = UploadSession
+        fields = ['id', 'video', 'filename', 'size', 'offset', 'status', 'created_at', 'updated_at']
@@ -1,3 +1,529 @@
-from django.test import TestCase
+import datetime
+import io
+import os
+import shutil
+import tempfile
+from unittest import mock
 
-# Create your tests here.
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from core.hls_cache import HLSFileCache, get_file_cache
+from film.models import Content, Movie
+from video import utils
+from video.blobs import release_image, store_image
+from video.jobs import STALE_JOB_TIMEOUT, claim_next_job, record_media_metadata, requeue_stale_jobs, run_transcode_job
+from video.models import MediaBlob, TranscodeJob, UploadSession, Video
+from video.uploads import OffsetMismatch, append_chunk
+from video.utils import DEMO_VIDEO_PATH, TranscodeError, hls_output_dir, media_url
+
+PROBE = {
+    'format': {'duration': '12.5', 'bit_rate': '800000'},
+    'streams': [{'codec_type': 'video', 'codec_name': 'h264', 'width': 640, 'height': 360}],
+}
+
+
+class MediaRootTestCase(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def write_media(self, name, data=b'x'):
+        path = os.path.join(self.media_root, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as f:
+            f.write(data)
+        return path
+
+
+class DemoVideoMetadataTests(MediaRootTestCase):
+    def setUp(self):
+        super().setUp()
+        utils._file_metadata.clear()
+        self.addCleanup(utils._file_metadata.clear)
+        self.demo_path = self.write_media(DEMO_VIDEO_PATH)
+        content = Content.objects.create(
+            title='Movie', content_type='movie', release_date=datetime.date(2020, 1, 1),
+            description='d', banner_img_url='/media/x.jpg'
+        )
+        self.movie = Movie.objects.create(content=content, duration=90)
+
+    def test_demo_video_is_probed_once_per_process(self):
+        with mock.patch.object(utils, 'probe_media', return_value=PROBE) as probe:
+            for _ in range(3):
+                response = self.client.get(f'/api/v1/film/movies/{self.movie.content_id}/video/')
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(response.json()['duration'], 12.5)
+
+        probe.assert_called_once_with(self.demo_path)
+
+    def test_changed_demo_video_is_probed_again(self):
+        with mock.patch.object(utils, 'probe_media', return_value=PROBE) as probe:
+            utils.demo_video_metadata()
+            stat = os.stat(self.demo_path)
+            os.utime(self.demo_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+            utils.demo_video_metadata()
+
+        self.assertEqual(probe.call_count, 2)
+
+
+class MediaMetadataTests(TestCase):
+    def create_movie(self, title, duration, video):
+        content = Content.objects.create(
+            title=title, content_type='movie', release_date=datetime.date(2020, 1, 1),
+            description='d', banner_img_url='/media/x.jpg'
+        )
+        return Movie.objects.create(content=content, duration=duration, video=video)
+
+    def test_probe_only_fills_missing_durations(self):
+        video = Video.objects.create(original_video_path='/media/videos/video_1/a.mp4')
+        typed = self.create_movie('Typed', 90, video)
+        missing = self.create_movie('Missing', 0, video)
+        probe = dict(PROBE, format={'duration': '1480.5', 'bit_rate': '800000'})
+
+        with mock.patch('film.documents.schedule_document_rebuilds') as rebuild:
+            record_media_metadata(video, probe)
+
+        self.assertEqual(Movie.objects.get(pk=typed.pk).duration, 90)
+        self.assertEqual(Movie.objects.get(pk=missing.pk).duration, 25)
+        rebuild.assert_called_once_with([missing.content_id])
+
+    def test_video_endpoint_keeps_the_duration_in_minutes(self):
+        video = Video.objects.create(original_video_path='/media/videos/video_1/a.mp4', duration=1480.5)
+        movie = self.create_movie('Movie', 90, video)
+
+        data = self.client.get(f'/api/v1/film/movies/{movie.content_id}/video/').json()
+
+        self.assertEqual((data['duration'], data['duration_seconds']), (90, 1480.5))
+
+
+class TranscodeOutputTests(MediaRootTestCase):
+    def fake_abr_hls(self, video_path, video_instance, progress_callback=None, probe=None, version=None):
+        output_dir = hls_output_dir(video_path, version)
+        self.write_media(os.path.relpath(os.path.join(output_dir, 'master.m3u8'), self.media_root), b'#EXTM3U\n')
+        self.write_media(os.path.relpath(os.path.join(output_dir, '720p', 'segment_00000.ts'), self.media_root))
+        return media_url(os.path.join(output_dir, 'master.m3u8')), [], {}
+
+    def test_every_transcode_writes_a_new_folder_and_drops_the_old_one(self):
+        source_path = self.write_media('videos/video_1/a.mp4')
+        video = Video.objects.create(original_video_path=media_url(source_path))
+
+        with mock.patch('video.jobs.probe_media', return_value=PROBE), \
+                mock.patch('video.jobs.generate_abr_hls', side_effect=self.fake_abr_hls):
+            first = run_transcode_job(TranscodeJob.objects.create(video=video, source_path=source_path))
+            first_path = Video.objects.get(pk=video.pk).hls_path
+            second = run_transcode_job(TranscodeJob.objects.create(video=video, source_path=source_path))
+            second_path = Video.objects.get(pk=video.pk).hls_path
+
+        self.assertEqual(first.status, TranscodeJob.Status.SUCCEEDED)
+        self.assertEqual(second.status, TranscodeJob.Status.SUCCEEDED)
+        self.assertNotEqual(first_path, second_path)
+        self.assertEqual(os.listdir(hls_output_dir(source_path)), [f'job_{second.id}'])
+
+
+class HLSMiddlewareTests(MediaRootTestCase):
+    segment_url = '/media/videos/video_1/hls/job_1/720p/segment_00000.ts'
+    playlist_url = '/media/videos/video_1/hls/job_1/720p/index.m3u8'
+
+    def setUp(self):
+        super().setUp()
+        get_file_cache().invalidate()
+        self.addCleanup(get_file_cache().invalidate)
+        self.data = bytes(range(256)) * 40
+        self.write_media(self.segment_url[len('/media/'):], self.data)
+        self.write_media(self.playlist_url[len('/media/'):], b'#EXTM3U\n')
+
+    def body(self, response):
+        return b''.join(response.streaming_content) if response.streaming else response.content
+
+    def test_full_file(self):
+        response = self.client.get(self.segment_url)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.body(response), self.data)
+        self.assertEqual(response['Content-Length'], str(len(self.data)))
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.assertEqual(response['Content-Type'], 'video/mp2t')
+
+    def test_byte_range(self):
+        response = self.client.get(self.segment_url, HTTP_RANGE='bytes=10-19')
+
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], f'bytes 10-19/{len(self.data)}')
+        self.assertEqual(response['Content-Length'], '10')
+        self.assertEqual(self.body(response), self.data[10:20])
+
+    def test_suffix_and_open_ranges(self):
+        response = self.client.get(self.segment_url, HTTP_RANGE='bytes=-5')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(self.body(response), self.data[-5:])
+
+        response = self.client.get(self.segment_url, HTTP_RANGE=f'bytes={len(self.data) - 3}-')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(self.body(response), self.data[-3:])
+
+    def test_unsatisfiable_range(self):
+        response = self.client.get(self.segment_url, HTTP_RANGE=f'bytes={len(self.data)}-')
+
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response['Content-Range'], f'bytes */{len(self.data)}')
+
+    def test_multiple_ranges_are_multipart(self):
+        response = self.client.get(self.segment_url, HTTP_RANGE='bytes=0-1,5-6')
+
+        self.assertEqual(response.status_code, 206)
+        self.assertTrue(response['Content-Type'].startswith('multipart/byteranges'))
+        body = self.body(response)
+        self.assertEqual(len(body), int(response['Content-Length']))
+        self.assertIn(f'Content-Range: bytes 5-6/{len(self.data)}'.encode(), body)
+
+    def test_malformed_range_serves_the_whole_file(self):
+        response = self.client.get(self.segment_url, HTTP_RANGE='garbage')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.body(response), self.data)
+
+    def test_paths_outside_media_root_are_not_served(self):
+        response = self.client.get('/media/videos/../../manage.py.ts')
+
+        self.assertEqual(response.status_code, 404)
+
+    @override_settings(HLS_SENDFILE_MODE='x-accel', HLS_ACCEL_REDIRECT_PREFIX='/protected-media/')
+    def test_x_accel_hands_the_file_to_nginx(self):
+        response = self.client.get(self.segment_url)
+
+        self.assertEqual(response['X-Accel-Redirect'], '/protected-media/' + self.segment_url[len('/media/'):])
+        self.assertEqual(response.content, b'')
+
+    def test_segments_are_immutable_and_playlists_short_lived(self):
+        self.assertIn('immutable', self.client.get(self.segment_url)['Cache-Control'])
+        self.assertEqual(self.client.get(self.playlist_url)['Cache-Control'], 'public, max-age=10')
+
+    def test_matching_etag_answers_304(self):
+        etag = self.client.get(self.segment_url)['ETag']
+
+        response = self.client.get(self.segment_url, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+
+    def test_if_modified_since_answers_304(self):
+        last_modified = self.client.get(self.segment_url)['Last-Modified']
+
+        response = self.client.get(self.segment_url, HTTP_IF_MODIFIED_SINCE=last_modified)
+
+        self.assertEqual(response.status_code, 304)
+
+    def test_stale_if_range_serves_the_whole_file(self):
+        response = self.client.get(self.segment_url, HTTP_RANGE='bytes=0-9', HTTP_IF_RANGE='"stale"')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.body(response), self.data)
+
+    def test_current_if_range_serves_the_range(self):
+        etag = self.client.get(self.segment_url)['ETag']
+
+        response = self.client.get(self.segment_url, HTTP_RANGE='bytes=0-9', HTTP_IF_RANGE=etag)
+
+        self.assertEqual(response.status_code, 206)
+
+
+class HLSFileCacheTests(MediaRootTestCase):
+    def cache(self, **options):
+        options = dict({'max_entries': 10, 'max_bytes': 1024, 'max_file_size': 100, 'revalidate_seconds': 60}, **options)
+        return HLSFileCache(**options)
+
+    def test_repeated_lookups_are_served_from_memory(self):
+        path = self.write_media('videos/a/index.m3u8', b'#EXTM3U\n')
+        cache = self.cache()
+        resolve = mock.Mock(return_value=path)
+
+        first = cache.get('a', resolve)
+        second = cache.get('a', resolve)
+
+        self.assertIs(first, second)
+        self.assertEqual(first.content, b'#EXTM3U\n')
+        resolve.assert_called_once_with('a')
+        self.assertEqual(cache.stats()['hits'], 1)
+
+    def test_changed_file_is_reloaded_after_the_revalidation_window(self):
+        path = self.write_media('videos/a/index.m3u8', b'#EXTM3U\n')
+        cache = self.cache(revalidate_seconds=0)
+        cache.get('a', lambda key: path)
+
+        self.write_media('videos/a/index.m3u8', b'#EXTM3U\n#EXT-X-ENDLIST\n')
+        stat = os.stat(path)
+        os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+
+        self.assertEqual(cache.get('a', lambda key: path).content, b'#EXTM3U\n#EXT-X-ENDLIST\n')
+
+    def test_large_files_keep_only_their_stat(self):
+        path = self.write_media('videos/a/segment_00000.ts', b'x' * 200)
+
+        entry = self.cache().get('a', lambda key: path)
+
+        self.assertIsNone(entry.content)
+        self.assertEqual(entry.size, 200)
+
+    def test_least_recently_used_entries_are_evicted(self):
+        paths = {key: self.write_media(f'videos/{key}/index.m3u8', b'x' * 40) for key in 'abc'}
+        cache = self.cache(max_entries=2)
+        cache.get('a', paths.get)
+        cache.get('b', paths.get)
+        cache.get('a', paths.get)
+        cache.get('c', paths.get)
+
+        self.assertEqual(cache.stats()['entries'], 2)
+        resolve = mock.Mock(side_effect=paths.get)
+        cache.get('a', resolve)
+        cache.get('b', resolve)
+        resolve.assert_called_once_with('b')
+
+    def test_missing_file_is_not_cached(self):
+        self.assertIsNone(self.cache().get('a', lambda key: os.path.join(self.media_root, 'missing.ts')))
+
+
+class TranscodeJobTests(MediaRootTestCase):
+    def setUp(self):
+        super().setUp()
+        self.video = Video.objects.create()
+
+    def test_upload_only_queues_the_conversion(self):
+        response = self.client.post('/api/v1/video/upload/', {'video_file': SimpleUploadedFile('a.mp4', b'video')})
+
+        self.assertEqual(response.status_code, 202)
+        video = Video.objects.get(pk=response.json()['video']['id'])
+        self.assertEqual(video.hls_path, '')
+        job = TranscodeJob.objects.get(video=video)
+        self.assertEqual(job.status, TranscodeJob.Status.QUEUED)
+        self.assertTrue(os.path.exists(job.source_path))
+
+    def test_jobs_are_claimed_oldest_first_once(self):
+        first = TranscodeJob.objects.create(video=self.video, source_path='/a.mp4')
+        second = TranscodeJob.objects.create(video=self.video, source_path='/b.mp4')
+
+        claimed = [claim_next_job('w1'), claim_next_job('w2'), claim_next_job('w3')]
+
+        self.assertEqual([job and job.id for job in claimed], [first.id, second.id, None])
+        first.refresh_from_db()
+        self.assertEqual((first.status, first.attempts, first.worker), (TranscodeJob.Status.RUNNING, 1, 'w1'))
+
+    def test_failed_attempts_are_retried_until_max_attempts(self):
+        TranscodeJob.objects.create(video=self.video, source_path='/missing.mp4', max_attempts=2)
+
+        with mock.patch('video.jobs.probe_media', return_value=None), \
+                mock.patch('video.jobs.generate_abr_hls', side_effect=TranscodeError('boom')):
+            statuses = [run_transcode_job(claim_next_job('w')).status for _ in range(2)]
+
+        self.assertEqual(statuses, [TranscodeJob.Status.QUEUED, TranscodeJob.Status.FAILED])
+        self.assertIsNone(claim_next_job('w'))
+
+    def test_running_jobs_of_a_dead_worker_are_requeued(self):
+        job = TranscodeJob.objects.create(video=self.video, source_path='/a.mp4', status=TranscodeJob.Status.RUNNING)
+        TranscodeJob.objects.filter(pk=job.pk).update(updated_at=timezone.now() - STALE_JOB_TIMEOUT * 2)
+
+        self.assertEqual(requeue_stale_jobs(), 1)
+        job.refresh_from_db()
+        self.assertEqual(job.status, TranscodeJob.Status.QUEUED)
+
+
+class RenditionLadderTests(MediaRootTestCase):
+    def test_renditions_are_not_upscaled(self):
+        renditions = utils.select_renditions((1280, 720), utils.DEFAULT_HLS_RENDITIONS)
+
+        self.assertEqual([r['name'] for r in renditions], ['720p', '480p', '360p'])
+        self.assertEqual([r['width'] for r in renditions], [1280, 854, 640])
+
+    def test_small_sources_get_the_lowest_rendition(self):
+        renditions = utils.select_renditions((320, 240), utils.DEFAULT_HLS_RENDITIONS)
+
+        self.assertEqual([(r['name'], r['width']) for r in renditions], [('360p', 480)])
+
+    def test_master_playlist_lists_every_rendition(self):
+        renditions = utils.select_renditions((1920, 1080), utils.DEFAULT_HLS_RENDITIONS)[:2]
+
+        with open(utils.write_master_playlist(self.media_root, renditions)) as f:
+            lines = f.read().splitlines()
+
+        self.assertEqual(lines, [
+            '#EXTM3U',
+            '#EXT-X-VERSION:3',
+            '#EXT-X-STREAM-INF:BANDWIDTH=5542000,RESOLUTION=1920x1080',
+            '1080p/index.m3u8',
+            '#EXT-X-STREAM-INF:BANDWIDTH=3124000,RESOLUTION=1280x720',
+            '720p/index.m3u8',
+        ])
+
+    def test_renditions_are_encoded_one_at_a_time_by_default(self):
+        probe = dict(PROBE, streams=[dict(PROBE['streams'][0], width=1920, height=1080)])
+        source_path = self.write_media('videos/video_1/a.mp4')
+
+        with mock.patch.object(utils, 'run_ffmpeg') as run_ffmpeg, \
+                mock.patch.object(utils, 'ThreadPoolExecutor', wraps=utils.ThreadPoolExecutor) as pool, \
+                override_settings(HLS_THUMBNAILS={'ENABLED': False}):
+            utils.generate_abr_hls(source_path, None, probe=probe)
+
+        self.assertEqual(pool.call_args.kwargs['max_workers'], 1)
+        self.assertEqual(run_ffmpeg.call_count, 4)
+
+
+class ChunkedUploadTests(MediaRootTestCase):
+    def start_upload(self, size):
+        response = self.client.post('/api/v1/video/uploads/', {'filename': 'episode.mp4', 'size': size},
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 201)
+        return f"/api/v1/video/uploads/{response.json()['id']}/"
+
+    def put_chunk(self, url, data, start, total, **headers):
+        return self.client.put(
+            url, data, content_type='application/octet-stream',
+            HTTP_CONTENT_RANGE=f'bytes {start}-{start + len(data) - 1}/{total}', **headers
+        )
+
+    def test_chunks_resume_at_the_offset_and_queue_the_conversion(self):
+        url = self.start_upload(10)
+
+        self.assertEqual(self.put_chunk(url, b'01234', 0, 10).status_code, 200)
+        self.assertEqual(self.client.get(url)['Upload-Offset'], '5')
+        response = self.put_chunk(url, b'56789', 5, 10)
+
+        self.assertEqual(response.status_code, 202)
+        session = UploadSession.objects.get()
+        self.assertEqual(session.status, UploadSession.Status.COMPLETED)
+        with open(session.file_path, 'rb') as f:
+            self.assertEqual(f.read(), b'0123456789')
+        self.assertTrue(TranscodeJob.objects.filter(video=session.video).exists())
+
+    def test_chunk_at_the_wrong_offset_is_a_conflict(self):
+        url = self.start_upload(10)
+        self.put_chunk(url, b'01234', 0, 10)
+
+        response = self.put_chunk(url, b'23456', 2, 10)
+
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json()['offset'], 5)
+        self.assertEqual(response['Upload-Offset'], '5')
+
+    def test_corrupted_chunk_is_dropped(self):
+        url = self.start_upload(10)
+
+        response = self.put_chunk(url, b'01234', 0, 10, HTTP_X_CHUNK_SHA256='0' * 64)
+
+        self.assertEqual(response.status_code, 400)
+        session = UploadSession.objects.get()
+        self.assertEqual(session.offset, 0)
+        self.assertEqual(os.path.getsize(session.file_path), 0)
+
+    def test_chunk_is_received_before_the_session_is_locked(self):
+        self.start_upload(10)
+        upload_id = UploadSession.objects.get().id
+
+        class RetriedStream(io.BytesIO):
+            """A retry of the same chunk is stored while this one is still being received"""
+            def read(self, size=-1):
+                if not self.tell():
+                    append_chunk(upload_id, io.BytesIO(b'01234'), 0, 4, 10)
+                return super().read(size)
+
+        with self.assertRaises(OffsetMismatch):
+            append_chunk(upload_id, RetriedStream(b'01234'), 0, 4, 10)
+
+        session = UploadSession.objects.get()
+        self.assertEqual(session.offset, 5)
+        with open(session.file_path, 'rb') as f:
+            self.assertEqual(f.read(), b'01234')
+        self.assertEqual(os.listdir(os.path.dirname(session.file_path)), [session.filename])
+
+    def test_fully_received_file_is_completed_by_a_retry(self):
+        url = self.start_upload(10)
+        session = UploadSession.objects.get()
+        with open(session.file_path, 'wb') as f:
+            f.write(b'0123456789')
+        # The request storing the last chunk died before registering the file
+        UploadSession.objects.filter(pk=session.pk).update(offset=10)
+
+        response = self.put_chunk(url, b'56789', 5, 10)
+
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(UploadSession.objects.get().status, UploadSession.Status.COMPLETED)
+
+    def test_bad_content_range_is_rejected(self):
+        url = self.start_upload(10)
+
+        response = self.client.put(url, b'01234', content_type='application/octet-stream',
+                                   HTTP_CONTENT_RANGE='bytes 5-0/10')
+
+        self.assertEqual(response.status_code, 400)
+
+
+class MediaBlobTests(MediaRootTestCase):
+    def upload(self, data):
+        response = self.client.post('/api/v1/video/upload/', {'video_file': SimpleUploadedFile('a.mp4', data)})
+        self.assertEqual(response.status_code, 202)
+        return Video.objects.get(pk=response.json()['video']['id'])
+
+    def test_duplicate_video_shares_the_stored_file(self):
+        first = self.upload(b'same bytes')
+        second = self.upload(b'same bytes')
+
+        self.assertEqual(second.blob_id, first.blob_id)
+        self.assertEqual(second.original_video_path, first.original_video_path)
+        self.assertEqual(TranscodeJob.objects.count(), 1)
+        self.assertEqual(MediaBlob.objects.get().ref_count, 2)
+
+    def test_blob_is_released_with_its_last_video(self):
+        first = self.upload(b'same bytes')
+        second = self.upload(b'same bytes')
+
+        first.delete()
+        self.assertEqual(MediaBlob.objects.get().ref_count, 1)
+        self.assertTrue(os.path.exists(utils.media_path(second.original_video_path)))
+
+        second.delete()
+        self.assertFalse(MediaBlob.objects.exists())
+
+    def test_image_file_is_removed_with_its_last_reference(self):
+        url = store_image(SimpleUploadedFile('poster.JPG', b'image'))
+        self.assertEqual(store_image(SimpleUploadedFile('copy.jpg', b'image')), url)
+        self.assertTrue(url.endswith('.jpg'))
+
+        release_image(url)
+        self.assertTrue(os.path.exists(utils.media_path(url)))
+        self.assertEqual(MediaBlob.objects.get().ref_count, 1)
+
+        release_image(url)
+        self.assertFalse(os.path.exists(utils.media_path(url)))
+        self.assertFalse(MediaBlob.objects.exists())
+
+
+class ThumbnailTrackTests(MediaRootTestCase):
+    OPTIONS = dict(utils.DEFAULT_THUMBNAIL_OPTIONS, INTERVAL=10, COLUMNS=2, ROWS=2)
+
+    def test_vtt_maps_each_interval_to_its_tile(self):
+        for name in ('sprite_000.jpg', 'sprite_001.jpg'):
+            self.write_media(f'hls/thumbnails/{name}', b'jpeg')
+        output_dir = os.path.join(self.media_root, 'hls')
+
+        thumbnails = utils.write_thumbnails_vtt(output_dir, 45, self.OPTIONS, (160, 90))
+
+        self.assertEqual(thumbnails['vtt'], '/media/hls/thumbnails/thumbnails.vtt')
+        self.assertEqual(len(thumbnails['sprites']), 2)
+        with open(os.path.join(output_dir, 'thumbnails', 'thumbnails.vtt')) as f:
+            cues = f.read().strip().split('\n\n')
+        self.assertEqual(cues[0], 'WEBVTT')
+        self.assertEqual(cues[1:], [
+            '00:00:00.000 --> 00:00:10.000\nsprite_000.jpg#xywh=0,0,160,90',
+            '00:00:10.000 --> 00:00:20.000\nsprite_000.jpg#xywh=160,0,160,90',
+            '00:00:20.000 --> 00:00:30.000\nsprite_000.jpg#xywh=0,90,160,90',
+            '00:00:30.000 --> 00:00:40.000\nsprite_000.jpg#xywh=160,90,160,90',
+            '00:00:40.000 --> 00:00:45.000\nsprite_001.jpg#xywh=0,0,160,90',
+        ])
+
+    def test_no_track_without_sprite_sheets(self):
+        output_dir = os.path.join(self.media_root, 'hls')
+
+        self.assertEqual(utils.write_thumbnails_vtt(output_dir, 45, self.OPTIONS, (160, 90)), {})
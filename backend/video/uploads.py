@@ -0,0 +1,185 @@
+"""
+Resumable chunked uploads.
+
+Multipart uploads of multi-GB episodes are spooled to a temp file by Django,
+copied again into media/videos/video_{id}/ and restart from zero when the
+connection drops. Chunked uploads instead:
+  1. POST video/uploads/ announces the file name and size, the Video row and
+     its (empty) final file are created right away,
+  2. each PUT video/uploads/<id>/ carries `Content-Range: bytes start-end/size`
+     and is streamed from the request body into a part file, optionally
+     verified with an `X-Chunk-SHA256` header, then copied into the final
+     file at `start` under a short lock of the session row,
+  3. GET/HEAD video/uploads/<id>/ tells a reconnecting client the offset to
+     resume from,
+  4. once the chunk that completes the file is stored, the file is hashed
+     outside the lock and registered as a blob, which queues the transcode
+     job unless the same file was uploaded before.
+"""
+import hashlib
+import os
+import re
+import shutil
+import uuid
+
+from django.conf import settings
+from django.db import transaction
+from django.utils.text import get_valid_filename
+
+from video.models import Video, UploadSession
+from video.blobs import attach_video_blob
+
+READ_SIZE = 1024 * 1024
+MAX_CHUNK_SIZE = 64 * 1024 * 1024
+
+CONTENT_RANGE_RE = re.compile(r'^bytes (\d+)-(\d+)/(\d+)$')
+
+
+class UploadError(Exception):
+    """A chunk that cannot be accepted, `offset` is where the client must resume"""
+
+    def __init__(self, message, offset):
+        super().__init__(message)
+        self.offset = offset
+
+
+class OffsetMismatch(UploadError):
+    """The chunk does not start at the current offset"""
+
+
+def parse_content_range(header):
+    """Parse `bytes start-end/total` into (start, end, total), raises ValueError"""
+    match = CONTENT_RANGE_RE.match((header or '').strip())
+    if not match:
+        raise ValueError("Content-Range must look like 'bytes <start>-<end>/<total>'")
+    start, end, total = (int(group) for group in match.groups())
+    if end < start or end >= total:
+        raise ValueError("Content-Range end must be >= start and < total")
+    return start, end, total
+
+
+def file_sha256(path, read_size=READ_SIZE):
+    """Streaming SHA-256 of a file, never more than `read_size` bytes in memory"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(read_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def create_upload_session(filename, size, sha256=''):
+    """Create the Video, its empty final file and the session tracking the offset"""
+    filename = get_valid_filename(os.path.basename(filename or '')) or 'video.mp4'
+    with transaction.atomic():
+        video = Video.objects.create(original_video_path="")
+        upload_dir = os.path.join(settings.MEDIA_ROOT, f'videos/video_{video.id}')
+        os.makedirs(upload_dir, exist_ok=True)
+        file_path = os.path.join(upload_dir, filename)
+        open(file_path, 'wb').close()
+
+        video.original_video_path = file_path.replace(f"{settings.MEDIA_ROOT}/", settings.MEDIA_URL)
+        video.save(update_fields=['original_video_path'])
+        return UploadSession.objects.create(
+            video=video, filename=filename, file_path=file_path, size=size, sha256=(sha256 or '').lower()
+        )
+
+
+def append_chunk(upload_id, stream, start, end, total, chunk_sha256=None):
+    """
+    Write one chunk read from `stream` at `start` and advance the offset.
+
+    The chunk is streamed into a part file without any lock held. Only
+    moving it into place and advancing the offset happen under the session
+    row lock, so a slow client never blocks the other requests of its upload.
+    A short or corrupted chunk is dropped and the offset stays where it was.
+    Returns the session and the transcode job when this chunk completed the
+    file (None if the file was a duplicate that already has its HLS output).
+    """
+    session = UploadSession.objects.get(id=upload_id)
+    if session.status == UploadSession.Status.UPLOADING and session.offset == session.size:
+        # Every byte is stored but the request completing the file did not finish it
+        return complete_upload(session)
+    _check_chunk(session, start, end, total)
+
+    part_path = f"{session.file_path}.{uuid.uuid4().hex}.part"
+    try:
+        _receive_chunk(stream, part_path, end - start + 1, chunk_sha256, session.offset)
+        with transaction.atomic():
+            session = UploadSession.objects.select_for_update().get(id=upload_id)
+            # A concurrent retry of the same chunk may have landed meanwhile
+            _check_chunk(session, start, end, total)
+            with open(part_path, 'rb') as part, open(session.file_path, 'r+b') as f:
+                f.seek(start)
+                shutil.copyfileobj(part, f, READ_SIZE)
+                f.truncate(end + 1)
+            session.offset = end + 1
+            session.save(update_fields=['offset', 'updated_at'])
+    finally:
+        if os.path.exists(part_path):
+            os.remove(part_path)
+
+    if session.offset == session.size:
+        return complete_upload(session)
+    return session, None
+
+
+def _check_chunk(session, start, end, total):
+    if session.status != UploadSession.Status.UPLOADING:
+        raise UploadError("Upload is already complete", session.offset)
+    if total != session.size:
+        raise UploadError(f"Total size {total} does not match the announced size {session.size}", session.offset)
+    if start != session.offset:
+        raise OffsetMismatch(f"Chunk starts at {start}, expected {session.offset}", session.offset)
+    if end - start + 1 > MAX_CHUNK_SIZE:
+        raise UploadError(f"Chunks are limited to {MAX_CHUNK_SIZE} bytes", session.offset)
+
+
+def _receive_chunk(stream, part_path, length, chunk_sha256, offset):
+    """Stream `length` bytes into `part_path`, raises UploadError (resume at `offset`) for a bad chunk"""
+    digest = hashlib.sha256()
+    received = 0
+    with open(part_path, 'wb') as f:
+        while received < length:
+            block = stream.read(min(READ_SIZE, length - received))
+            if not block:
+                break
+            f.write(block)
+            digest.update(block)
+            received += len(block)
+
+    if received != length:
+        raise UploadError(f"Incomplete chunk: got {received} of {length} bytes", offset)
+    if chunk_sha256 and digest.hexdigest() != chunk_sha256.lower():
+        raise UploadError("Chunk checksum mismatch", offset)
+
+
+def complete_upload(session):
+    """
+    Verify a fully received file and register it as a blob.
+
+    The file is hashed without any lock or transaction. The session is then
+    locked again to record the result and register the blob, which queues
+    the transcode job. Returns (session, job) like append_chunk.
+    """
+    sha256 = file_sha256(session.file_path)
+    with transaction.atomic():
+        session = UploadSession.objects.select_for_update().get(id=session.id)
+        if session.status != UploadSession.Status.UPLOADING or session.offset != session.size:
+            # Another request completed (or restarted) it meanwhile
+            return session, None
+        if session.sha256 and sha256 != session.sha256:
+            # The whole file is unusable, start over
+            open(session.file_path, 'wb').close()
+            session.offset = 0
+            session.save(update_fields=['offset', 'updated_at'])
+            restarted = True
+        else:
+            session.status = UploadSession.Status.COMPLETED
+            session.sha256 = sha256
+            session.save(update_fields=['status', 'sha256', 'updated_at'])
+            job = attach_video_blob(session.video, session.file_path, sha256)
+            restarted = False
+
+    if restarted:
+        raise UploadError("File checksum mismatch, upload restarted", 0)
+    return session, job
@@ -1,6 +1,11 @@
 from django.urls import path
-from video.views import VideoUploadAPIView
+from video.views import (
+    VideoUploadAPIView, TranscodeJobStatusAPIView, ChunkedUploadCreateAPIView, ChunkedUploadAPIView
+)
 
 urlpatterns = [
     path('upload/', VideoUploadAPIView.as_view(), name='upload'),
-]
\ No newline at end of file
+    path('uploads/', ChunkedUploadCreateAPIView.as_view(), name='chunked_upload_create'),
+    path('uploads/<uuid:upload_id>/', ChunkedUploadAPIView.as_view(), name='chunked_upload'),
+    path('jobs/<int:job_id>/', TranscodeJobStatusAPIView.as_view(), name='transcode_job_status'),
+]
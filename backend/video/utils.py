@@ -1,7 +1,15 @@
+import json
+import math
 import os
+import shutil
 import subprocess
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from django.conf import settings
 
+DEMO_VIDEO_PATH = 'videos/demo/demo_video.mp4'
+
 def video_upload_path(instance, filename):
     """
     Generates a dynamic file path for uploading videos.
@@ -21,17 +29,228 @@ def video_upload_path(instance, filename):
     """
     return f"videos/video_{instance.id}/{filename}"
 
-def generate_hls(video_path, video_instance):
+
+class TranscodeError(Exception):
+    """Raised when ffmpeg exits with an error"""
+
+
+def probe_media(video_path):
+    """
+    Format and stream information of a media file from ffprobe, as parsed JSON.
+
+    Returns None when ffprobe is missing or cannot read the file.
+    """
+    try:
+        result = subprocess.run(
+            ["ffprobe", "-v", "error", "-show_format", "-show_streams", "-of", "json", video_path],
+            stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, timeout=60
+        )
+        if result.returncode != 0:
+            return None
+        return json.loads(result.stdout)
+    except (OSError, ValueError, subprocess.SubprocessError):
+        return None
+
+
+def probe_duration(video_path, probe=None):
+    """
+    Duration of a media file in seconds using ffprobe.
+
+    Returns None when ffprobe is missing or cannot read the file, callers then
+    simply don't get percentages.
+    """
+    probe = probe or probe_media(video_path)
+    try:
+        return float(probe['format']['duration'])
+    except (TypeError, KeyError, ValueError):
+        return None
+
+
+def probe_video_size(video_path, probe=None):
+    """(width, height) of the first video stream, or None"""
+    probe = probe or probe_media(video_path)
+    for stream in (probe or {}).get('streams', []):
+        if stream.get('codec_type') == 'video' and stream.get('width') and stream.get('height'):
+            return int(stream['width']), int(stream['height'])
+    return None
+
+
+def media_metadata(probe):
+    """
+    Fields stored on Video from an ffprobe result: duration (s), width, height,
+    video_codec, audio_codec and the overall bitrate (bit/s).
+
+    Values ffprobe did not report are None (numbers) or '' (codecs).
+    """
+    probe = probe or {}
+    streams = probe.get('streams', [])
+    video_stream = next((st for st in streams if st.get('codec_type') == 'video'), {})
+    audio_stream = next((st for st in streams if st.get('codec_type') == 'audio'), {})
+    try:
+        bitrate = int(probe['format']['bit_rate'])
+    except (KeyError, TypeError, ValueError):
+        bitrate = None
+    size = probe_video_size(None, probe) if probe else None
+    return {
+        'duration': probe_duration(None, probe) if probe else None,
+        'width': size[0] if size else None,
+        'height': size[1] if size else None,
+        'video_codec': video_stream.get('codec_name', ''),
+        'audio_codec': audio_stream.get('codec_name', ''),
+        'bitrate': bitrate,
+    }
+
+
+# path -> (mtime_ns, metadata) of the files probed by this process
+_file_metadata = {}
+_file_metadata_lock = threading.Lock()
+
+
+def file_metadata(path):
     """
-    Convert an uploaded MP4 video into HLS format (.m3u8 + .ts segments).
+    media_metadata() of a file that has no Video row (the demo video), probed
+    once per process and again only when the file changes. None if missing.
+    """
+    try:
+        mtime_ns = os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+    cached = _file_metadata.get(path)
+    if cached is None or cached[0] != mtime_ns:
+        # Concurrent first requests wait for one ffprobe instead of each running it
+        with _file_metadata_lock:
+            cached = _file_metadata.get(path)
+            if cached is None or cached[0] != mtime_ns:
+                cached = _file_metadata[path] = (mtime_ns, media_metadata(probe_media(path)))
+    return cached[1]
+
+
+def demo_video_metadata():
+    """Metadata of the demo video served for contents without a video"""
+    return file_metadata(os.path.join(settings.MEDIA_ROOT, DEMO_VIDEO_PATH))
+
+
+def run_ffmpeg(ffmpeg_cmd, duration=None, progress_callback=None):
+    """
+    Run an ffmpeg command, reporting progress from its `-progress` output.
 
     Parameters:
+    - ffmpeg_cmd (list): The ffmpeg command, starting with "ffmpeg".
+    - duration (float): Input duration in seconds, used to turn the encoded time into a percentage.
+    - progress_callback (callable): Called with a percentage (0-100) as encoding advances,
+      or with None when the duration is unknown.
+
+    Raises:
+    - TranscodeError: If ffmpeg exits with a non-zero code, with the end of its log.
+    """
+    cmd = [ffmpeg_cmd[0], "-y", "-nostats", "-progress", "pipe:1"] + list(ffmpeg_cmd[1:])
+
+    # stderr goes to a file so a chatty ffmpeg can never block on a full pipe
+    with tempfile.TemporaryFile(mode="w+") as log_file:
+        process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=log_file, text=True)
+        for line in process.stdout:
+            key, _, value = line.strip().partition("=")
+            # out_time_us and out_time_ms are both in microseconds
+            if key == "out_time_us" and progress_callback:
+                try:
+                    seconds = int(value) / 1_000_000
+                except ValueError:
+                    continue
+                progress_callback(min(seconds / duration * 100, 99.9) if duration else None)
+        returncode = process.wait()
+
+        if returncode != 0:
+            log_file.seek(0)
+            raise TranscodeError(log_file.read()[-2000:].strip() or f"ffmpeg exited with code {returncode}")
+
+
+def hls_output_dir(video_path, version=None):
+    """
+    HLS files live in an `hls` folder next to the source file they are made from,
+    in a `version` subfolder per transcode: a new transcode never rewrites files
+    that players and caches already have, segments are served as immutable.
+    """
+    output_dir = os.path.join(os.path.dirname(video_path), "hls")
+    return os.path.join(output_dir, version) if version else output_dir
+
+
+def remove_stale_hls_outputs(video_path, version):
+    """Delete the HLS outputs of earlier transcodes of a file, `version` is kept"""
+    output_dir = hls_output_dir(video_path)
+    try:
+        names = os.listdir(output_dir)
+    except OSError:
+        return
+    for name in names:
+        if name == version:
+            continue
+        path = os.path.join(output_dir, name)
+        if os.path.isdir(path) and not os.path.islink(path):
+            shutil.rmtree(path, ignore_errors=True)
+        else:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+
+def media_url(path):
+    """URL of a file under MEDIA_ROOT"""
+    return settings.MEDIA_URL + os.path.relpath(path, settings.MEDIA_ROOT).replace(os.sep, "/")
+
+
+def media_path(url):
+    """Absolute path of a /media/... URL"""
+    return os.path.join(settings.MEDIA_ROOT, url[len(settings.MEDIA_URL):])
+
+
+def hls_output_stats(hls_url):
+    """
+    (segment count, total bytes) of the HLS output behind a playlist URL.
+
+    The segment count is read from the media playlist, for a master playlist
+    from its first (highest) rendition. The size covers every file of the
+    output folder, all renditions included.
+    """
+    playlist_path = media_path(hls_url)
+    output_dir = os.path.dirname(playlist_path)
+    try:
+        with open(playlist_path) as f:
+            lines = [line.strip() for line in f]
+        if any(line.startswith("#EXT-X-STREAM-INF") for line in lines):
+            variant = next(line for line in lines if line and not line.startswith("#"))
+            with open(os.path.join(output_dir, variant)) as f:
+                lines = [line.strip() for line in f]
+    except (OSError, StopIteration):
+        return 0, 0
+    segment_count = sum(1 for line in lines if line.startswith("#EXTINF"))
+
+    total_bytes = 0
+    for root, _, files in os.walk(output_dir):
+        for name in files:
+            try:
+                total_bytes += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return segment_count, total_bytes
+
+
+def generate_hls(video_path, video_instance, progress_callback=None, probe=None, version=None):
+    """
+    Convert an uploaded MP4 video into HLS format (.m3u8 + .ts segments, plus seek preview sprites).
+
+    Parameters:
+    - video_path (str): Absolute path of the uploaded file.
     - video_instance (Video): The Video model instance.
+    - progress_callback (callable): Optional, called with a percentage (0-100).
+    - probe (dict): Optional ffprobe result of the file, probed again when missing.
+    - version (str): Optional output subfolder (see hls_output_dir).
 
     Returns:
-    - str: The path to the generated HLS playlist file (m3u8).
+    - tuple: (URL of the generated HLS playlist file (m3u8), thumbnails dict
+      for Video.thumbnails, {} when settings.HLS_THUMBNAILS disables them)
     """
-    output_dir = os.path.join(settings.MEDIA_ROOT, "videos", f"video_{video_instance.id}", "hls")
+    output_dir = hls_output_dir(video_path, version)
 
     os.makedirs(output_dir, exist_ok=True)  # Create directory if not exists
 
@@ -47,6 +266,250 @@ def generate_hls(video_path, video_instance):
         "-f", "hls", output_m3u8  # Output as .m3u8 playlist
     ]
 
-    subprocess.run(ffmpeg_cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)  # Run command
+    # Seek preview sprites come out of the same ffmpeg run
+    probe = probe or probe_media(video_path)
+    duration = probe_duration(video_path, probe)
+    thumbnails = thumbnail_options()
+    if thumbnails:
+        tile_size = thumbnail_tile_size(probe_video_size(video_path, probe), thumbnails['WIDTH'])
+        ffmpeg_cmd += thumbnail_output_args(output_dir, thumbnails, tile_size)
+
+    run_ffmpeg(ffmpeg_cmd, duration=duration, progress_callback=progress_callback)
+
+    thumbnails = write_thumbnails_vtt(output_dir, duration, thumbnails, tile_size) if thumbnails else {}
+    return media_url(output_m3u8), thumbnails  # Return HLS path
+
+
+# Default adaptive bitrate ladder, overridden by settings.HLS_RENDITIONS (bitrates in kbit/s)
+DEFAULT_HLS_RENDITIONS = [
+    {'name': '1080p', 'height': 1080, 'video_bitrate': 5000, 'audio_bitrate': 192},
+    {'name': '720p', 'height': 720, 'video_bitrate': 2800, 'audio_bitrate': 128},
+    {'name': '480p', 'height': 480, 'video_bitrate': 1400, 'audio_bitrate': 128},
+    {'name': '360p', 'height': 360, 'video_bitrate': 800, 'audio_bitrate': 96},
+]
+HLS_SEGMENT_SECONDS = 10
+
+
+def select_renditions(source_size, ladder=None):
+    """
+    Pick the renditions of the ladder that fit the source, without upscaling.
+
+    Widths follow the source aspect ratio (rounded to even numbers for x264).
+    A source smaller than every rung still gets the lowest one.
+    """
+    ladder = sorted(ladder or getattr(settings, 'HLS_RENDITIONS', DEFAULT_HLS_RENDITIONS),
+                    key=lambda r: r['height'], reverse=True)
+    source_width, source_height = source_size or (16, 9)
+    selected = [r for r in ladder if source_size is None or r['height'] <= source_height] or ladder[-1:]
+    renditions = []
+    for rung in selected:
+        width = int(round(source_width * rung['height'] / source_height / 2)) * 2
+        renditions.append(dict(rung, width=width))
+    return renditions
+
+
+def rendition_command(video_path, output_dir, rendition, threads=0):
+    """ffmpeg command encoding one rendition into `output_dir/index.m3u8`"""
+    video_bitrate = rendition['video_bitrate']
+    return [
+        "ffmpeg", "-i", video_path,
+        "-map", "0:v:0", "-map", "0:a:0?",
+        "-vf", f"scale=-2:{rendition['height']}",
+        "-c:v", "libx264", "-preset", "veryfast", "-profile:v", "main",
+        "-b:v", f"{video_bitrate}k", "-maxrate", f"{int(video_bitrate * 1.07)}k",
+        "-bufsize", f"{video_bitrate * 2}k",
+        # Keyframes on segment boundaries so every rendition switches at the same points
+        "-force_key_frames", f"expr:gte(t,n_forced*{HLS_SEGMENT_SECONDS})", "-sc_threshold", "0",
+        "-c:a", "aac", "-b:a", f"{rendition['audio_bitrate']}k", "-ac", "2",
+        "-threads", str(threads),
+        "-start_number", "0",
+        "-hls_time", str(HLS_SEGMENT_SECONDS),
+        "-hls_list_size", "0",
+        "-hls_playlist_type", "vod",
+        "-hls_segment_filename", os.path.join(output_dir, "segment_%05d.ts"),
+        "-f", "hls", os.path.join(output_dir, "index.m3u8")
+    ]
+
 
-    return f"{settings.MEDIA_URL}videos/video_{video_instance.id}/index.m3u8"  # Return HLS path
\ No newline at end of file
+def rendition_bandwidth(rendition):
+    """Peak bandwidth in bit/s announced in the master playlist"""
+    return int((rendition['video_bitrate'] * 1.07 + rendition['audio_bitrate']) * 1000)
+
+
+def write_master_playlist(output_dir, renditions):
+    """Write master.m3u8 pointing at every rendition playlist, highest first"""
+    lines = ["#EXTM3U", "#EXT-X-VERSION:3"]
+    for rendition in renditions:
+        lines.append(
+            f"#EXT-X-STREAM-INF:BANDWIDTH={rendition_bandwidth(rendition)},"
+            f"RESOLUTION={rendition['width']}x{rendition['height']}"
+        )
+        lines.append(f"{rendition['name']}/index.m3u8")
+    master_path = os.path.join(output_dir, "master.m3u8")
+    with open(master_path, "w") as f:
+        f.write("\n".join(lines) + "\n")
+    return master_path
+
+
+# Seek preview sprites, overridden by settings.HLS_THUMBNAILS
+DEFAULT_THUMBNAIL_OPTIONS = {
+    'ENABLED': True,
+    'INTERVAL': 10,   # seconds between two tiles
+    'WIDTH': 160,     # tile width in pixels, the height follows the aspect ratio
+    'COLUMNS': 10,
+    'ROWS': 10,       # 10x10 tiles = 1000 s of video per JPEG sheet
+}
+THUMBNAIL_DIRECTORY = "thumbnails"
+
+
+def thumbnail_options():
+    """DEFAULT_THUMBNAIL_OPTIONS updated with settings.HLS_THUMBNAILS, None when disabled"""
+    options = dict(DEFAULT_THUMBNAIL_OPTIONS, **getattr(settings, 'HLS_THUMBNAILS', {}))
+    return options if options['ENABLED'] else None
+
+
+def thumbnail_tile_size(source_size, width):
+    """(width, height) of a tile, the height rounded to an even number like the renditions"""
+    source_width, source_height = source_size or (16, 9)
+    return width, max(2, int(round(width * source_height / source_width / 2)) * 2)
+
+
+def thumbnail_output_args(output_dir, options, tile_size):
+    """
+    Extra ffmpeg output writing the sprite sheets, appended to an HLS command
+    so frames are extracted from the same decode as the segments.
+    """
+    thumbnails_dir = os.path.join(output_dir, THUMBNAIL_DIRECTORY)
+    os.makedirs(thumbnails_dir, exist_ok=True)
+    for name in os.listdir(thumbnails_dir):
+        # Sheets of a failed attempt would otherwise end up in the track
+        os.remove(os.path.join(thumbnails_dir, name))
+    width, height = tile_size
+    return [
+        "-map", "0:v:0", "-an",
+        "-vf", f"fps=1/{options['INTERVAL']},scale={width}:{height},tile={options['COLUMNS']}x{options['ROWS']}",
+        "-q:v", "5",
+        "-start_number", "0",
+        "-f", "image2", os.path.join(thumbnails_dir, "sprite_%03d.jpg")
+    ]
+
+
+def vtt_timestamp(seconds):
+    hours, rest = divmod(seconds, 3600)
+    minutes, seconds = divmod(rest, 60)
+    return f"{int(hours):02d}:{int(minutes):02d}:{seconds:06.3f}"
+
+
+def write_thumbnails_vtt(output_dir, duration, options, tile_size):
+    """
+    Write thumbnails.vtt mapping every INTERVAL of the video to its tile
+    (`sprite_000.jpg#xywh=x,y,w,h`) and return the dict stored in
+    Video.thumbnails, or {} when ffmpeg produced no sprite sheet.
+    """
+    thumbnails_dir = os.path.join(output_dir, THUMBNAIL_DIRECTORY)
+    sprites = sorted(name for name in os.listdir(thumbnails_dir) if name.endswith(".jpg")) \
+        if os.path.isdir(thumbnails_dir) else []
+    if not sprites:
+        return {}
+
+    interval, columns = options['INTERVAL'], options['COLUMNS']
+    tiles_per_sprite = columns * options['ROWS']
+    width, height = tile_size
+    tile_count = min(
+        len(sprites) * tiles_per_sprite,
+        int(math.ceil(duration / interval)) if duration else len(sprites) * tiles_per_sprite
+    )
+
+    lines = ["WEBVTT", ""]
+    for index in range(tile_count):
+        start = index * interval
+        end = min(start + interval, duration) if duration else start + interval
+        position = index % tiles_per_sprite
+        x, y = (position % columns) * width, (position // columns) * height
+        lines.append(f"{vtt_timestamp(start)} --> {vtt_timestamp(end)}")
+        lines.append(f"{sprites[index // tiles_per_sprite]}#xywh={x},{y},{width},{height}")
+        lines.append("")
+    vtt_path = os.path.join(thumbnails_dir, "thumbnails.vtt")
+    with open(vtt_path, "w") as f:
+        f.write("\n".join(lines))
+
+    base_url = media_url(thumbnails_dir)
+    return {
+        'vtt': media_url(vtt_path),
+        'sprites': [f"{base_url}/{name}" for name in sprites],
+        'interval': interval,
+        'width': width,
+        'height': height,
+        'columns': columns,
+        'rows': options['ROWS'],
+    }
+
+
+def generate_abr_hls(video_path, video_instance, progress_callback=None, probe=None, version=None):
+    """
+    Encode an uploaded video into an adaptive bitrate HLS ladder.
+
+    Each rendition is encoded by its own ffmpeg process, up to
+    settings.HLS_RENDITION_WORKERS at a time, into hls/<name>/index.m3u8;
+    hls/master.m3u8 lists them with BANDWIDTH / RESOLUTION. `probe` is the
+    ffprobe result of the file when the caller already has it, `version` the
+    output subfolder (see hls_output_dir).
+
+    The lowest rendition's ffmpeg also writes the seek preview sprites
+    (see thumbnail_output_args) unless settings.HLS_THUMBNAILS disables them.
+
+    Returns:
+    - tuple: (URL of master.m3u8, list of rendition dicts for Video.renditions,
+      thumbnails dict for Video.thumbnails)
+    """
+    output_dir = hls_output_dir(video_path, version)
+    os.makedirs(output_dir, exist_ok=True)
+
+    probe = probe or probe_media(video_path)
+    duration = probe_duration(video_path, probe)
+    source_size = probe_video_size(video_path, probe)
+    renditions = select_renditions(source_size)
+    thumbnails = thumbnail_options()
+    tile_size = thumbnail_tile_size(source_size, thumbnails['WIDTH']) if thumbnails else None
+
+    cpu_count = os.cpu_count() or 1
+    workers = max(1, min(len(renditions), getattr(settings, 'HLS_RENDITION_WORKERS', 1)))
+    threads = max(1, cpu_count // workers)
+
+    # Overall progress is the average of the renditions
+    progress = {r['name']: 0.0 for r in renditions}
+
+    def encode(rendition):
+        rendition_dir = os.path.join(output_dir, rendition['name'])
+        os.makedirs(rendition_dir, exist_ok=True)
+
+        def on_progress(percent):
+            if percent is not None:
+                progress[rendition['name']] = percent
+            if progress_callback:
+                progress_callback(sum(progress.values()) / len(progress) if duration else None)
+
+        ffmpeg_cmd = rendition_command(video_path, rendition_dir, rendition, threads)
+        if thumbnails and rendition is renditions[-1]:
+            ffmpeg_cmd += thumbnail_output_args(output_dir, thumbnails, tile_size)
+        run_ffmpeg(ffmpeg_cmd, duration=duration, progress_callback=on_progress)
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        # list() re-raises the first TranscodeError
+        list(pool.map(encode, renditions))
+
+    write_master_playlist(output_dir, renditions)
+
+    base_url = media_url(output_dir)
+    recorded = [
+        {
+            'name': r['name'],
+            'width': r['width'],
+            'height': r['height'],
+            'bandwidth': rendition_bandwidth(r),
+            'playlist': f"{base_url}/{r['name']}/index.m3u8",
+        }
+        for r in renditions
+    ]
+    thumbnails = write_thumbnails_vtt(output_dir, duration, thumbnails, tile_size) if thumbnails else {}
+    return f"{base_url}/master.m3u8", recorded, thumbnails
@@ -2,17 +2,36 @@ from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework.parsers import MultiPartParser, FormParser
 from rest_framework import status
+from django.urls import reverse
 from drf_yasg.utils import swagger_auto_schema
 from drf_yasg import openapi
-from video.serializers import VideoUploadSerializer, VideoSerializer
+from video.models import TranscodeJob, UploadSession
+from video.serializers import (
+    VideoUploadSerializer, VideoSerializer, TranscodeJobSerializer,
+    UploadSessionCreateSerializer, UploadSessionSerializer
+)
+from video.uploads import (
+    create_upload_session, append_chunk, parse_content_range, UploadError, OffsetMismatch, MAX_CHUNK_SIZE
+)
+
+def queued_video_response(request, video, job):
+    return {
+        'video': VideoSerializer(video).data,
+        'job_id': job.id,
+        'status': job.status,
+        'status_url': request.build_absolute_uri(reverse('transcode_job_status', args=[job.id]))
+    }
 
 class VideoUploadAPIView(APIView):
-    """ API View to upload an MP4 file and convert it to HLS. """
+    """ API View to upload an MP4 file and queue its conversion to HLS. """
     
     parser_classes = (MultiPartParser, FormParser)
 
     @swagger_auto_schema(
-        operation_description="Upload an MP4 video file and convert it to HLS format.",
+        operation_description=(
+            "Upload an MP4 video file. The HLS conversion is queued and runs in the transcode worker, "
+            "poll the returned status_url until the job has succeeded."
+        ),
         manual_parameters=[
             openapi.Parameter(
                 name="video_file",
@@ -22,10 +41,24 @@ class VideoUploadAPIView(APIView):
                 description="MP4 file to upload"
             )
         ],
-        responses={201: VideoSerializer(), 400: "Bad Request"}
+        responses={
+            202: openapi.Response(
+                description="Video stored, transcoding queued",
+                examples={
+                    "application/json": {
+                        "video": {"id": 12, "original_video_path": "/media/videos/video_12/movie.mp4", "hls_path": ""},
+                        "job_id": 34,
+                        "status": "queued",
+                        "status_url": "http://localhost:8000/api/v1/video/jobs/34/"
+                    }
+                }
+            ),
+            201: openapi.Response(description="Duplicate of an earlier upload, the existing HLS output is reused"),
+            400: "Bad Request"
+        }
     )
     def post(self, request, *args, **kwargs):
-        """ Handles video upload and HLS conversion. """
+        """ Handles video upload and queues the HLS conversion. """
         video_file = request.FILES.get('video_file')
         if not video_file:
             return Response({"error": "No file uploaded"}, status=status.HTTP_400_BAD_REQUEST)
@@ -34,5 +67,129 @@ class VideoUploadAPIView(APIView):
         if not serializer.is_valid():
             return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
         
-        video = serializer.save()  # Save video and trigger HLS conversion
-        return Response(VideoSerializer(video).data, status=status.HTTP_201_CREATED)
+        video = serializer.save()  # Save video and queue the HLS conversion
+        if video.transcode_job is None:
+            # Same file as an earlier upload, its HLS output is already available
+            return Response(VideoSerializer(video).data, status=status.HTTP_201_CREATED)
+        return Response(queued_video_response(request, video, video.transcode_job), status=status.HTTP_202_ACCEPTED)
+
+class TranscodeJobStatusAPIView(APIView):
+    """ API View to follow a transcoding job. """
+
+    @swagger_auto_schema(
+        operation_description="Get the state and progress (0-100) of a transcoding job.",
+        responses={200: TranscodeJobSerializer(), 404: "Job not found"}
+    )
+    def get(self, request, job_id):
+        job = TranscodeJob.objects.filter(id=job_id).first()
+        if job is None:
+            return Response({"error": "Job not found"}, status=status.HTTP_404_NOT_FOUND)
+        data = TranscodeJobSerializer(job).data
+        if job.status == TranscodeJob.Status.SUCCEEDED:
+            data['hls_path'] = job.video.hls_path
+        return Response(data, status=status.HTTP_200_OK)
+
+class ChunkedUploadCreateAPIView(APIView):
+    """ API View to start a resumable chunked upload. """
+
+    @swagger_auto_schema(
+        operation_description=(
+            "Start a resumable upload. Send the file afterwards with PUT requests to upload_url, "
+            "each one carrying `Content-Range: bytes <start>-<end>/<size>` and optionally "
+            "`X-Chunk-SHA256` (hex digest of the chunk)."
+        ),
+        request_body=UploadSessionCreateSerializer,
+        responses={201: UploadSessionSerializer(), 400: "Bad Request"}
+    )
+    def post(self, request):
+        serializer = UploadSessionCreateSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            session = create_upload_session(**serializer.validated_data)
+        except OSError as e:
+            return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+        data = UploadSessionSerializer(session).data
+        data['upload_url'] = request.build_absolute_uri(reverse('chunked_upload', args=[session.id]))
+        data['max_chunk_size'] = MAX_CHUNK_SIZE
+        response = Response(data, status=status.HTTP_201_CREATED)
+        response['Location'] = data['upload_url']
+        response['Upload-Offset'] = str(session.offset)
+        return response
+
+class ChunkedUploadAPIView(APIView):
+    """ API View to resume, append to or abort a chunked upload. """
+
+    def get_session(self, upload_id):
+        return UploadSession.objects.filter(id=upload_id).first()
+
+    @swagger_auto_schema(
+        operation_description="Current offset of an upload, the next chunk must start there.",
+        responses={200: UploadSessionSerializer(), 404: "Upload not found"}
+    )
+    def get(self, request, upload_id):
+        session = self.get_session(upload_id)
+        if session is None:
+            return Response({"error": "Upload not found"}, status=status.HTTP_404_NOT_FOUND)
+        response = Response(UploadSessionSerializer(session).data, status=status.HTTP_200_OK)
+        response['Upload-Offset'] = str(session.offset)
+        response['Upload-Length'] = str(session.size)
+        return response
+
+    @swagger_auto_schema(
+        operation_description=(
+            "Append a chunk. The raw request body is written at the start of Content-Range, which must "
+            "equal the current offset (409 with the expected offset otherwise). The chunk completing the "
+            "file queues the transcode job and answers 202."
+        ),
+        manual_parameters=[
+            openapi.Parameter('Content-Range', openapi.IN_HEADER, type=openapi.TYPE_STRING, required=True,
+                              description="bytes <start>-<end>/<size>"),
+            openapi.Parameter('X-Chunk-SHA256', openapi.IN_HEADER, type=openapi.TYPE_STRING, required=False,
+                              description="Hex SHA-256 of the chunk"),
+        ],
+        responses={200: UploadSessionSerializer(), 202: "Upload complete, transcoding queued",
+                   400: "Bad chunk", 404: "Upload not found", 409: "Offset mismatch"}
+    )
+    def put(self, request, upload_id):
+        try:
+            start, end, total = parse_content_range(request.META.get('HTTP_CONTENT_RANGE'))
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            # The body is read from the raw stream, never parsed or buffered by DRF
+            session, job = append_chunk(
+                upload_id, request.stream, start, end, total,
+                chunk_sha256=request.META.get('HTTP_X_CHUNK_SHA256')
+            )
+        except UploadSession.DoesNotExist:
+            return Response({"error": "Upload not found"}, status=status.HTTP_404_NOT_FOUND)
+        except UploadError as e:
+            code = status.HTTP_409_CONFLICT if isinstance(e, OffsetMismatch) else status.HTTP_400_BAD_REQUEST
+            response = Response({"error": str(e), "offset": e.offset}, status=code)
+            response['Upload-Offset'] = str(e.offset)
+            return response
+        except Exception as e:
+            return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+        if job is not None:
+            response = Response(queued_video_response(request, session.video, job), status=status.HTTP_202_ACCEPTED)
+        else:
+            response = Response(UploadSessionSerializer(session).data, status=status.HTTP_200_OK)
+        response['Upload-Offset'] = str(session.offset)
+        return response
+
+    @swagger_auto_schema(
+        operation_description="Abort an upload that is still in progress and delete what was received.",
+        responses={204: "Deleted", 404: "Upload not found", 409: "Upload already complete"}
+    )
+    def delete(self, request, upload_id):
+        session = self.get_session(upload_id)
+        if session is None:
+            return Response({"error": "Upload not found"}, status=status.HTTP_404_NOT_FOUND)
+        if session.status != UploadSession.Status.UPLOADING:
+            return Response({"error": "Upload already complete"}, status=status.HTTP_409_CONFLICT)
+        session.video.delete()
+        return Response(status=status.HTTP_204_NO_CONTENT)